@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import CustomUser, ChatSession, ChatMessage
+from .models import CustomUser, ChatSession, ChatMessage, Food
 # Register your models here.
 admin.site.register(CustomUser)
 admin.site.register(ChatSession)
 admin.site.register(ChatMessage)
+admin.site.register(Food)
\ No newline at end of file
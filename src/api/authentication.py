@@ -0,0 +1,58 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import replicas
+from .models import TokenUser
+
+# User fields copied into every token so hot views don't need the DB row.
+#
+# Reads trust these claims for the rest of the access token's lifetime
+# (JWT_LIFETIMES, 30 minutes on mobile by default): a user deactivated or
+# deleted meanwhile can still read until it expires, and sees the values as
+# they were at issue. Writes (unsafe methods) look the user up, so they get
+# a 401 instead.
+TOKEN_USER_CLAIMS = (
+    'email',
+    'is_premium',
+    'current_calorie_goal',
+    'current_protein_goal',
+    'current_fat_goal',
+    'current_carbs_goal',
+)
+
+
+def add_user_claims(token, user):
+    for field in TOKEN_USER_CLAIMS:
+        token[field] = getattr(user, field)
+    return token
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that builds request.user from the token's claims.
+
+    Returns a TokenUser, which only queries the database when a view reads a
+    field that is not in TOKEN_USER_CLAIMS. Tokens issued without the claims,
+    and requests with unsafe methods, use the regular database lookup, which
+    rejects deleted and inactive users.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and request.method not in SAFE_METHODS and isinstance(result[0], TokenUser):
+            return super().get_user(result[1]), result[1]
+        return result
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        replicas.identify(user_id)
+        if not all(field in validated_token for field in TOKEN_USER_CLAIMS):
+            return super().get_user(validated_token)
+        return TokenUser.from_claims(user_id, {field: validated_token[field] for field in TOKEN_USER_CLAIMS})
+
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def content_key(chunks, namespace=""):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return f"{namespace}:{digest.hexdigest()}" if namespace else digest.hexdigest()
+
+
+class ResultCache:
+    """Result cache with per-process hit/miss counters."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class LocMemResultCache(ResultCache):
+    backend = "locmem"
+
+    def __init__(self, ttl, max_entries):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoResultCache(ResultCache):
+    """Backed by a Django cache alias; eviction follows that backend's policy."""
+
+    backend = "django"
+
+    def __init__(self, ttl, alias):
+        super().__init__(ttl)
+        self.alias = alias
+
+    def _get(self, key):
+        return caches[self.alias].get(key)
+
+    def _set(self, key, value):
+        caches[self.alias].set(key, value, self.ttl)
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+_meal_cache = None
+
+
+def get_meal_cache():
+    global _meal_cache
+    if _meal_cache is None:
+        if settings.MEAL_CACHE_BACKEND == "django":
+            _meal_cache = DjangoResultCache(settings.MEAL_CACHE_TTL, settings.MEAL_CACHE_ALIAS)
+        else:
+            _meal_cache = LocMemResultCache(settings.MEAL_CACHE_TTL, settings.MEAL_CACHE_MAX_ENTRIES)
+    return _meal_cache
+
+
+def _profile_cache():
+    return caches[settings.PROFILE_CACHE_ALIAS]
+
+
+def _caches_profiles():
+    # On a database cache each get/set is its own query or three, costing more
+    # than the single user row the response is built from.
+    return not isinstance(_profile_cache(), DatabaseCache)
+
+
+def profile_version(user_id):
+    key = f"profile-version:{user_id}"
+    version = _profile_cache().get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        _profile_cache().set(key, version, settings.PROFILE_CACHE_TTL)
+    return version
+
+
+def invalidate_profile(user_id):
+    if _caches_profiles():
+        _profile_cache().delete(f"profile-version:{user_id}")
+
+
+def invalidate_profiles(user_ids):
+    if _caches_profiles():
+        _profile_cache().delete_many([f"profile-version:{user_id}" for user_id in user_ids])
+
+
+def cached_user_response(request, name, build):
+    """Serve ``build()`` for request.user from cache, with ETag / 304 support.
+
+    Entries are keyed by a per-user version that invalidate_profile() drops,
+    so a profile change makes both the cached body and old ETags stale. When
+    PROFILE_CACHE_ALIAS is a database cache nothing is stored: the body is
+    built every time and the ETag is a hash of it, which still saves the
+    bandwidth of unchanged responses.
+    """
+    user_id = request.user.pk
+    data = None
+    if _caches_profiles():
+        version = profile_version(user_id)
+    else:
+        data = build()
+        version = content_key([json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()])[:32]
+    etag = f'"{name}-{user_id}-{version}"'
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        if data is None:
+            key = f"profile-response:{name}:{user_id}:{version}"
+            data = _profile_cache().get(key)
+            if data is None:
+                data = build()
+                _profile_cache().set(key, data, settings.PROFILE_CACHE_TTL)
+        response = Response(data)
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,124 @@
+import logging
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import usage
+from .llm import completion, content
+from .models import ChatMessage
+from .serializers import RegisterSerializer
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 20
+
+
+def system_prompt(user):
+    user_data = RegisterSerializer(user).data
+    user_details = (
+        f"User details: Name: {user_data.get('first_name', '')} {user_data.get('last_name', '')}, "
+        f"Age: {user_data.get('age', '')}, Gender: {user_data.get('gender', '')}, "
+        f"Height: {user_data.get('height_cm', '')} cm, Weight: {user_data.get('weight_kg', '')} kg, "
+        f"Activity Level: {user_data.get('activity_level', '')}, "
+        f"Current Calorie Goal: {user_data.get('current_calorie_goal', '')}, "
+        f"BMR: {user_data.get('bmr', '')}, "
+        f"Macros (protein/fat/carbs): {user_data.get('current_protein_goal', '')}/"
+        f"{user_data.get('current_fat_goal', '')}/{user_data.get('current_carbs_goal', '')} grams."
+    )
+    return {
+        "role": "system",
+        "content": f"You are a helpful nutritionist, {user_details} Respond concisely and personally."
+    }
+
+
+def estimate_tokens(text):
+    # Rough heuristic (~4 characters per token) plus per-message overhead.
+    return len(text) // 4 + 4
+
+
+def _role(msg):
+    return "user" if msg.is_user else "assistant"
+
+
+def recent_window(session, budget):
+    """Return the newest messages that fit in ``budget`` tokens, oldest first.
+
+    Walks the session backwards a page at a time with a keyset query on
+    (timestamp, id) so only the rows that end up in the window are read.
+    """
+    window = []
+    used = 0
+    cursor = None
+    while True:
+        qs = ChatMessage.objects.filter(session=session)
+        if cursor:
+            qs = qs.filter(Q(timestamp__lt=cursor[0]) | Q(timestamp=cursor[0], id__lt=cursor[1]))
+        page = list(
+            qs.order_by('-timestamp', '-id').only('id', 'is_user', 'message', 'timestamp')[:PAGE_SIZE]
+        )
+        for msg in page:
+            cost = estimate_tokens(msg.message)
+            if used + cost > budget:
+                return window[::-1]
+            used += cost
+            window.append(msg)
+        if len(page) < PAGE_SIZE:
+            return window[::-1]
+        cursor = (page[-1].timestamp, page[-1].id)
+
+
+def refresh_summary(session, window_start):
+    """Fold turns older than the window into ``session.summary``.
+
+    Only runs once enough unsummarized turns have piled up, and folds at most
+    CHAT_SUMMARY_MAX_MESSAGES per call so the summarization prompt stays small.
+    """
+    qs = ChatMessage.objects.filter(session=session, timestamp__lt=window_start)
+    if session.summary_through:
+        qs = qs.filter(timestamp__gt=session.summary_through)
+    pending = list(
+        qs.order_by('timestamp', 'id').only('is_user', 'message', 'timestamp')[:settings.CHAT_SUMMARY_MAX_MESSAGES]
+    )
+    if len(pending) < settings.CHAT_SUMMARY_MIN_MESSAGES:
+        return
+
+    transcript = "\n".join(f"{_role(msg)}: {msg.message}" for msg in pending)
+    prompt = [
+        {
+            "role": "system",
+            "content": "Summarize this nutrition coaching conversation in a few sentences. "
+                       "Keep facts about the user, their goals and any advice given."
+        },
+        {
+            "role": "user",
+            "content": f"Previous summary: {session.summary or '(none)'}\n\nNew turns:\n{transcript}"
+        },
+    ]
+    try:
+        response = completion(prompt, max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS, temperature=0.2)
+        summary = content(response)
+    except Exception:
+        logger.exception("Failed to summarize chat session %s", session.pk)
+        return
+    # summaries are spent on the user's behalf, so they count against their budget
+    usage.record(session.user_id, response.get("usage"))
+
+    session.summary = summary
+    session.summary_through = pending[-1].timestamp
+    session.save(update_fields=['summary', 'summary_through'])
+
+
+def build_messages(user, session, user_input):
+    messages = [system_prompt(user)]
+    window = recent_window(session, settings.CHAT_CONTEXT_TOKEN_BUDGET)
+    if window:
+        refresh_summary(session, window[0].timestamp)
+    if session.summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {session.summary}"
+        })
+    for msg in window:
+        messages.append({"role": _role(msg), "content": msg.message})
+    messages.append({"role": "user", "content": user_input})
+    return messages
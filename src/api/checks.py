@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core import checks
+
+# Settings naming cache aliases whose contents every worker process must see.
+SHARED_CACHE_SETTINGS = (
+    'TOKEN_BLACKLIST_CACHE_ALIAS',
+    'REPLICA_PIN_CACHE_ALIAS',
+    'PROFILE_CACHE_ALIAS',
+)
+
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    if settings.DEBUG:
+        return []
+    errors = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name)
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend is None:
+            errors.append(checks.Error(f"{name} names an unknown cache alias {alias!r}.", id='api.E001'))
+        elif backend in PER_PROCESS_BACKENDS:
+            errors.append(checks.Error(
+                f"{name} uses {alias!r}, a {backend.rsplit('.', 1)[1]} that other worker processes cannot see.",
+                hint="Point CACHE_URL at Redis or the database (db://<table>).",
+                id='api.E002',
+            ))
+    return errors
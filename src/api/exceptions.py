@@ -0,0 +1,16 @@
+from django.db import IntegrityError
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from .models import CustomUser
+
+
+def exception_handler(exc, context):
+    """DRF's handler, plus a 401 for a write by a user deleted since the token was checked."""
+    if isinstance(exc, IntegrityError):
+        user = getattr(context.get('request'), 'user', None)
+        if user is not None and user.is_authenticated \
+                and not CustomUser.objects.filter(pk=user.pk, is_active=True).exists():
+            exc = AuthenticationFailed(_("User not found"), code="user_not_found")
+    return drf_exception_handler(exc, context)
@@ -0,0 +1,97 @@
+import csv
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import CalorieLog, ChatMessage
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+DATASETS = {
+    'calorie-logs': (
+        lambda user: CalorieLog.objects.filter(user=user).order_by('date'),
+        ['id', 'date', 'calories', 'protein', 'fat', 'carbs', 'notes'],
+    ),
+    'chat': (
+        lambda user: ChatMessage.objects.filter(session__user=user).order_by('session_id', 'timestamp', 'id'),
+        ['session_id', 'session__title', 'session__created_at', 'id', 'is_user', 'timestamp', 'message'],
+    ),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() just returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _column(field):
+    return field.replace('__', '_')
+
+
+def rows(user, dataset):
+    queryset, fields = DATASETS[dataset]
+    return queryset(user).values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def buffered(lines):
+    # Group rows into ~64 KB writes instead of one tiny chunk per row.
+    buf = []
+    size = 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield "".join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield "".join(buf)
+
+
+def stream_csv(user, dataset):
+    _, fields = DATASETS[dataset]
+    writer = csv.writer(Echo())
+    yield writer.writerow([_column(f) for f in fields])
+    for row in rows(user, dataset):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(user, dataset):
+    _, fields = DATASETS[dataset]
+    columns = [_column(f) for f in fields]
+    for row in rows(user, dataset):
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
+
+
+def stream(user, dataset, fmt):
+    return buffered(STREAMERS[fmt](user, dataset))
+
+
+async def astream(user, dataset, fmt):
+    """stream() for ASGI, where Django would buffer a sync iterator whole with sync_to_async(list).
+
+    Chunks are pulled one at a time on the thread that owns the database
+    cursor.
+    """
+    chunks = stream(user, dataset, fmt)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
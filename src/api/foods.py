@@ -0,0 +1,292 @@
+import bisect
+import itertools
+import re
+import threading
+import unicodedata
+import uuid
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .models import Food, FoodIndexVersion
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _word_trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams: each word is padded with two leading and one trailing space."""
+    grams = set()
+    for word in normalize(text).split():
+        grams |= _word_trigrams(word)
+    return grams
+
+
+def _csr(keys, values, size):
+    """Group ``values`` by integer ``keys`` into (offsets, values), keeping their order within a key."""
+    keys = np.frombuffer(keys, dtype=np.int32)
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=offsets[1:])
+    return offsets, np.frombuffer(values, dtype=np.int32)[order]
+
+
+class FoodIndex:
+    """In-memory prefix and fuzzy index over (id, name, brand) rows.
+
+    Prefix lookups bisect a sorted list of normalized names. Fuzzy lookups
+    expand each query word to catalogue words with a similar trigram set (or,
+    for the word being typed, words it is a prefix of), then score foods by
+    how much of the query they cover with one vectorized pass per query word
+    over the word -> food posting lists.
+    """
+
+    max_expansions = 64
+
+    def __init__(self, rows):
+        ids = array("q")
+        names = []
+        word_counts = array("i")
+        word_ids = {}
+        posting_words = array("i")
+        posting_foods = array("i")
+        for position, (food_id, name, brand) in enumerate(rows):
+            ids.append(food_id)
+            name = normalize(name)
+            names.append(name)
+            words = {word_ids.setdefault(word, len(word_ids)) for word in f"{name} {normalize(brand)}".split()}
+            word_counts.append(len(words))
+            posting_words.extend(words)
+            posting_foods.extend([position] * len(words))
+
+        self.ids = np.frombuffer(ids, dtype=np.int64)
+        self.word_counts = np.frombuffer(word_counts, dtype=np.int32)
+        self.word_ids = word_ids
+        self.word_offsets, self.word_foods = _csr(posting_words, posting_foods, len(word_ids))
+        self.word_frequency = np.diff(self.word_offsets)
+
+        gram_ids = {}
+        gram_keys = array("i")
+        gram_words = array("i")
+        gram_counts = array("i")
+        for word, word_id in word_ids.items():
+            grams = {gram_ids.setdefault(gram, len(gram_ids)) for gram in _word_trigrams(word)}
+            gram_counts.append(len(grams))
+            gram_keys.extend(grams)
+            gram_words.extend([word_id] * len(grams))
+        self.gram_ids = gram_ids
+        self.gram_counts = np.frombuffer(gram_counts, dtype=np.int32)
+        self.gram_offsets, self.gram_words = _csr(gram_keys, gram_words, len(gram_ids))
+        self.vocabulary = sorted(word_ids)
+
+        order = sorted(range(len(names)), key=names.__getitem__)
+        self.sorted_names = [names[i] for i in order]
+        self.sorted_positions = np.array(order, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prefix(self, query, limit):
+        query = normalize(query)
+        if not query:
+            return []
+        start = bisect.bisect_left(self.sorted_names, query)
+        positions = []
+        for i in range(start, min(start + limit, len(self.sorted_names))):
+            if not self.sorted_names[i].startswith(query):
+                break
+            positions.append(self.sorted_positions[i])
+        return self.ids[positions].tolist()
+
+    def expand(self, word, min_similarity, partial=False):
+        """Catalogue words similar to ``word`` as {word_id: similarity}.
+
+        Similarity is the Jaccard index of trigram sets. When ``partial`` is
+        set, words that start with ``word`` also match, scored by how much of
+        them has been typed.
+        """
+        word_grams = _word_trigrams(word)
+        grams = [self.gram_ids[gram] for gram in word_grams if gram in self.gram_ids]
+        expansions = {}
+        if grams:
+            postings = [self.gram_words[self.gram_offsets[g]:self.gram_offsets[g + 1]] for g in grams]
+            shared = np.bincount(np.concatenate(postings), minlength=len(self.word_ids))
+            candidates = np.flatnonzero(shared)
+            shared = shared[candidates]
+            similarity = shared / (len(word_grams) + self.gram_counts[candidates] - shared)
+            keep = similarity >= min_similarity
+            expansions = dict(zip(candidates[keep].tolist(), similarity[keep].tolist()))
+        if partial:
+            start = bisect.bisect_left(self.vocabulary, word)
+            for candidate in itertools.islice(self.vocabulary, start, start + 50 * self.max_expansions):
+                if not candidate.startswith(word):
+                    break
+                word_id = self.word_ids[candidate]
+                typed = 0.5 + 0.5 * len(word) / len(candidate)
+                expansions[word_id] = max(expansions.get(word_id, 0), typed)
+        if len(expansions) > self.max_expansions:
+            # Keep the closest words, breaking ties in favour of common ones.
+            ranked = sorted(expansions, key=lambda w: (-expansions[w], -self.word_frequency[w]))
+            expansions = {w: expansions[w] for w in ranked[:self.max_expansions]}
+        return expansions
+
+    def fuzzy(self, query, limit, min_similarity):
+        words = list(dict.fromkeys(normalize(query).split()))
+        if not words:
+            return []
+        score = np.zeros(len(self.ids), dtype=np.float32)
+        best = np.empty(len(self.ids), dtype=np.float32)
+        for i, word in enumerate(words):
+            expansions = self.expand(word, min_similarity, partial=i == len(words) - 1)
+            if not expansions:
+                continue
+            # Assign in ascending similarity so each food keeps its best match for this word.
+            best.fill(0)
+            for word_id, similarity in sorted(expansions.items(), key=lambda item: item[1]):
+                best[self.word_foods[self.word_offsets[word_id]:self.word_offsets[word_id + 1]]] = similarity
+            score += best
+
+        candidates = np.flatnonzero(score >= min_similarity * len(words))
+        if not len(candidates):
+            return []
+        # Most of the query covered first, then the shortest names.
+        rank = score[candidates].astype(np.float64) * 1000 - np.minimum(self.word_counts[candidates], 999)
+        if len(candidates) > limit:
+            top = np.argpartition(-rank, limit - 1)[:limit]
+            candidates, rank = candidates[top], rank[top]
+        order = np.lexsort((candidates, -rank))
+        return self.ids[candidates[order]].tolist()
+
+    def search(self, query, limit, min_similarity=0.3):
+        """Prefix matches first, then fuzzy matches, as a list of Food ids."""
+        ids = self.prefix(query, limit)
+        if len(ids) < limit:
+            seen = set(ids)
+            ids += [i for i in self.fuzzy(query, limit, min_similarity) if i not in seen][:limit - len(ids)]
+        return ids
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+_first_build_lock = threading.Lock()
+_rebuild = None
+
+
+def _current_version():
+    return FoodIndexVersion.objects.filter(pk=1).values_list("version", flat=True).first() or ""
+
+
+def invalidate_index():
+    """Make every process rebuild its index (call after loading foods).
+
+    The version is a database row, so it also reaches processes that do not
+    share a cache with the caller, such as load_foods.
+    """
+    version = uuid.uuid4().hex
+    if not FoodIndexVersion.objects.filter(pk=1).update(version=version):
+        FoodIndexVersion.objects.get_or_create(pk=1, defaults={"version": version})
+
+
+def _build(version):
+    global _index, _index_version
+    rows = Food.objects.order_by().values_list("id", "name", "brand").iterator(chunk_size=10000)
+    index = FoodIndex(rows)
+    with _index_lock:
+        _index, _index_version = index, version
+
+
+def _build_in_background(version):
+    try:
+        _build(version)
+    finally:
+        connection.close()
+
+
+def get_index():
+    """This process's index, rebuilt off the request path when the catalogue changes.
+
+    Only a process's first search builds inline. After a change, searches
+    keep using the previous index until the background rebuild swaps in.
+    """
+    global _rebuild
+    version = _current_version()
+    if _index_version == version:
+        return _index
+    if _index is None:
+        with _first_build_lock:
+            if _index is None:
+                _build(version)
+        return _index
+    with _index_lock:
+        if _rebuild is None or not _rebuild.is_alive():
+            _rebuild = threading.Thread(target=_build_in_background, args=(version,), name="food-index", daemon=True)
+            _rebuild.start()
+    return _index
+
+
+def wait_for_rebuild(timeout=None):
+    rebuild = _rebuild
+    if rebuild is not None:
+        rebuild.join(timeout)
+
+
+def reset_index():
+    """Drop this process's index; the next search builds a fresh one."""
+    global _index, _index_version
+    wait_for_rebuild()
+    with _index_lock:
+        _index = _index_version = None
+
+
+def _search_postgres(query, limit, min_similarity):
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import TrigramSimilarity
+    from django.db.models import F
+
+    prefix = list(Food.objects.filter(name__istartswith=query).order_by("name").values_list("id", flat=True)[:limit])
+    if len(prefix) >= limit:
+        return prefix
+    fuzzy = (
+        Food.objects.filter(TrigramSimilar(F("name"), query))
+        .annotate(similarity=TrigramSimilarity("name", query))
+        .filter(similarity__gte=min_similarity)
+        .exclude(id__in=prefix)
+        .order_by("-similarity", "id")
+        .values_list("id", flat=True)[:limit - len(prefix)]
+    )
+    return prefix + list(fuzzy)
+
+
+def search(query, limit=None):
+    """Foods matching ``query`` by name prefix or trigram similarity, best first."""
+    limit = limit or settings.FOOD_SEARCH_LIMIT
+    min_similarity = settings.FOOD_SEARCH_MIN_SIMILARITY
+    if settings.FOOD_SEARCH_BACKEND == "postgres":
+        ids = _search_postgres(query, limit, min_similarity)
+    else:
+        ids = get_index().search(query, limit, min_similarity)
+    foods = Food.objects.in_bulk(ids)
+    return [foods[i] for i in ids if i in foods]
+
+
+def portion(food, grams):
+    """Nutrients for ``grams`` of ``food`` (values are per 100 g)."""
+    factor = grams / 100
+    return {
+        "calories": round(food.calories * factor, 1),
+        "protein": round(food.protein * factor, 1),
+        "fat": round(food.fat * factor, 1),
+        "carbs": round(food.carbs * factor, 1),
+    }
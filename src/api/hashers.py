@@ -0,0 +1,100 @@
+"""Password hashers with settings-driven parameters, run in a bounded thread pool.
+
+The algorithm names match Django's stock hashers, so existing hashes stay
+valid. Django rehashes a password on successful login whenever its
+algorithm is not the preferred one or ``must_update`` reports stale
+parameters, so changing PASSWORD_HASHER or the ARGON2_*/SCRYPT_* settings
+upgrades users as they log in.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    thread_name_prefix='password-hash',
+                    initializer=_mark_pool_thread,
+                )
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+
+def offload(fn, *args, **kwargs):
+    """Run ``fn`` on the password-hash pool and wait for its result.
+
+    At most PASSWORD_HASH_WORKERS hashes run at once per process; a burst of
+    logins queues here instead of taking every core (and, for Argon2,
+    ARGON2_MEMORY_COST each) away from the rest of the worker.
+    """
+    if getattr(_local, 'in_pool', False):
+        return fn(*args, **kwargs)
+    return _executor().submit(fn, *args, **kwargs).result()
+
+
+class OffloadedHasherMixin:
+    def encode(self, password, salt, *args, **kwargs):
+        return offload(super().encode, password, salt, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return offload(super().verify, password, encoded)
+
+
+class Argon2PasswordHasher(OffloadedHasherMixin, hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(OffloadedHasherMixin, hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self):
+        # hashlib's default limit (32 MiB) is too small for larger work factors
+        return 256 * self.work_factor * self.block_size * self.parallelism
+
+
+class PBKDF2PasswordHasher(OffloadedHasherMixin, hashers.PBKDF2PasswordHasher):
+    pass
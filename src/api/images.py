@@ -0,0 +1,67 @@
+import base64
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+MEAL_PROMPT = "What are the estimated macros (protein, carbs, fat) in grams for this meal?"
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def prepare_image(image_file, max_dimension=1024, output_format="JPEG", quality=80):
+    """Downscale and re-encode an uploaded image for the vision model.
+
+    Pillow reads straight from the upload (its temporary file for large
+    uploads), JPEGs are downscaled while decoding via ``draft`` and the output
+    is written without EXIF or other metadata. Returns ``(bytes, mime_type)``.
+    """
+    output_format = output_format.upper()
+    if output_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    image_file.seek(0)
+    try:
+        image = Image.open(image_file)
+        image.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        # pixels are decoded lazily, here rather than in open()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(str(e)) from e
+
+    out = io.BytesIO()
+    image.save(out, format=output_format, quality=quality, optimize=True)
+    return out.getvalue(), MIME_TYPES[output_format]
+
+
+def data_url(image_bytes, mime_type):
+    return f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode()}"
+
+
+def meal_messages(image_url):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url
+                    }
+                },
+                {
+                    "type": "text",
+                    "text": MEAL_PROMPT
+                }
+            ]
+        }
+    ]
@@ -0,0 +1,179 @@
+import logging
+import os
+import random
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import get_meal_cache
+from .chat import build_messages
+from .images import meal_messages
+from . import replicas, usage
+from .llm import LLMError, LLMUnavailable, completion, content
+from .models import AiJob, ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(user, kind, payload):
+    return AiJob.objects.create(user=user, kind=kind, payload=payload, run_after=timezone.now())
+
+
+def job_status(job):
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": job.result,
+        "error": job.error or None,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# Handlers return ``(result, save)``; ``save`` writes the job's output and
+# only runs if this worker still holds the job when it finishes.
+
+def run_chat(job):
+    session = ChatSession.objects.get(id=job.payload["session_id"], user_id=job.user_id)
+    user_input = job.payload["message"]
+    response = completion(build_messages(job.user, session, user_input))
+    usage.record(job.user_id, response.get("usage"))
+    ai_reply = content(response)
+
+    def save():
+        ChatMessage.objects.create(session=session, is_user=True, message=user_input)
+        ChatMessage.objects.create(session=session, is_user=False, message=ai_reply)
+
+    return {"reply": ai_reply, "session_id": str(session.id)}, save
+
+
+def run_meal(job):
+    response = completion(meal_messages(job.payload["image_url"]), max_tokens=512)
+    usage.record(job.user_id, response.get("usage"))
+    macros = content(response)
+
+    def save():
+        if job.payload.get("cache_key"):
+            get_meal_cache().set(job.payload["cache_key"], macros)
+
+    return {"macros": macros}, save
+
+
+HANDLERS = {
+    'chat': run_chat,
+    'meal': run_meal,
+}
+
+
+def finished_payload(payload):
+    """A finished job's payload, without the uploaded image it no longer needs."""
+    return {key: value for key, value in payload.items() if key != "image_url"}
+
+
+def requeue_stale():
+    """Put back jobs whose worker died mid-run, counting the lost run as an attempt.
+
+    Jobs that have used up AI_JOB_MAX_ATTEMPTS fail instead, so a job that
+    crashes its worker every time is not retried forever.
+    """
+    now = timezone.now()
+    stale = AiJob.objects.filter(status='running', locked_at__lt=now - timedelta(seconds=settings.AI_JOB_STALE_SECONDS))
+    for job in stale.filter(attempts__gte=settings.AI_JOB_MAX_ATTEMPTS - 1).only('id', 'payload', 'locked_at'):
+        AiJob.objects.filter(pk=job.pk, status='running', locked_at=job.locked_at).update(
+            status='failed', attempts=F('attempts') + 1, error="Worker stopped while running the job.",
+            payload=finished_payload(job.payload), locked_by="", locked_at=None, finished_at=now,
+        )
+    return stale.update(status='queued', attempts=F('attempts') + 1, locked_by="", locked_at=None, run_after=now)
+
+
+def prune_finished():
+    """Delete jobs that finished more than AI_JOB_RETENTION_SECONDS ago."""
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_JOB_RETENTION_SECONDS)
+    deleted, _ = AiJob.objects.filter(status__in=('succeeded', 'failed'), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def claim(limit, worker=None):
+    """Claim up to ``limit`` due jobs.
+
+    Each claim is a conditional UPDATE on status, so it is race-free on both
+    Postgres and SQLite without SELECT ... SKIP LOCKED.
+    """
+    worker = worker or worker_id()
+    now = timezone.now()
+    candidates = AiJob.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id').values_list(
+        'id', flat=True
+    )[:limit * 2]
+    claimed = []
+    for job_id in candidates:
+        if len(claimed) == limit:
+            break
+        if AiJob.objects.filter(id=job_id, status='queued').update(status='running', locked_by=worker, locked_at=now):
+            claimed.append(job_id)
+    return claimed
+
+
+def backoff(attempts):
+    base = settings.AI_JOB_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=base + random.uniform(0, base / 2))
+
+
+def run(job_id):
+    """Run one claimed job, recording its result or scheduling a retry.
+
+    The outcome is only recorded while the job is still locked by this run:
+    if it was requeued as stale and claimed again meanwhile, the newer run
+    owns it and this one's result is dropped.
+    """
+    job = AiJob.objects.select_related('user').get(id=job_id)
+    lock = {'locked_by': job.locked_by, 'locked_at': job.locked_at}
+    job.attempts += 1
+    save = None
+    try:
+        job.result, save = HANDLERS[job.kind](job)
+    except Exception as e:
+        logger.warning("AI job %s attempt %s failed: %s", job.id, job.attempts, e)
+        job.error = str(e)
+        # A 4xx from the provider will fail the same way again
+        permanent = isinstance(e, LLMError) and not isinstance(e, LLMUnavailable)
+        if job.attempts < settings.AI_JOB_MAX_ATTEMPTS and not permanent:
+            job.status = 'queued'
+            delay = backoff(job.attempts)
+            if isinstance(e, LLMUnavailable) and e.retry_after:
+                delay = max(delay, timedelta(seconds=e.retry_after))
+            job.run_after = timezone.now() + delay
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+    else:
+        job.status = 'succeeded'
+        job.error = ""
+        job.finished_at = timezone.now()
+    if job.finished_at:
+        job.payload = finished_payload(job.payload)
+    job.locked_by = ""
+    job.locked_at = None
+
+    fields = ['status', 'result', 'error', 'attempts', 'payload', 'run_after', 'locked_by', 'locked_at', 'finished_at']
+    with transaction.atomic():
+        owned = AiJob.objects.filter(pk=job.pk, status='running', **lock).update(
+            **{field: getattr(job, field) for field in fields}
+        )
+        if owned and save is not None:
+            save()
+    if not owned:
+        logger.warning("AI job %s was taken over by another run; dropping this result", job.id)
+        job.refresh_from_db()
+    elif job.status == 'succeeded':
+        replicas.pin(job.user_id)  # the user is about to read what the job wrote
+    return job
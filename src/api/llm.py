@@ -0,0 +1,340 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_async_clients = {}
+_session = None
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """The upstream could not produce a completion."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class LLMUnavailable(LLMError):
+    """Every model is failing or has its circuit open; try again later."""
+
+
+class _Retryable(Exception):
+    def __init__(self, error, retry_after=None):
+        super().__init__(str(error))
+        self.error = error
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Per-process breaker: opens after ``failures`` consecutive failed calls.
+
+    While open, calls fail fast. After ``reset_seconds`` one trial call is
+    let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures, reset_seconds):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def abandon(self):
+        """The call was cancelled before it could tell; let another trial through."""
+        with self._lock:
+            self.trial_running = False
+
+
+def breaker(model):
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(settings.LLM_CIRCUIT_FAILURES, settings.LLM_CIRCUIT_RESET_SECONDS)
+        return _breakers[model]
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def _models(model=None):
+    primary = model or settings.TOGETHER_MODEL
+    return [primary, *(m for m in settings.TOGETHER_FALLBACK_MODELS if m != primary)]
+
+
+def _backoff(attempt, retry_after=None):
+    """Full-jitter exponential backoff, honouring a Retry-After hint up to the cap."""
+    cap = settings.LLM_RETRY_MAX_BACKOFF
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, settings.LLM_RETRY_BACKOFF * 2 ** attempt))
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {settings.TOGETHER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def _timeout():
+    return httpx.Timeout(
+        settings.LLM_READ_TIMEOUT,
+        connect=settings.LLM_CONNECT_TIMEOUT,
+    )
+
+
+def _payload(model, messages, max_tokens, temperature, **extra):
+    return {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        **extra,
+    }
+
+
+def _unavailable(models, last_error):
+    retry_after = min((breaker(m).retry_after() for m in models), default=None)
+    detail = f": {last_error}" if last_error else ": circuit open"
+    return LLMUnavailable(f"LLM unavailable{detail}", status_code=503, retry_after=retry_after or None)
+
+
+def get_session():
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
+def _post(data):
+    try:
+        res = get_session().post(
+            settings.TOGETHER_API_URL,
+            json=data,
+            headers=_headers(),
+            timeout=(settings.LLM_CONNECT_TIMEOUT, settings.LLM_READ_TIMEOUT),
+        )
+    except requests.RequestException as e:
+        raise _Retryable(e)
+    if res.status_code in RETRY_STATUSES:
+        raise _Retryable(f"AI error {res.status_code}: {res.text[:200]}", _retry_after(res.headers))
+    if res.status_code != 200:
+        raise LLMError(f"AI error {res.status_code}: {res.text[:200]}", status_code=res.status_code)
+    try:
+        return res.json()
+    except ValueError as e:
+        raise _Retryable(e)
+
+
+def completion(messages, max_tokens=1024, temperature=0.5, model=None):
+    """The full chat completion response, including its ``usage`` block.
+
+    Retries 429/5xx, transport errors and malformed bodies with jittered backoff,
+    then moves on to the next model in TOGETHER_FALLBACK_MODELS. Models
+    whose circuit is open are skipped. Other 4xx responses raise LLMError
+    right away; LLMUnavailable means no model could answer.
+    """
+    models = _models(model)
+    last_error = None
+    for name in models:
+        circuit = breaker(name)
+        if not circuit.allow():
+            metrics.inc('llm_circuit_open_total', model=name)
+            continue
+        data = _payload(name, messages, max_tokens, temperature)
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                response = _post(data)
+            except _Retryable as e:
+                metrics.record_llm(name, time.perf_counter() - start, "error")
+                last_error = e
+                if attempt < settings.LLM_MAX_RETRIES:
+                    time.sleep(_backoff(attempt, e.retry_after))
+                continue
+            except LLMError:
+                metrics.record_llm(name, time.perf_counter() - start, "rejected")
+                circuit.success()  # the provider answered; the request was bad
+                raise
+            except Exception:
+                # still settle a half-open trial, or the circuit never closes again
+                metrics.record_llm(name, time.perf_counter() - start, "error")
+                circuit.failure()
+                raise
+            metrics.record_llm(name, time.perf_counter() - start, "ok", response.get("usage"))
+            circuit.success()
+            return response
+        circuit.failure()
+        logger.warning("LLM model %s failed after %d attempts: %s", name, settings.LLM_MAX_RETRIES + 1, last_error)
+    raise _unavailable(models, last_error)
+
+
+def content(response):
+    return response["choices"][0]["message"]["content"]
+
+
+def chat_completion(messages, max_tokens=1024, temperature=0.5):
+    return content(completion(messages, max_tokens=max_tokens, temperature=temperature))
+
+
+def get_async_client():
+    # httpx.AsyncClient is bound to the event loop it first runs on, so keep
+    # one pooled client per loop (one per worker under uvicorn).
+    loop = asyncio.get_running_loop()
+    for stale in [l for l in _async_clients if l.is_closed()]:
+        del _async_clients[stale]
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=_timeout(),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_clients():
+    while _async_clients:
+        _, client = _async_clients.popitem()
+        await client.aclose()
+
+
+async def stream_chat_completion(messages, max_tokens=1024, temperature=0.5, on_usage=None, model=None):
+    """Yield content deltas from a streamed chat completion.
+
+    Retries, fallback and the circuit breaker apply until the first byte of
+    the stream arrives; after that an error is raised to the caller, since
+    the tokens already yielded cannot be taken back. ``on_usage`` is called
+    with the ``usage`` block if the stream reports one.
+    """
+    client = get_async_client()
+    models = _models(model)
+    last_error = None
+    for name in models:
+        circuit = breaker(name)
+        if not circuit.allow():
+            metrics.inc('llm_circuit_open_total', model=name)
+            continue
+        data = _payload(name, messages, max_tokens, temperature, stream=True, stream_options={"include_usage": True})
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            started = False
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                async with client.stream("POST", settings.TOGETHER_API_URL, json=data, headers=_headers()) as res:
+                    if res.status_code != 200:
+                        body = (await res.aread()).decode(errors="replace")[:200]
+                        error = f"AI error {res.status_code}: {body}"
+                        if res.status_code not in RETRY_STATUSES:
+                            metrics.record_llm(name, time.perf_counter() - start, "rejected")
+                            circuit.success()
+                            raise LLMError(error, status_code=res.status_code)
+                        metrics.record_llm(name, time.perf_counter() - start, "error")
+                        last_error, retry_after = error, _retry_after(res.headers)
+                    else:
+                        circuit.success()
+                        started = True
+                        reported = None
+                        async for line in res.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            chunk = line[len("data:"):].strip()
+                            if chunk == "[DONE]":
+                                break
+                            event = json.loads(chunk)
+                            if event.get("usage"):
+                                reported = event["usage"]
+                                if on_usage is not None:
+                                    on_usage(reported)
+                            choices = event.get("choices") or []
+                            if not choices:
+                                continue
+                            delta = (choices[0].get("delta") or {}).get("content")
+                            if delta:
+                                yield delta
+                        metrics.record_llm(name, time.perf_counter() - start, "ok", reported)
+                        return
+            except httpx.HTTPError as e:
+                metrics.record_llm(name, time.perf_counter() - start, "error")
+                if started:
+                    raise LLMError(f"AI stream interrupted: {e}") from e
+                last_error = e
+            except LLMError:
+                raise
+            except Exception:
+                if not started:
+                    metrics.record_llm(name, time.perf_counter() - start, "error")
+                    circuit.failure()
+                raise
+            except BaseException:
+                if not started:
+                    circuit.abandon()  # cancelled mid-trial
+                raise
+            if attempt < settings.LLM_MAX_RETRIES:
+                await asyncio.sleep(_backoff(attempt, retry_after))
+        circuit.failure()
+        logger.warning("LLM model %s failed after %d attempts: %s", name, settings.LLM_MAX_RETRIES + 1, last_error)
+    raise _unavailable(models, last_error)
@@ -0,0 +1,119 @@
+import csv
+import gzip
+import hashlib
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.foods import invalidate_index
+from api.models import Food
+
+# Column names per input format. "off" is the Open Food Facts CSV export
+# (tab separated, nutrients per 100 g); "simple" is a comma separated file
+# with name,brand,calories,protein,fat,carbs[,serving_g][,external_id].
+FORMATS = {
+    'off': {
+        'delimiter': '\t',
+        'source': 'off',
+        'columns': {
+            'external_id': 'code',
+            'name': 'product_name',
+            'brand': 'brands',
+            'calories': 'energy-kcal_100g',
+            'protein': 'proteins_100g',
+            'fat': 'fat_100g',
+            'carbs': 'carbohydrates_100g',
+            'serving_g': 'serving_quantity',
+        },
+    },
+    'simple': {
+        'delimiter': ',',
+        'source': 'custom',
+        'columns': {field: field for field in (
+            'external_id', 'name', 'brand', 'calories', 'protein', 'fat', 'carbs', 'serving_g'
+        )},
+    },
+}
+
+UPDATE_FIELDS = ['name', 'brand', 'calories', 'protein', 'fat', 'carbs', 'serving_g']
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number >= 0 else None
+
+
+def parse_row(row, columns, source):
+    """Return a Food for a CSV row, or None when it lacks a name or calories."""
+    value = {field: (row.get(column) or '').strip() for field, column in columns.items()}
+    calories = _number(value['calories'])
+    if not value['name'] or calories is None or calories > 1000:
+        return None
+    brand = value['brand'].split(',')[0].strip()[:255]
+    external_id = value['external_id'][:64] or hashlib.sha1(
+        f"{value['name']}|{brand}".lower().encode()
+    ).hexdigest()
+    return Food(
+        name=value['name'][:255],
+        brand=brand,
+        source=source,
+        external_id=external_id,
+        calories=calories,
+        protein=_number(value['protein']) or 0,
+        fat=_number(value['fat']) or 0,
+        carbs=_number(value['carbs']) or 0,
+        serving_g=_number(value['serving_g']) or None,
+    )
+
+
+class Command(BaseCommand):
+    help = "Load or refresh the food catalogue from a CSV/TSV file (optionally gzipped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='off')
+        parser.add_argument('--source', help="Override the source label stored with each food.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, path, format='off', source=None, batch_size=5000, **options):
+        spec = FORMATS[format]
+        source = source or spec['source']
+        csv.field_size_limit(sys.maxsize)
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            handle = opener(path, 'rt', encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        loaded = skipped = 0
+        batch = {}
+        with handle:
+            for row in csv.DictReader(handle, delimiter=spec['delimiter']):
+                food = parse_row(row, spec['columns'], source)
+                if food is None:
+                    skipped += 1
+                    continue
+                # Later rows win; duplicates within one INSERT would conflict with themselves.
+                batch[food.external_id] = food
+                if len(batch) >= batch_size:
+                    loaded += self._flush(batch)
+            loaded += self._flush(batch)
+
+        invalidate_index()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} foods ({skipped} rows skipped)."))
+
+    def _flush(self, batch):
+        count = len(batch)
+        if count:
+            Food.objects.bulk_create(
+                list(batch.values()),
+                update_conflicts=True,
+                unique_fields=['source', 'external_id'],
+                update_fields=UPDATE_FIELDS,
+            )
+            self.stdout.write(f"Loaded batch of {count} foods...")
+            batch.clear()
+        return count
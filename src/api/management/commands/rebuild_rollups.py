@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the weekly/monthly NutritionRollup tables from CalorieLog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only rebuild this user id (repeatable).")
+
+    def handle(self, *args, user_ids=None, **options):
+        written = rollups.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup rows."))
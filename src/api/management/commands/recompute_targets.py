@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import nutrition
+from api.cache import invalidate_profiles
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Recompute BMR, calorie and macro targets for every user with complete profile inputs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, chunk_size=5000, **options):
+        fields = ['id', *nutrition.INPUT_FIELDS, 'calorie_goal_type']
+        users = CustomUser.objects.filter(
+            age__isnull=False, height_cm__isnull=False, weight_kg__isnull=False
+        ).only(*fields).order_by('id')
+
+        updated = 0
+        last_id = 0
+        while True:
+            chunk = list(users.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            targets = nutrition.batch_targets_for_users(chunk)
+            for i, user in enumerate(chunk):
+                values = {field: float(targets[field][i]) for field in nutrition.TARGET_FIELDS}
+                values.update(nutrition.current_targets(values, user.calorie_goal_type or 'maintain'))
+                for field, value in values.items():
+                    setattr(user, field, value)
+
+            with transaction.atomic():
+                CustomUser.objects.bulk_update(chunk, [*nutrition.TARGET_FIELDS, *nutrition.CURRENT_FIELDS])
+            invalidate_profiles(user.id for user in chunk)
+            updated += len(chunk)
+            self.stdout.write(f"Recomputed {updated} users...")
+
+        self.stdout.write(self.style.SUCCESS(f"Recomputed targets for {updated} users."))
@@ -0,0 +1,65 @@
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import jobs, metrics
+
+PRUNE_INTERVAL = 60
+
+
+def _run(job_id):
+    close_old_connections()
+    try:
+        return jobs.run(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Process queued AI jobs (chat replies, meal analysis) with a thread pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.AI_WORKER_CONCURRENCY)
+        parser.add_argument('--poll-interval', type=float, default=settings.AI_WORKER_POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true', help="Drain the currently due jobs and exit.")
+
+    def handle(self, *args, concurrency, poll_interval, once=False, **options):
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        worker = jobs.worker_id()
+        self.stdout.write(f"AI worker {worker} running with concurrency {concurrency}")
+        running = set()
+        pruned_at = None
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while not stop.is_set():
+                jobs.requeue_stale()
+                if pruned_at is None or time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                    jobs.prune_finished()
+                    pruned_at = time.monotonic()
+                free = concurrency - len(running)
+                claimed = jobs.claim(free, worker) if free else []
+                running.update(pool.submit(_run, job_id) for job_id in claimed)
+
+                if once and not running:
+                    break
+                if running:
+                    done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    running = set(running)
+                    for future in done:
+                        try:
+                            job = future.result()
+                        except Exception as e:
+                            self.stderr.write(f"Job crashed: {e}")
+                        else:
+                            self.stdout.write(f"Job {job.id} ({job.kind}): {job.status}")
+                elif not claimed:
+                    stop.wait(poll_interval)
+                metrics.maybe_flush()
+            wait(running)
@@ -0,0 +1,113 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api import nutrition, rollups
+from api.meals import TOTAL_FIELDS
+from api.models import CalorieLog, ChatMessage, ChatSession, CustomUser, MealEntry
+
+MEALS = [('breakfast', 0.25), ('lunch', 0.35), ('dinner', 0.3), ('snack', 0.1)]
+QUESTIONS = [
+    "How much protein should I eat after a workout?",
+    "Is it fine to skip breakfast when cutting?",
+    "What is a good high fibre snack?",
+    "How many calories are in a banana?",
+    "Can you suggest a vegetarian dinner with 40g protein?",
+]
+
+
+class Command(BaseCommand):
+    help = "Create load-test users with calorie logs, meal entries and chat history (see benchmarks/load_test.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--days', type=int, default=90, help="Days of history per user.")
+        parser.add_argument('--log-rate', type=float, default=0.85, help="Share of days with a log.")
+        parser.add_argument('--sessions', type=int, default=5, help="Chat sessions per user.")
+        parser.add_argument('--messages', type=int, default=20, help="Messages per chat session.")
+        parser.add_argument('--prefix', default='loadtest')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--premium', action='store_true', help="Seed premium users (higher AI rate limits).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help="Delete users from an earlier run with this prefix first.")
+
+    def handle(self, *args, users, days, log_rate, sessions, messages, prefix, password, premium, seed, clear,
+               **options):
+        rng = random.Random(seed)
+        if clear:
+            deleted, _ = CustomUser.objects.filter(email__startswith=f"{prefix}-").delete()
+            self.stdout.write(f"Deleted {deleted} rows from an earlier run.")
+
+        # Hash once: every seeded user shares the password, and hashing is the slow part
+        hashed = make_password(password)
+        today = timezone.localdate()
+        with transaction.atomic():
+            created = CustomUser.objects.bulk_create(
+                self.user(prefix, i, hashed, premium, rng) for i in range(users)
+            )
+            for user in created:
+                self.seed_logs(user, today, days, log_rate, rng)
+                self.seed_chats(user, sessions, messages, rng)
+        written = rollups.rebuild([user.pk for user in created])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(created)} users ({prefix}-N@example.com / {password}) "
+            f"and {written} rollup rows."
+        ))
+
+    @staticmethod
+    def user(prefix, i, hashed, premium, rng):
+        user = CustomUser(
+            username=f"{prefix}-{i}", email=f"{prefix}-{i}@example.com", password=hashed, is_premium=premium,
+            first_name="Load", last_name=f"Test {i}", age=rng.randint(18, 70),
+            gender=rng.choice(['male', 'female']), height_cm=rng.uniform(155, 195), weight_kg=rng.uniform(50, 110),
+            activity_level=rng.choice(['sedentary', 'light', 'moderate', 'active']),
+        )
+        nutrition.apply_targets(user, rng.choice(['maintain', 'gain', 'lose']))
+        return user
+
+    @staticmethod
+    def seed_logs(user, today, days, log_rate, rng):
+        logs, entries = [], []
+        for offset in range(days):
+            if rng.random() > log_rate:
+                continue
+            target = user.current_calorie_goal or 2200
+            day = []
+            for meal, share in MEALS:
+                calories = max(int(rng.gauss(target * share, target * share * 0.3)), 20)
+                day.append(MealEntry(
+                    meal=meal, name=meal.title(), calories=calories, protein=round(calories * 0.25 / 4, 1),
+                    fat=round(calories * 0.3 / 9, 1), carbs=round(calories * 0.45 / 4, 1),
+                ))
+            # a day's log holds the totals of its entries, as api/meals.py maintains them
+            logs.append(CalorieLog(
+                user=user, date=today - timedelta(days=offset), calorie_goal=user.current_calorie_goal,
+                **{field: round(sum(getattr(entry, field) for entry in day), 1) for field in TOTAL_FIELDS},
+            ))
+            entries.append(day)
+        CalorieLog.objects.bulk_create(logs)
+        for log, day in zip(logs, entries):
+            for entry in day:
+                entry.log = log
+        MealEntry.objects.bulk_create((entry for day in entries for entry in day), batch_size=2000)
+
+    @staticmethod
+    def seed_chats(user, sessions, messages, rng):
+        created = ChatSession.objects.bulk_create(
+            ChatSession(user=user, title=rng.choice(QUESTIONS)) for _ in range(sessions)
+        )
+        ChatMessage.objects.bulk_create(
+            (
+                ChatMessage(
+                    session=session, is_user=i % 2 == 0,
+                    message=rng.choice(QUESTIONS) if i % 2 == 0 else "Here is some advice. " * rng.randint(5, 40),
+                )
+                for session in created for i in range(messages)
+            ),
+            batch_size=2000,
+        )
@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, Round
+
+from . import rollups
+from .models import CalorieLog, MealEntry
+
+TOTAL_FIELDS = ('calories', 'protein', 'fat', 'carbs')
+
+# Name of the single entry standing in for a day logged as totals only.
+DAY_TOTAL_NAME = 'Daily total'
+
+
+def entry_values(entry):
+    return {field: getattr(entry, field) or 0 for field in TOTAL_FIELDS}
+
+
+def apply_delta(log_id, delta):
+    """Add ``delta`` to a log's totals with one atomic UPDATE and roll it up.
+
+    The UPDATE increments in the database, so concurrent entries for the same
+    day from different devices all land without re-summing the day.
+    """
+    if not any(delta.values()):
+        return
+    with transaction.atomic():
+        CalorieLog.objects.filter(pk=log_id).update(
+            calories=F('calories') + delta['calories'],
+            **{field: Round(Coalesce(F(field), 0.0) + delta[field], 1) for field in TOTAL_FIELDS[1:]},
+        )
+        # The UPDATE holds the row lock until commit, so this read is our own result.
+        log = CalorieLog.objects.filter(pk=log_id).values('user_id', 'date', 'calorie_goal', *TOTAL_FIELDS).get()
+        user_id = log.pop('user_id')
+        old = {**log, **{field: log[field] - delta[field] for field in TOTAL_FIELDS}}
+        rollups.record_change(user_id, old, log)
+
+
+def _negate(values):
+    return {field: -value for field, value in values.items()}
+
+
+def _day_log(user_id, day):
+    log, _ = CalorieLog.objects.get_or_create(user_id=user_id, date=day, defaults={'calories': 0})
+    return log
+
+
+def _drop_if_empty(log_id):
+    # a day whose last entry went is no longer logged; the delete signal takes it out of the rollups
+    if not MealEntry.objects.filter(log_id=log_id).exists():
+        CalorieLog.objects.filter(pk=log_id).delete()
+
+
+def add_entry(user, day, values):
+    with transaction.atomic():
+        entry = MealEntry.objects.create(log=_day_log(user.pk, day), **values)
+        apply_delta(entry.log_id, entry_values(entry))
+    return entry
+
+
+def update_entry(entry, values, day=None):
+    """Change an entry (moving it to ``day`` if given) and shift the totals by the difference."""
+    with transaction.atomic():
+        entry = MealEntry.objects.select_for_update(of=('self',)).select_related('log').get(pk=entry.pk)
+        old_log_id, old_values = entry.log_id, entry_values(entry)
+        for field, value in values.items():
+            setattr(entry, field, value)
+        if day is not None and day != entry.log.date:
+            entry.log = _day_log(entry.log.user_id, day)
+        entry.save()
+
+        new_values = entry_values(entry)
+        if entry.log_id == old_log_id:
+            apply_delta(entry.log_id, {field: new_values[field] - old_values[field] for field in TOTAL_FIELDS})
+        else:
+            apply_delta(old_log_id, _negate(old_values))
+            apply_delta(entry.log_id, new_values)
+            _drop_if_empty(old_log_id)
+    return entry
+
+
+def delete_entry(entry):
+    with transaction.atomic():
+        entry = MealEntry.objects.select_for_update().filter(pk=entry.pk).first()
+        if entry is None:
+            return
+        values = entry_values(entry)
+        entry.delete()
+        apply_delta(entry.log_id, _negate(values))
+        _drop_if_empty(entry.log_id)
+
+
+def itemized_days(user_id, days):
+    """The days among ``days`` whose log has meal entries rather than just a day total."""
+    return set(
+        MealEntry.objects.filter(log__user_id=user_id, log__date__in=list(days))
+        .exclude(name=DAY_TOTAL_NAME).values_list('log__date', flat=True)
+    )
+
+
+def reset_entries(logs):
+    """Replace the entries of logs written as day totals with one DAY_TOTAL_NAME entry each.
+
+    ``logs`` are dicts (or objects) with ``id`` and the total fields.
+    """
+    logs = [log if isinstance(log, dict) else {'id': log.pk, **entry_values(log)} for log in logs]
+    MealEntry.objects.filter(log_id__in=[log['id'] for log in logs]).delete()
+    MealEntry.objects.bulk_create(
+        [
+            MealEntry(log_id=log['id'], name=DAY_TOTAL_NAME, **{f: log[f] or 0 for f in TOTAL_FIELDS})
+            for log in logs
+        ],
+        batch_size=500,
+    )
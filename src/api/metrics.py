@@ -0,0 +1,321 @@
+"""Prometheus-format metrics without a client library.
+
+Every thread records into its own shard of plain dicts, so the hot path
+takes no locks. With METRICS_DIR set, each process writes its totals to
+METRICS_DIR/<pid>.json at most every METRICS_FLUSH_INTERVAL seconds and
+/metrics sums all of the files, so scraping any gunicorn worker reports the
+whole server. Clear METRICS_DIR when the server (not a worker) restarts.
+"""
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    'http_requests_total': ('counter', "Requests by route, method and status.", None),
+    'http_request_duration_seconds': (
+        'histogram', "Time until the response is returned (time to first byte for streams).", LATENCY_BUCKETS),
+    'http_request_db_queries': ('histogram', "Database queries per request.", QUERY_BUCKETS),
+    'http_request_db_duration_seconds': ('histogram', "Database time per request.", LATENCY_BUCKETS),
+    'http_request_size_bytes': ('histogram', "Request body size.", SIZE_BUCKETS),
+    'http_response_size_bytes': ('histogram', "Response body size, streaming responses excluded.", SIZE_BUCKETS),
+    'llm_request_duration_seconds': ('histogram', "Upstream LLM call latency per attempt.", LATENCY_BUCKETS),
+    'llm_tokens_total': ('counter', "Upstream LLM tokens by kind.", None),
+    'llm_circuit_open_total': ('counter', "Upstream calls skipped because the model's circuit was open.", None),
+}
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_last_flush = time.monotonic()
+_request = contextvars.ContextVar('metrics_request', default=None)
+
+
+def _reset_after_fork():
+    # A forked worker must not report its parent's totals again
+    global _local, _shards, _shards_lock, _last_flush
+    _local = threading.local()
+    _shards = []
+    _shards_lock = threading.Lock()
+    _last_flush = time.monotonic()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = ({}, {})
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+def inc(name, value=1, **labels):
+    counters = _shard()[0]
+    key = (name, tuple(sorted(labels.items())))
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    histograms = _shard()[1]
+    key = (name, tuple(sorted(labels.items())))
+    buckets = METRICS[name][2]
+    counts = histograms.get(key)
+    if counts is None:
+        # one count per bucket plus +Inf, then sum and count
+        counts = histograms[key] = [0] * (len(buckets) + 3)
+    counts[bisect.bisect_left(buckets, value)] += 1
+    counts[-2] += value
+    counts[-1] += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _label_string(labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+
+
+def snapshot():
+    """This process's totals: {"counters": {name: {labels: value}}, "histograms": {name: {labels: counts}}}."""
+    counters = defaultdict(lambda: defaultdict(float))
+    histograms = defaultdict(dict)
+    with _shards_lock:
+        shards = list(_shards)
+    for shard_counters, shard_histograms in shards:
+        for (name, labels), value in list(shard_counters.items()):
+            counters[name][_label_string(labels)] += value
+        for (name, labels), counts in list(shard_histograms.items()):
+            merged = histograms[name].setdefault(_label_string(labels), [0] * len(counts))
+            for i, count in enumerate(list(counts)):
+                merged[i] += count
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _merge(into, other):
+    for name, series in other['counters'].items():
+        target = into['counters'][name]
+        for labels, value in series.items():
+            target[labels] += value
+    for name, series in other['histograms'].items():
+        target = into['histograms'][name]
+        for labels, counts in series.items():
+            merged = target.setdefault(labels, [0] * len(counts))
+            for i, count in enumerate(counts):
+                merged[i] += count
+
+
+def _path():
+    return os.path.join(settings.METRICS_DIR, f"{os.getpid()}.json")
+
+
+def flush():
+    """Write this process's totals to METRICS_DIR for the other workers to read."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not settings.METRICS_DIR:
+        return
+    path = _path()
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+
+def maybe_flush():
+    if settings.METRICS_DIR and time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+def collect():
+    """Totals across all processes sharing METRICS_DIR, or just this one."""
+    totals = snapshot()
+    if not settings.METRICS_DIR:
+        return totals
+    own = os.path.basename(_path())
+    for name in os.listdir(settings.METRICS_DIR):
+        if not name.endswith('.json') or name == own:
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, name)) as f:
+                _merge(totals, json.load(f))
+        except (OSError, ValueError):
+            continue  # replaced or removed while we read it
+    return totals
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(totals=None):
+    """Prometheus text exposition format (version 0.0.4)."""
+    totals = totals or collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = totals['counters' if kind == 'counter' else 'histograms'].get(name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series.items()):
+            if kind == 'counter':
+                lines.append(f"{name}{{{labels}}} {_number(value)}")
+                continue
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {_number(cumulative)}')
+            lines.append(f"{name}_sum{{{labels}}} {_number(value[-2])}")
+            lines.append(f"{name}_count{{{labels}}} {_number(value[-1])}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """/metrics, for scrapers presenting ``Authorization: Bearer <METRICS_TOKEN>``.
+
+    Disabled while METRICS_TOKEN is unset.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not constant_time_compare(supplied, settings.METRICS_TOKEN):
+        return HttpResponse(status=401)
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    # router URLs are regexes; drop the anchor so they read like path() routes
+    return match.route.rstrip('$') if match else "unmatched"
+
+
+class RequestStats:
+    __slots__ = ('request', 'queries', 'db_seconds', 'done', 'sent')
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.done = False  # view returned; stop counting queries
+        self.sent = False  # response fully sent, streams included
+
+    def mark_sent(self):
+        self.sent = True
+
+
+def current_route():
+    """URL route of the request being served, or "background" outside one."""
+    stats = _request.get()
+    if stats is None or stats.sent:
+        return "background"
+    return _route(stats.request)
+
+
+def timed_query(execute, sql, params, many, context):
+    """Database execute wrapper counting queries and their time against the current request."""
+    stats = _request.get()
+    if stats is None or stats.done:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - start
+        stats.queries += 1
+
+
+def record_llm(model, seconds, outcome, usage=None):
+    route = current_route()
+    observe('llm_request_duration_seconds', seconds, model=model, outcome=outcome, route=route)
+    if usage:
+        for kind in ('prompt', 'completion'):
+            tokens = usage.get(f'{kind}_tokens')
+            if tokens:
+                inc('llm_tokens_total', tokens, model=model, kind=kind, route=route)
+
+
+class MetricsMiddleware:
+    """Per-request latency, status, DB query count/time and payload sizes.
+
+    Under ASGI the request stays current while its response is sent, so
+    LLM calls made while a reply streams are still attributed to its route.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(request)
+        token = _request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self._record(stats, response, time.perf_counter() - start)
+        finally:
+            _request.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats(request)
+        _request.set(stats)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(stats, response, time.perf_counter() - start)
+        return response
+
+    def _record(self, stats, response, seconds):
+        stats.done = True
+        if response.streaming:
+            response._resource_closers.append(stats.mark_sent)
+        else:
+            stats.mark_sent()
+        request = stats.request
+        route = _route(request)
+        method = request.method if request.method in METHODS else "other"
+
+        inc('http_requests_total', route=route, method=method, status=response.status_code)
+        observe('http_request_duration_seconds', seconds, route=route, method=method)
+        observe('http_request_db_queries', stats.queries, route=route)
+        observe('http_request_db_duration_seconds', stats.db_seconds, route=route)
+        request_size = request.META.get('CONTENT_LENGTH', '')
+        if request_size.isdigit():
+            observe('http_request_size_bytes', int(request_size), route=route)
+        if not response.streaming:
+            observe('http_response_size_bytes', len(response.content), route=route)
+        maybe_flush()
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_calorie_goals(apps, schema_editor):
+    CalorieLog = apps.get_model('api', 'CalorieLog')
+    CustomUser = apps.get_model('api', 'CustomUser')
+    CalorieLog.objects.filter(calorie_goal__isnull=True).update(
+        calorie_goal=Subquery(CustomUser.objects.filter(pk=OuterRef('user_id')).values('current_calorie_goal')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_chatsession_summary_chatmessage_session_ts_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calorielog',
+            name='calorie_goal',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='NutritionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('days_logged', models.PositiveIntegerField(default=0)),
+                ('calories', models.FloatField(default=0)),
+                ('protein', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('days_with_goal', models.PositiveIntegerField(default=0)),
+                ('days_on_goal', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nutrition_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'period', 'period_start')},
+            },
+        ),
+        migrations.RunPython(snapshot_calorie_goals, migrations.RunPython.noop),
+    ]
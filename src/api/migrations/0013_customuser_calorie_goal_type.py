@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:27
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def infer_goal_type(apps, schema_editor):
+    CustomUser = apps.get_model('api', 'CustomUser')
+    for goal, field in (('maintain', 'maintenance_calories'), ('gain', 'gain_calories'), ('lose', 'loss_calories')):
+        CustomUser.objects.filter(calorie_goal_type__isnull=True, current_calorie_goal=F(field)).update(
+            calorie_goal_type=goal
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_tokenuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='calorie_goal_type',
+            field=models.CharField(blank=True, choices=[('maintain', 'Maintain'), ('gain', 'Gain'), ('lose', 'Lose')], max_length=10, null=True),
+        ),
+        migrations.RunPython(infer_goal_type, migrations.RunPython.noop),
+    ]
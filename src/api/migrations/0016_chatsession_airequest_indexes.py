@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_airequest'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airequest',
+            index=models.Index(fields=['user', 'created_at'], name='airequest_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='chatsession_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Postgres only: trigram index for fuzzy search (FOOD_SEARCH_BACKEND=postgres) and
+# an upper(name) pattern index for istartswith prefix lookups. Creating pg_trgm
+# needs a role with CREATE privilege on the database.
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute("CREATE INDEX IF NOT EXISTS food_name_trgm_idx ON api_food USING gin (name gin_trgm_ops)")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS food_name_prefix_idx ON api_food (upper(name::text) text_pattern_ops)"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS food_name_trgm_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS food_name_prefix_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_chatsession_airequest_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Food',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('brand', models.CharField(blank=True, default='', max_length=255)),
+                ('source', models.CharField(default='custom', max_length=32)),
+                ('external_id', models.CharField(max_length=64)),
+                ('calories', models.FloatField()),
+                ('protein', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('serving_g', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'external_id'), name='food_source_external_id_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CalorieLogItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grams', models.FloatField()),
+                ('calories', models.FloatField()),
+                ('protein', models.FloatField()),
+                ('fat', models.FloatField()),
+                ('carbs', models.FloatField()),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.calorielog')),
+                ('food', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.food')),
+            ],
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,89 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Every existing day-level log becomes a single "Daily total" entry, so the
+# entries of a log always add up to its totals.
+def split_logs_into_entries(apps, schema_editor):
+    CalorieLog = apps.get_model('api', 'CalorieLog')
+    MealEntry = apps.get_model('api', 'MealEntry')
+    logs = CalorieLog.objects.filter(entries__isnull=True).order_by('id')
+    batch = []
+    for log in logs.values('id', 'calories', 'protein', 'fat', 'carbs').iterator(chunk_size=2000):
+        batch.append(MealEntry(
+            log_id=log['id'],
+            name='Daily total',
+            calories=log['calories'],
+            protein=log['protein'] or 0,
+            fat=log['fat'] or 0,
+            carbs=log['carbs'] or 0,
+        ))
+        if len(batch) >= 2000:
+            MealEntry.objects.bulk_create(batch)
+            batch = []
+    MealEntry.objects.bulk_create(batch)
+
+
+def merge_entries_into_logs(apps, schema_editor):
+    # Totals already live on CalorieLog; only the day-level placeholders go.
+    MealEntry = apps.get_model('api', 'MealEntry')
+    MealEntry.objects.filter(name='Daily total', food__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_food_calorielogitem'),
+    ]
+
+    operations = [
+        migrations.RenameModel('CalorieLogItem', 'MealEntry'),
+        migrations.AlterField(
+            model_name='mealentry',
+            name='log',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='api.calorielog'),
+        ),
+        migrations.AddField(
+            model_name='mealentry',
+            name='meal',
+            field=models.CharField(blank=True, choices=[('breakfast', 'Breakfast'), ('lunch', 'Lunch'), ('dinner', 'Dinner'), ('snack', 'Snack')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='mealentry',
+            name='name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mealentry',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='mealentry',
+            name='grams',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mealentry',
+            name='calories',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='mealentry',
+            name='protein',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='mealentry',
+            name='fat',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='mealentry',
+            name='carbs',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(split_logs_into_entries, merge_entries_into_logs),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AiRateBucket',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ai_rate_bucket', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('full_at', models.FloatField()),
+            ],
+        ),
+    ]
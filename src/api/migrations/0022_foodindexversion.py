@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_airatebucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodIndexVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
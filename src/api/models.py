@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class CustomUser(AbstractUser):
@@ -41,6 +42,11 @@ class CustomUser(AbstractUser):
         null=True, blank=True
     )
     current_calorie_goal = models.FloatField(null=True, blank=True)
+    calorie_goal_type = models.CharField(
+        max_length=10,
+        choices=[('maintain', 'Maintain'), ('gain', 'Gain'), ('lose', 'Lose')],
+        null=True, blank=True
+    )
 
     # `first_name` and `last_name` already exist in AbstractUser
 
@@ -50,10 +56,41 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.email
 
+class TokenUser(CustomUser):
+    """A CustomUser built from JWT claims without a database read.
+
+    Fields not carried in the token are deferred; touching any of them loads
+    all the remaining fields in a single query.
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, claims):
+        data = {'id': user_id, **claims}
+        names = [f.attname for f in cls._meta.concrete_fields if f.attname in data]
+        return cls.from_db(None, names, [data[name] for name in names])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        return super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+
 class ChatSession(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=255, default="New Chat")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of the turns that fell out of the context window
+    summary = models.TextField(blank=True, default="")
+    summary_through = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='chatsession_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.title} ({self.created_at:%Y-%m-%d})"
@@ -65,6 +102,11 @@ class ChatMessage(models.Model):
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'timestamp'], name='chatmessage_session_ts_idx'),
+        ]
+
     def __str__(self):
         role = "User" if self.is_user else "AI"
         return f"{role} @ {self.timestamp:%H:%M}: {self.message[:30]}"
@@ -80,9 +122,167 @@ class CalorieLog(models.Model):
     fat = models.FloatField(null=True, blank=True)
     carbs = models.FloatField(null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
+    # Calorie goal in effect when the log was written, used for adherence rollups
+    calorie_goal = models.FloatField(null=True, blank=True)
 
     class Meta:
         unique_together = ('user', 'date')  # Only one log per user per day
 
     def __str__(self):
-        return f"{self.user.username} - {self.date}: {self.calories} kcal"
\ No newline at end of file
+        return f"{self.user.username} - {self.date}: {self.calories} kcal"
+
+
+class Food(models.Model):
+    """Catalogue entry; nutrient values are per 100 g."""
+
+    name = models.CharField(max_length=255)
+    brand = models.CharField(max_length=255, blank=True, default='')
+    source = models.CharField(max_length=32, default='custom')
+    external_id = models.CharField(max_length=64)
+    calories = models.FloatField()
+    protein = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    serving_g = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'external_id'], name='food_source_external_id_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.brand})" if self.brand else self.name
+
+
+class FoodIndexVersion(models.Model):
+    """Single row whose version changes with the catalogue; processes rebuild their search index when it does."""
+
+    version = models.CharField(max_length=32)
+
+
+class MealEntry(models.Model):
+    """A meal or food logged on a day.
+
+    Many entries share a day's CalorieLog, whose calorie and macro fields
+    hold the running totals (see api/meals.py).
+    """
+
+    MEAL_CHOICES = [
+        ('breakfast', 'Breakfast'),
+        ('lunch', 'Lunch'),
+        ('dinner', 'Dinner'),
+        ('snack', 'Snack'),
+    ]
+
+    log = models.ForeignKey(CalorieLog, on_delete=models.CASCADE, related_name='entries')
+    meal = models.CharField(max_length=10, choices=MEAL_CHOICES, blank=True, default='')
+    name = models.CharField(max_length=255, blank=True, default='')
+    food = models.ForeignKey(Food, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    grams = models.FloatField(null=True, blank=True)
+    calories = models.PositiveIntegerField()
+    protein = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.log.date} {self.meal or 'entry'}: {self.calories} kcal"
+
+
+class NutritionRollup(models.Model):
+    PERIOD_CHOICES = [('week', 'Week'), ('month', 'Month')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='nutrition_rollups')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    days_logged = models.PositiveIntegerField(default=0)
+    calories = models.FloatField(default=0)
+    protein = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    days_with_goal = models.PositiveIntegerField(default=0)
+    days_on_goal = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'period', 'period_start')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.period} of {self.period_start}: {self.calories} kcal"
+
+
+class AiJob(models.Model):
+    KIND_CHOICES = [('chat', 'Chat'), ('meal', 'Meal analysis')]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='aijob_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+
+
+class AiRequest(models.Model):
+    """Idempotency record that lets identical concurrent AI requests share one upstream call."""
+
+    STATUS_CHOICES = [('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')]
+
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_requests')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='airequest_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.status})"
+
+class AiRateBucket(models.Model):
+    """A user's AI rate-limit bucket, as the time it would be full again (see api/throttling.py)."""
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='ai_rate_bucket')
+    full_at = models.FloatField()
+
+    def __str__(self):
+        return f"{self.user_id} full at {self.full_at}"
+
+
+class AiUsage(models.Model):
+    """Upstream LLM tokens used per user per day, for budgets and billing."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_usage')
+    date = models.DateField()
+    requests = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        return f"{self.user_id} {self.date}: {self.prompt_tokens}+{self.completion_tokens} tokens"
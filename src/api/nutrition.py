@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+    'super': 1.9,
+}
+
+PROTEIN_FACTORS = {
+    'lose': 2.0,
+    'maintain': 1.3,
+    'gain': 1.8,
+}
+
+SURPLUS = 300
+
+# goal type -> CustomUser field prefix
+GOAL_PREFIXES = {
+    'maintain': 'maintenance',
+    'gain': 'gain',
+    'lose': 'loss',
+}
+
+INPUT_FIELDS = ('age', 'gender', 'height_cm', 'weight_kg', 'activity_level')
+
+TARGET_FIELDS = (
+    'bmr', 'maintenance_calories', 'gain_calories', 'loss_calories',
+    'maintenance_protein', 'maintenance_fat', 'maintenance_carbs',
+    'gain_protein', 'gain_fat', 'gain_carbs',
+    'loss_protein', 'loss_fat', 'loss_carbs',
+)
+
+CURRENT_FIELDS = ('current_calorie_goal', 'current_protein_goal', 'current_fat_goal', 'current_carbs_goal')
+
+
+def round_tenth(value):
+    """Round to one decimal, halves up. _round_tenths is the same float arithmetic on arrays."""
+    return math.floor(value * 10 + 0.5) / 10
+
+
+def _round_tenths(values):
+    return np.floor(values * 10 + 0.5) / 10
+
+
+def macro_split(calories, weight_kg, goal='maintain'):
+    protein_factor = PROTEIN_FACTORS.get(goal, 1.3)
+
+    protein_g = round_tenth(weight_kg * protein_factor)
+
+    remaining_calories = calories - (protein_g * 4)
+    if remaining_calories < 0:
+        remaining_calories = 0
+
+    fat_calories = remaining_calories * 0.25
+    carb_calories = remaining_calories * 0.75
+
+    fat_g = round_tenth(fat_calories / 9)
+    carb_g = round_tenth(carb_calories / 4)
+
+    return protein_g, fat_g, carb_g
+
+
+def compute_targets(age, gender, height_cm, weight_kg, activity_level):
+    """Targets for one user, keyed by CustomUser field name."""
+    bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + (5 if gender == 'male' else -161)
+    maintenance = bmr * ACTIVITY_MULTIPLIERS.get(activity_level, 1.2)
+    calories = {
+        'maintain': maintenance,
+        'gain': maintenance + SURPLUS,
+        'lose': maintenance - SURPLUS,
+    }
+
+    targets = {'bmr': bmr}
+    for goal, prefix in GOAL_PREFIXES.items():
+        targets[f'{prefix}_calories'] = calories[goal]
+        protein, fat, carbs = macro_split(calories[goal], weight_kg, goal)
+        targets[f'{prefix}_protein'] = protein
+        targets[f'{prefix}_fat'] = fat
+        targets[f'{prefix}_carbs'] = carbs
+    return targets
+
+
+def current_targets(targets, goal_type):
+    prefix = GOAL_PREFIXES[goal_type]
+    return {
+        'current_calorie_goal': targets[f'{prefix}_calories'],
+        'current_protein_goal': targets[f'{prefix}_protein'],
+        'current_fat_goal': targets[f'{prefix}_fat'],
+        'current_carbs_goal': targets[f'{prefix}_carbs'],
+    }
+
+
+def has_inputs(user):
+    return all(getattr(user, field) is not None for field in ('age', 'height_cm', 'weight_kg'))
+
+
+def apply_targets(user, goal_type=None):
+    """Recompute and set every target field on ``user`` (does not save)."""
+    goal_type = goal_type or user.calorie_goal_type or 'maintain'
+    targets = compute_targets(user.age, user.gender, user.height_cm, user.weight_kg, user.activity_level)
+    targets.update(current_targets(targets, goal_type))
+    for field, value in targets.items():
+        setattr(user, field, value)
+    return targets
+
+
+def select_goal(user, goal_type):
+    """Point the current_* goals at already-computed targets for ``goal_type``."""
+    targets = {field: getattr(user, field) for field in TARGET_FIELDS}
+    for field, value in current_targets(targets, goal_type).items():
+        setattr(user, field, value)
+
+
+def batch_targets(age, is_male, height_cm, weight_kg, activity_multiplier):
+    """Vectorized compute_targets over equal-length arrays of users.
+
+    Returns a dict of float64 arrays keyed like compute_targets.
+    """
+    age = np.asarray(age, dtype=np.float64)
+    height_cm = np.asarray(height_cm, dtype=np.float64)
+    weight_kg = np.asarray(weight_kg, dtype=np.float64)
+    bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + np.where(is_male, 5.0, -161.0)
+    maintenance = bmr * np.asarray(activity_multiplier, dtype=np.float64)
+    calories = {
+        'maintain': maintenance,
+        'gain': maintenance + SURPLUS,
+        'lose': maintenance - SURPLUS,
+    }
+
+    targets = {'bmr': bmr}
+    for goal, prefix in GOAL_PREFIXES.items():
+        protein = _round_tenths(weight_kg * PROTEIN_FACTORS[goal])
+        remaining = np.maximum(calories[goal] - protein * 4, 0)
+        targets[f'{prefix}_calories'] = calories[goal]
+        targets[f'{prefix}_protein'] = protein
+        targets[f'{prefix}_fat'] = _round_tenths(remaining * 0.25 / 9)
+        targets[f'{prefix}_carbs'] = _round_tenths(remaining * 0.75 / 4)
+    return targets
+
+
+def batch_targets_for_users(users):
+    """batch_targets for a list of CustomUser instances that all have inputs."""
+    return batch_targets(
+        [u.age for u in users],
+        np.array([u.gender == 'male' for u in users]),
+        [u.height_cm for u in users],
+        [u.weight_kg for u in users],
+        [ACTIVITY_MULTIPLIERS.get(u.activity_level, 1.2) for u in users],
+    )
@@ -0,0 +1,174 @@
+"""Read-replica routing with read-your-writes pinning.
+
+Views opt in with a ``read_replicas`` set naming the handlers (APIView
+methods such as ``'get'``) or viewset actions (such as ``'list'``) whose
+reads may be served by a replica. For those requests ReplicaMiddleware
+picks one of DATABASE_REPLICAS and ReplicaRouter sends reads there, except:
+
+- once the request has written anything (select_for_update counts as a
+  write), so it reads back what it wrote;
+- for a user who wrote within REPLICA_PIN_SECONDS, so they always see their
+  own changes. A write by an authenticated request pins its user.
+
+Writes, migrations and everything else use ``default``. With no replicas
+configured the router never routes anywhere but ``default``.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject
+
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+_state = contextvars.ContextVar('replica_state', default=None)
+
+
+def _pin_key(user_id):
+    return f"db-pin:{user_id}"
+
+
+def pin(user_id):
+    """Serve this user's reads from the primary for REPLICA_PIN_SECONDS.
+
+    Called for writing requests; code writing outside of one (streamed
+    replies, the AI worker) calls it directly.
+    """
+    if settings.DATABASE_REPLICAS:
+        caches[settings.REPLICA_PIN_CACHE_ALIAS].set(_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS].get(_pin_key(user_id)) is not None
+
+
+class RequestState:
+    __slots__ = ('request', 'user_id', 'replica', 'pinned', 'wrote')
+
+    def __init__(self, request):
+        self.request = request
+        self.user_id = None
+        self.replica = None
+        self.pinned = None
+        self.wrote = False
+
+    def current_user_id(self):
+        if self.user_id is None:
+            user = known_user(self.request)
+            return user.pk if user is not None else None
+        return self.user_id
+
+    def read_alias(self):
+        if self.replica is None:
+            return None
+        if self.wrote:
+            return DEFAULT_DB_ALIAS
+        user_id = self.current_user_id()
+        if user_id is not None:
+            if self.pinned is None:
+                self.pinned = is_pinned(user_id)
+            if self.pinned:
+                return DEFAULT_DB_ALIAS
+        return self.replica
+
+
+def identify(user_id):
+    """Tell the router whose request this is before the user row is loaded.
+
+    Authentication calls this, so the user lookup itself honours the pin.
+    """
+    state = _state.get()
+    if state is not None:
+        state.user_id = user_id
+
+
+def known_user(request):
+    """The request's authenticated user if already resolved, without triggering a lookup.
+
+    DRF sets its user on the underlying HttpRequest; evaluating
+    AuthenticationMiddleware's lazy user may itself query the database,
+    which would re-enter the router.
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = request.__dict__.get('_cached_user')
+    return user if user is not None and user.is_authenticated else None
+
+
+def _opted_in(request, view_func):
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    allowed = getattr(view_class, 'read_replicas', ())
+    actions = getattr(view_func, 'actions', None)
+    handler = actions.get(request.method.lower()) if actions else request.method.lower()
+    return handler in allowed
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self._finish(state)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            # pinning may hit a database-backed cache
+            await sync_to_async(self._finish)(state)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is not None and settings.DATABASE_REPLICAS and request.method in SAFE_METHODS \
+                and _opted_in(request, view_func):
+            state.replica = random.choice(settings.DATABASE_REPLICAS)
+
+    @staticmethod
+    def _finish(state):
+        user_id = state.current_user_id()
+        if state.wrote and user_id is not None:
+            pin(user_id)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'django_cache':
+            # DatabaseCache entries (replica pins among them) must not lag
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        return state.read_alias() if state is not None else None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
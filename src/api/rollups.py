@@ -0,0 +1,182 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import CalorieLog, NutritionRollup
+
+PERIODS = ('week', 'month')
+METRICS = ('calories', 'protein', 'fat', 'carbs')
+COUNTERS = ('days_logged', 'days_with_goal', 'days_on_goal')
+
+
+def period_start(period, day):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period_start(period, start):
+    if period == 'week':
+        return start + timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def is_on_goal(calories, goal):
+    return bool(goal) and abs(calories - goal) <= goal * settings.ROLLUP_GOAL_TOLERANCE
+
+
+def contribution(log):
+    """What a single day's log adds to the rollups of the periods containing it."""
+    return {
+        'days_logged': 1,
+        'calories': log['calories'] or 0,
+        'protein': log['protein'] or 0,
+        'fat': log['fat'] or 0,
+        'carbs': log['carbs'] or 0,
+        'days_with_goal': 1 if log['calorie_goal'] else 0,
+        'days_on_goal': 1 if is_on_goal(log['calories'] or 0, log['calorie_goal']) else 0,
+    }
+
+
+def log_values(log):
+    return {
+        'date': log.date,
+        'calories': log.calories,
+        'protein': log.protein,
+        'fat': log.fat,
+        'carbs': log.carbs,
+        'calorie_goal': log.calorie_goal,
+    }
+
+
+def record_changes(user_id, changes):
+    """Apply many ``(old, new)`` log changes, one UPDATE per affected period.
+
+    ``old``/``new`` are dicts from log_values; either may be None for a
+    created or deleted log.
+    """
+    deltas = {}
+    for old, new in changes:
+        for log, sign in ((old, -1), (new, 1)):
+            if log is None:
+                continue
+            for period in PERIODS:
+                row = deltas.setdefault((period, period_start(period, log['date'])), dict.fromkeys(METRICS + COUNTERS, 0))
+                for field, value in contribution(log).items():
+                    row[field] += sign * value
+
+    with transaction.atomic():
+        for (period, start), delta in deltas.items():
+            NutritionRollup.objects.get_or_create(user_id=user_id, period=period, period_start=start)
+            NutritionRollup.objects.filter(user_id=user_id, period=period, period_start=start).update(
+                **{field: F(field) + value for field, value in delta.items()}
+            )
+
+
+def record_change(user_id, old=None, new=None):
+    record_changes(user_id, [(old, new)])
+
+
+def _aggregates(qs):
+    return qs.aggregate(
+        days_logged=Count('id'),
+        calories=Coalesce(Sum('calories'), 0),
+        protein=Coalesce(Sum('protein'), 0.0),
+        fat=Coalesce(Sum('fat'), 0.0),
+        carbs=Coalesce(Sum('carbs'), 0.0),
+        days_with_goal=Count('id', filter=Q(calorie_goal__isnull=False) & ~Q(calorie_goal=0)),
+    )
+
+
+def rebuild(user_ids=None):
+    """Recompute rollups from CalorieLog. Returns the number of rollup rows written."""
+    logs = CalorieLog.objects.order_by('user_id', 'date')
+    rollups = NutritionRollup.objects.all()
+    if user_ids is not None:
+        logs = logs.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    rows = {}
+    for log in logs.values('user_id', 'date', 'calories', 'protein', 'fat', 'carbs', 'calorie_goal').iterator(chunk_size=2000):
+        delta = contribution(log)
+        for period in PERIODS:
+            key = (log['user_id'], period, period_start(period, log['date']))
+            row = rows.setdefault(key, dict.fromkeys(METRICS + COUNTERS, 0))
+            for field, value in delta.items():
+                row[field] += value
+
+    with transaction.atomic():
+        rollups.delete()
+        NutritionRollup.objects.bulk_create(
+            [
+                NutritionRollup(user_id=user_id, period=period, period_start=start, **values)
+                for (user_id, period, start), values in rows.items()
+            ],
+            batch_size=1000,
+        )
+    return len(rows)
+
+
+def _summary_row(start, end, values):
+    days = values['days_logged']
+    row = {'period_start': start, 'period_end': end, 'days_logged': days}
+    for metric in METRICS:
+        row[f'{metric}_total'] = round(values[metric], 1)
+        row[f'{metric}_avg'] = round(values[metric] / days, 1) if days else None
+    row['adherence'] = (
+        round(values['days_on_goal'] / values['days_with_goal'], 3) if values['days_with_goal'] else None
+    )
+    return row
+
+
+def _raw_period(user, start, end):
+    logs = CalorieLog.objects.filter(user=user, date__gte=start, date__lte=end)
+    values = _aggregates(logs)
+    values['days_on_goal'] = sum(
+        is_on_goal(calories, goal) for calories, goal in logs.values_list('calories', 'calorie_goal')
+    )
+    return values
+
+
+def summarize(user, period, date_from, date_to):
+    """Per-period and overall totals/averages for ``date_from``..``date_to`` inclusive.
+
+    Periods fully inside the range are read from NutritionRollup; the (at
+    most two) partial periods at the edges are aggregated from CalorieLog.
+    """
+    first = period_start(period, date_from)
+    stored = {
+        r.period_start: r
+        for r in NutritionRollup.objects.filter(
+            user=user, period=period, period_start__gte=first, period_start__lte=date_to
+        )
+    }
+
+    periods = []
+    totals = dict.fromkeys(METRICS + COUNTERS, 0)
+    start = first
+    while start <= date_to:
+        end = next_period_start(period, start) - timedelta(days=1)
+        if start >= date_from and end <= date_to:
+            rollup = stored.get(start)
+            values = {f: getattr(rollup, f) if rollup else 0 for f in METRICS + COUNTERS}
+        else:
+            values = _raw_period(user, max(start, date_from), min(end, date_to))
+        if values['days_logged']:
+            periods.append(_summary_row(max(start, date_from), min(end, date_to), values))
+            for field in totals:
+                totals[field] += values[field]
+        start = next_period_start(period, start)
+
+    return {
+        'period': period,
+        'from': date_from,
+        'to': date_to,
+        'periods': periods,
+        'totals': _summary_row(date_from, date_to, totals),
+    }
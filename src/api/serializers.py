@@ -1,27 +1,13 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
 from rest_framework import serializers
-from .models import CustomUser, CalorieLog, ChatSession, ChatMessage
-
-def macro_split(calories, weight_kg, goal='maintain'):
-    protein_factors = {
-        'lose': 2.0,
-        'maintain': 1.3,
-        'gain': 1.8,
-    }
-    protein_factor = protein_factors.get(goal, 1.3)
-    
-    protein_g = round(weight_kg * protein_factor, 1)
-    
-    remaining_calories = calories - (protein_g * 4)
-    if remaining_calories < 0:
-        remaining_calories = 0
-    
-    fat_calories = remaining_calories * 0.25
-    carb_calories = remaining_calories * 0.75
-    
-    fat_g = round(fat_calories / 9, 1)
-    carb_g = round(carb_calories / 4, 1)
-    
-    return protein_g, fat_g, carb_g
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenObtainSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import TOKEN_USER_CLAIMS, add_user_claims
+from django.db import transaction
+from .models import CustomUser, CalorieLog, ChatSession, ChatMessage, Food, MealEntry
+from . import foods, meals, nutrition, tokens
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -67,80 +53,136 @@ class RegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         calorie_goal_type = validated_data.pop('calorie_goal_type')
         password = validated_data.pop('password')
-    
-        age = validated_data.get('age')
-        gender = validated_data.get('gender')
-        height = validated_data.get('height_cm')
-        weight = validated_data.get('weight_kg')
-        activity_level = validated_data.get('activity_level')
-    
-        bmr = 10 * weight + 6.25 * height - 5 * age + (5 if gender == 'male' else -161)
-    
-        activity_map = {
-            'sedentary': 1.2,
-            'light': 1.375,
-            'moderate': 1.55,
-            'active': 1.725,
-            'super': 1.9,
-        }
-        activity_multiplier = activity_map.get(activity_level, 1.2)
-    
-        maintenance = bmr * activity_multiplier
-        gain = maintenance + 300
-        loss = maintenance - 300
-    
-        macros = {
-            'maintain': macro_split(maintenance, weight, 'maintain'),
-            'gain': macro_split(gain, weight, 'gain'),
-            'lose': macro_split(loss, weight, 'lose'),
-        }
-    
+
         user = CustomUser(**validated_data)
         user.set_password(password)
-        user.bmr = bmr
-        user.maintenance_calories = maintenance
-        user.gain_calories = gain
-        user.loss_calories = loss
-    
-        user.current_calorie_goal = {
-            'maintain': maintenance,
-            'gain': gain,
-            'lose': loss
-        }[calorie_goal_type]
-    
-        macro_fields = {
-            'maintain': 'maintenance',
-            'gain': 'gain',
-            'lose': 'loss',
-        }
-    
-        for key, prefix in macro_fields.items():
-            protein, fat, carbs = macros[key]
-            setattr(user, f'{prefix}_protein', protein)
-            setattr(user, f'{prefix}_fat', fat)
-            setattr(user, f'{prefix}_carbs', carbs)
-    
-        current_macros = macros[calorie_goal_type]
-        user.current_protein_goal, user.current_fat_goal, user.current_carbs_goal = current_macros
-    
+        user.calorie_goal_type = calorie_goal_type
+        nutrition.apply_targets(user, calorie_goal_type)
+
         user.profile_complete = all([
             validated_data.get('first_name'),
             validated_data.get('last_name'),
-            age, gender, height, weight, activity_level
+            *(validated_data.get(field) for field in nutrition.INPUT_FIELDS),
         ])
-    
+
         user.save()
         return user
 
+    def update(self, instance, validated_data):
+        password = validated_data.pop('password', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if password:
+            instance.set_password(password)
+        if set(validated_data) & {*nutrition.INPUT_FIELDS, 'calorie_goal_type'}:
+            if nutrition.has_inputs(instance):
+                nutrition.apply_targets(instance)
+            elif instance.calorie_goal_type:
+                nutrition.select_goal(instance, instance.calorie_goal_type)
+        instance.save()
+        return instance
+
+
+
+class FoodSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Food
+        fields = ['id', 'name', 'brand', 'calories', 'protein', 'fat', 'carbs', 'serving_g']
+
+
+class MealEntrySerializer(serializers.ModelSerializer):
+    food = serializers.PrimaryKeyRelatedField(queryset=Food.objects.all(), required=False, allow_null=True)
+    grams = serializers.FloatField(min_value=0.1, max_value=10000, required=False, allow_null=True)
+
+    class Meta:
+        model = MealEntry
+        fields = ['id', 'meal', 'name', 'food', 'grams', 'calories', 'protein', 'fat', 'carbs', 'created_at']
+        read_only_fields = ['created_at']
+        extra_kwargs = {'calories': {'required': False}}
+
+    def validate(self, attrs):
+        food = attrs.get('food', getattr(self.instance, 'food', None))
+        if food is not None and ('food' in attrs or 'grams' in attrs):
+            # Nutrients of catalogue foods are computed here, not trusted from the client.
+            grams = attrs.get('grams', getattr(self.instance, 'grams', None))
+            if grams is None:
+                raise serializers.ValidationError({'grams': ["This field is required with a food."]})
+            attrs.update(foods.portion(food, grams))
+            attrs['calories'] = round(attrs['calories'])
+            if not attrs.get('name') and not getattr(self.instance, 'name', ''):
+                attrs['name'] = food.name
+        elif 'calories' not in attrs and self.instance is None:
+            raise serializers.ValidationError({'calories': ["This field is required unless a food is given."]})
+        return attrs
+
+
+class MealEntryDetailSerializer(MealEntrySerializer):
+    date = serializers.DateField(source='log.date')
+
+    class Meta(MealEntrySerializer.Meta):
+        fields = ['date', *MealEntrySerializer.Meta.fields]
+
+
+ITEMIZED_DAY_ERROR = {
+    'non_field_errors': ["This day has meal entries; change them through /api/meal-entries/ or send entries."]
+}
 
 
 class CalorieLogSerializer(serializers.ModelSerializer):
     protein = serializers.FloatField(required=False)
     fat = serializers.FloatField(required=False)
     carbs = serializers.FloatField(required=False)
+    entries = MealEntrySerializer(many=True, required=False)
     class Meta:
         model = CalorieLog
-        fields = ['id', 'date', 'calories', 'protein', 'fat', 'carbs', 'notes']
+        fields = ['id', 'date', 'calories', 'protein', 'fat', 'carbs', 'notes', 'entries']
+        extra_kwargs = {'calories': {'required': False}}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # ``fields`` limits the serialized output to a subset of Meta.fields.
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def validate(self, attrs):
+        entries = attrs.get('entries')
+        if entries is not None:
+            # Writing a day's entries replaces them, and the totals follow.
+            attrs['calories'] = sum(entry['calories'] for entry in entries)
+            for field in meals.TOTAL_FIELDS[1:]:
+                attrs[field] = round(sum(entry.get(field, 0) for entry in entries), 1)
+        elif 'calories' not in attrs and self.instance is None:
+            raise serializers.ValidationError({'calories': ["This field is required unless entries are given."]})
+        elif self.instance is not None and any(field in attrs for field in meals.TOTAL_FIELDS) \
+                and meals.itemized_days(self.instance.user_id, [self.instance.date]):
+            # A day total would replace the meals it is made of.
+            raise serializers.ValidationError(ITEMIZED_DAY_ERROR)
+        return attrs
+
+    def create(self, validated_data):
+        entries = validated_data.pop('entries', None)
+        with transaction.atomic():
+            log = super().create(validated_data)
+            self._write_entries(log, entries)
+        return log
+
+    def update(self, instance, validated_data):
+        entries = validated_data.pop('entries', None)
+        with transaction.atomic():
+            log = super().update(instance, validated_data)
+            if entries is not None or any(field in validated_data for field in meals.TOTAL_FIELDS):
+                self._write_entries(log, entries)
+                # Drop prefetched entries so the response shows the new ones.
+                getattr(log, '_prefetched_objects_cache', {}).pop('entries', None)
+        return log
+
+    def _write_entries(self, log, entries):
+        if entries is None:
+            meals.reset_entries([log])
+        else:
+            log.entries.all().delete()
+            MealEntry.objects.bulk_create([MealEntry(log=log, **entry) for entry in entries])
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -159,7 +201,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
 class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
-        fields = ['is_user', 'message', 'timestamp']
+        fields = ['id', 'is_user', 'message', 'timestamp']
 
 class ChatSessionSerializer(serializers.ModelSerializer):
     messages = ChatMessageSerializer(many=True, read_only=True)
@@ -167,3 +209,74 @@ class ChatSessionSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatSession
         fields = ['id', 'title', 'created_at', 'messages']
+
+
+class ChatSessionListSerializer(serializers.ModelSerializer):
+    message_count = serializers.IntegerField(read_only=True)
+    last_message = serializers.CharField(read_only=True, allow_null=True)
+    last_message_at = serializers.DateTimeField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = ChatSession
+        fields = ['id', 'title', 'created_at', 'message_count', 'last_message', 'last_message_at']
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issues a token pair with user claims, starting a new refresh-token family.
+
+    ``client`` selects the token lifetimes (JWT_LIFETIMES), so mobile apps can
+    refresh less often than the web client.
+    """
+
+    client = serializers.ChoiceField(choices=tokens.CLIENTS, default='web', write_only=True)
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+    def validate(self, attrs):
+        TokenObtainSerializer.validate(self, attrs)
+        data = tokens.issue(self.get_token(self.user), attrs['client'])
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-reads the user's claims so a new access token never outlives a profile change by more than its lifetime.
+
+    With ROTATE_REFRESH_TOKENS each refresh token works once; see api/tokens.py.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if tokens.family_revoked(refresh):
+            raise InvalidToken("Token has been revoked", "token_revoked")
+        successor = None
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            first_use, successor = tokens.consume(refresh)
+            if not first_use:
+                raise InvalidToken("Token was already used; its session has been revoked", "token_reused")
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).only(
+            'id', 'is_active', *TOKEN_USER_CLAIMS
+        ).first()
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        if successor is not None:
+            return successor  # a retry of a refresh whose response was lost
+
+        add_user_claims(refresh, user)
+        client = refresh.payload.get(tokens.CLIENT_CLAIM, 'web')
+        if not api_settings.ROTATE_REFRESH_TOKENS:
+            access = refresh.access_token
+            access.set_exp(from_time=refresh.current_time, lifetime=tokens.lifetimes(client)[0])
+            return {"access": str(access)}
+
+        family, rotated_jti = tokens.family(refresh), refresh[api_settings.JTI_CLAIM]
+        refresh.set_jti()
+        refresh.set_iat()
+        pair = tokens.issue(refresh, client, family)
+        tokens.remember_successor(rotated_jti, pair)
+        return pair
@@ -0,0 +1,55 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import metrics, rollups
+from .cache import invalidate_profile
+from .foods import invalidate_index
+from .models import CalorieLog, CustomUser, Food
+
+
+@receiver(pre_save, sender=CalorieLog)
+def remember_previous_log(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.calorie_goal is None:
+        instance.calorie_goal = instance.user.current_calorie_goal
+    instance._rollup_previous = None
+    if instance.pk:
+        instance._rollup_previous = CalorieLog.objects.filter(pk=instance.pk).values(
+            'date', 'calories', 'protein', 'fat', 'carbs', 'calorie_goal'
+        ).first()
+
+
+@receiver(post_save, sender=CalorieLog)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rollups.record_change(instance.user_id, getattr(instance, '_rollup_previous', None), rollups.log_values(instance))
+
+
+@receiver(post_delete, sender=CalorieLog)
+def update_rollups_on_delete(sender, instance, origin=None, **kwargs):
+    if getattr(origin, 'model', type(origin)) is not CalorieLog:
+        return  # cascaded from deleting the user, whose rollups go with it
+    rollups.record_change(instance.user_id, rollups.log_values(instance), None)
+
+
+@receiver(post_save)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    # no sender filter: saves through proxies such as TokenUser are sent with the proxy class
+    if isinstance(instance, CustomUser):
+        invalidate_profile(instance.pk)
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def invalidate_food_index(sender, **kwargs):
+    invalidate_index()
+
+
+@receiver(connection_created)
+def instrument_queries(sender, connection, **kwargs):
+    # execute_wrappers outlives reconnects, so only add the wrapper once
+    if metrics.timed_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.timed_query)
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import AiRequest
+
+
+class StillRunning(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InFlightCalls:
+    """In-process single-flight: concurrent callers with the same key share one call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_in_flight = InFlightCalls()
+
+
+def request_key(user_id, session_id, message, mode, idempotency_key=None):
+    request = f"key:{idempotency_key}" if idempotency_key else f"message:{message}"
+    raw = f"{user_id}:{session_id or 'new'}:{mode}:{request}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _reusable(record, replay):
+    age = timezone.now() - record.created_at
+    if record.status == 'pending':
+        return age < timedelta(seconds=settings.AI_SINGLE_FLIGHT_TIMEOUT)
+    if record.status == 'done' and replay:
+        return age < timedelta(seconds=settings.AI_SINGLE_FLIGHT_WINDOW)
+    return False
+
+
+def _claim(key, user, replay):
+    """Return ``(is_leader, record)``, replacing records that can no longer be shared."""
+    while True:
+        try:
+            with transaction.atomic():
+                return True, AiRequest.objects.create(key=key, user=user)
+        except IntegrityError:
+            record = AiRequest.objects.filter(key=key).first()
+            if record is None:
+                continue
+            if _reusable(record, replay):
+                return False, record
+            AiRequest.objects.filter(pk=record.pk, status=record.status).delete()
+
+
+def _wait(record):
+    deadline = time.monotonic() + settings.AI_SINGLE_FLIGHT_TIMEOUT
+    while record.status == 'pending':
+        if time.monotonic() > deadline:
+            raise StillRunning(record.key)
+        time.sleep(settings.AI_SINGLE_FLIGHT_POLL_INTERVAL)
+        record.refresh_from_db(fields=['status', 'response', 'status_code'])
+    return record.response, record.status_code
+
+
+def _run_once(key, user, fn, replay):
+    leader, record = _claim(key, user, replay)
+    if not leader:
+        return _wait(record)
+
+    try:
+        body, code = fn()
+    except BaseException:
+        AiRequest.objects.filter(pk=record.pk).update(status='failed', status_code=500)
+        raise
+    AiRequest.objects.filter(pk=record.pk).update(
+        status='done' if code < 400 else 'failed', response=body, status_code=code
+    )
+    horizon = max(settings.AI_SINGLE_FLIGHT_WINDOW, settings.AI_SINGLE_FLIGHT_TIMEOUT)
+    AiRequest.objects.filter(user=user, created_at__lt=timezone.now() - timedelta(seconds=horizon)).delete()
+    return body, code
+
+
+def run(key, user, fn, replay=False):
+    """Run ``fn`` (returning ``(body, status_code)``) at most once per key.
+
+    Callers in this process share a single call; callers in other workers
+    wait on the AiRequest row whose unique key the first caller inserted.
+    With ``replay`` (the client sent an Idempotency-Key) successful results
+    are also replayed for AI_SINGLE_FLIGHT_WINDOW seconds; without it only
+    calls still in flight are shared, since the same message sent again
+    later ("yes", "ok") is a new turn.
+    """
+    return _in_flight.do(key, lambda: _run_once(key, user, fn, replay))
@@ -1,3 +1,1867 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+import threading
+from unittest import mock, skipUnless
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+import requests
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .cache import LocMemResultCache, get_meal_cache
+from .chat import build_messages, estimate_tokens
+from .images import prepare_image
+from .views import ChatHistoryView
+from . import checks, export, foods, hashers, jobs, llm, metrics, nutrition, replicas, singleflight, throttling, tokens, usage, views
+from .models import CustomUser, ChatSession, ChatMessage, CalorieLog, NutritionRollup, TokenUser, AiJob, AiRateBucket, AiRequest, Food, MealEntry, AiUsage
+
+
+class MockCompletionsHandler(BaseHTTPRequestHandler):
+    tokens = ["Eat ", "more ", "protein."]
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.requests.append(json.loads(self.rfile.read(length)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for token in self.tokens:
+            chunk = {"choices": [{"delta": {"content": token}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        usage = {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": len(self.tokens)}}
+        self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class MockCompletionsServer:
+    def __init__(self, handler=MockCompletionsHandler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.requests = []
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/v1/chat/completions"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def completion_response(content, prompt_tokens=10, completion_tokens=5):
+    return {
+        "choices": [{"message": {"content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+    }
+
+
+def make_user(email="user@example.com", **kwargs):
+    return CustomUser.objects.create_user(
+        username=email.split("@")[0], email=email, password="pass12345", **kwargs
+    )
+
+
+def auth_header(user):
+    return {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+
+def jpeg_bytes(size=(64, 48), color="red", **save_kwargs):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG", **save_kwargs)
+    return buf.getvalue()
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = {"event": "message"}
+        for line in block.split("\n"):
+            key, _, value = line.partition(": ")
+            event[key] = json.loads(value) if key == "data" else value
+        events.append(event)
+    return events
+
+
+class AiStreamViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        llm.reset_breakers()
+        self.user = make_user()
+
+    async def _stream(self, server, payload):
+        with override_settings(TOGETHER_API_URL=server.url):
+            response = await self.async_client.post(
+                "/api/ai/stream/", payload, content_type="application/json", headers=auth_header(self.user)
+            )
+            body = b"".join([chunk async for chunk in response.streaming_content])
+        return response, parse_sse(body.decode())
+
+    async def test_streams_tokens_and_persists_messages(self):
+        with MockCompletionsServer() as server:
+            response, events = await self._stream(server, {"message": "What should I eat?"})
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(events[0]["event"], "session")
+        tokens = [e["data"]["token"] for e in events if e["event"] == "message"]
+        self.assertEqual(tokens, MockCompletionsHandler.tokens)
+        self.assertEqual(events[-1]["event"], "done")
+        self.assertEqual(events[-1]["data"]["reply"], "Eat more protein.")
+
+        self.assertTrue(server.requests[0]["stream"])
+        session = await ChatSession.objects.aget(user=self.user)
+        messages = [m async for m in ChatMessage.objects.filter(session=session).order_by("id")]
+        self.assertEqual([(m.is_user, m.message) for m in messages], [
+            (True, "What should I eat?"),
+            (False, "Eat more protein."),
+        ])
+
+    @override_settings(LLM_RETRY_BACKOFF=0)
+    async def test_upstream_error_is_reported_and_not_persisted(self):
+        class FailingHandler(MockCompletionsHandler):
+            def do_POST(self):
+                self.send_response(503)
+                self.end_headers()
+                self.wfile.write(b"overloaded")
+
+        with MockCompletionsServer(FailingHandler) as server:
+            _, events = await self._stream(server, {"message": "Hi"})
+
+        self.assertEqual(events[-1]["event"], "error")
+        self.assertFalse(await ChatMessage.objects.aexists())
+        self.assertFalse(await ChatSession.objects.aexists())
+
+    async def test_aborted_stream_leaves_no_empty_session(self):
+        request = AsyncRequestFactory().post("/api/ai/stream/", {"message": "Hi"}, content_type="application/json",
+                                             headers=auth_header(self.user))
+        with MockCompletionsServer() as server, override_settings(TOGETHER_API_URL=server.url):
+            response = await views.ai_stream_view(request)
+            events = response._iterator  # the view's own generator, which ASGI closes on disconnect
+            self.assertIn("event: session", await anext(events))
+            await events.aclose()
+        self.assertFalse(await ChatSession.objects.aexists())
+
+    async def test_non_object_body_is_rejected(self):
+        for payload in (["Hi"], "Hi"):
+            response = await self.async_client.post(
+                "/api/ai/stream/", json.dumps(payload), content_type="application/json",
+                headers=auth_header(self.user),
+            )
+            self.assertEqual(response.status_code, 400)
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.post(
+            "/api/ai/stream/", {"message": "Hi"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class ScriptedCompletionsHandler(BaseHTTPRequestHandler):
+    """Answers each request with the next step of ``server.script``.
+
+    A step is a status code, or "slow" to stall past the client's read timeout.
+    Once the script runs out every request succeeds.
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length))
+        self.server.requests.append(body)
+        step = self.server.script.pop(0) if self.server.script else 200
+        if step == "slow":
+            time.sleep(0.3)
+            return  # the client has given up by now
+        if step != 200:
+            self.send_response(step)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(b"upstream trouble")
+            return
+        self.send_response(200)
+        if body.get("stream"):
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            chunk = {"choices": [{"delta": {"content": f"from {body['model']}"}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+            return
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(completion_response(f"from {body['model']}")).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    TOGETHER_MODEL="primary",
+    TOGETHER_FALLBACK_MODELS=["fallback"],
+    LLM_MAX_RETRIES=2,
+    LLM_RETRY_BACKOFF=0,
+    LLM_READ_TIMEOUT=0.1,
+    LLM_CIRCUIT_FAILURES=2,
+    LLM_CIRCUIT_RESET_SECONDS=60,
+)
+class LLMClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        llm.reset_breakers()
+        self.server = MockCompletionsServer(ScriptedCompletionsHandler)
+        self.server.httpd.script = []
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(TOGETHER_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _complete(self, *script):
+        self.server.httpd.script = list(script)
+        return llm.content(llm.completion([{"role": "user", "content": "Hi"}]))
+
+    def _models(self):
+        return [r["model"] for r in self.server.requests]
+
+    def test_transient_errors_are_retried(self):
+        self.assertEqual(self._complete(503, 429), "from primary")
+        self.assertEqual(self._models(), ["primary"] * 3)
+
+    def test_read_timeout_is_retried(self):
+        self.assertEqual(self._complete("slow"), "from primary")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_falls_back_when_primary_keeps_failing(self):
+        self.assertEqual(self._complete(500, 502, 504), "from fallback")
+        self.assertEqual(self._models(), ["primary"] * 3 + ["fallback"])
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(llm.LLMError) as ctx:
+            self._complete(400)
+        self.assertNotIsInstance(ctx.exception, llm.LLMUnavailable)
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(len(self.server.requests), 1)
+
+    @override_settings(TOGETHER_FALLBACK_MODELS=[])
+    def test_circuit_opens_and_fails_fast(self):
+        for _ in range(2):
+            with self.assertRaises(llm.LLMUnavailable):
+                self._complete(503, 503, 503)
+        self.assertEqual(len(self.server.requests), 6)
+
+        with self.assertRaises(llm.LLMUnavailable) as ctx:
+            self._complete()
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertGreater(ctx.exception.retry_after, 0)
+
+    def test_half_open_circuit_lets_one_trial_through(self):
+        breaker = llm.CircuitBreaker(failures=2, reset_seconds=60)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+        breaker.opened_at -= 61
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # only one trial at a time
+        breaker.failure()
+        self.assertFalse(breaker.allow())  # the failed trial re-opens it
+
+        breaker.opened_at -= 61
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    @override_settings(TOGETHER_FALLBACK_MODELS=[])
+    def test_unexpected_error_during_half_open_trial_settles_it(self):
+        circuit = llm.breaker("primary")
+        circuit.failure()
+        circuit.failure()
+        circuit.opened_at -= 61
+        with mock.patch("api.llm._post", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self._complete()
+        self.assertFalse(circuit.trial_running)
+        self.assertFalse(circuit.allow())  # the failed trial re-opened it
+
+        circuit.opened_at -= 61
+        self.assertEqual(self._complete(), "from primary")
+        self.assertIsNone(circuit.opened_at)
+
+    def test_any_requests_error_is_retried(self):
+        session = llm.get_session()
+        with mock.patch.object(session, "post", wraps=session.post) as post:
+            post.side_effect = [requests.exceptions.ChunkedEncodingError("cut off"), mock.DEFAULT]
+            self.assertEqual(self._complete(), "from primary")
+        self.assertEqual(post.call_count, 2)
+
+    @override_settings(TOGETHER_FALLBACK_MODELS=[])
+    def test_chat_returns_503_while_circuit_is_open(self):
+        user = make_user()
+        llm.breaker("primary").failure()
+        llm.breaker("primary").failure()
+        response = self.client.post("/api/ai/", {"message": "Hi"}, content_type="application/json",
+                                    headers=auth_header(user))
+        self.assertEqual(response.status_code, 503)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.assertEqual(self.server.requests, [])
+
+    async def test_stream_falls_back_before_first_token(self):
+        self.server.httpd.script = [503, 503, 503]
+        tokens = [t async for t in llm.stream_chat_completion([{"role": "user", "content": "Hi"}])]
+        self.assertEqual(tokens, ["from fallback"])
+        self.assertEqual(self._models(), ["primary"] * 3 + ["fallback"])
+
+
+class ChatContextTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.session = ChatSession.objects.create(user=self.user, title="Chat")
+        for i in range(30):
+            ChatMessage.objects.create(session=self.session, is_user=i % 2 == 0, message=f"message {i:02d} " + "x" * 36)
+
+    def _history(self, messages):
+        return [m["content"] for m in messages if m["role"] in ("user", "assistant")][:-1]
+
+    @override_settings(CHAT_CONTEXT_TOKEN_BUDGET=10 * estimate_tokens("message 00 " + "x" * 36),
+                       CHAT_SUMMARY_MIN_MESSAGES=100)
+    def test_window_keeps_most_recent_messages_within_budget(self):
+        with mock.patch("api.chat.completion") as completion:
+            messages = build_messages(self.user, self.session, "Next?")
+
+        history = self._history(messages)
+        self.assertEqual(len(history), 10)
+        self.assertTrue(history[0].startswith("message 20"))
+        self.assertTrue(history[-1].startswith("message 29"))
+        self.assertEqual(messages[-1], {"role": "user", "content": "Next?"})
+        completion.assert_not_called()
+
+    @override_settings(CHAT_CONTEXT_TOKEN_BUDGET=10 * estimate_tokens("message 00 " + "x" * 36),
+                       CHAT_SUMMARY_MIN_MESSAGES=5, CHAT_SUMMARY_MAX_MESSAGES=40)
+    def test_older_turns_are_summarized_once_and_cached(self):
+        summary = completion_response("User wants to cut.", prompt_tokens=400, completion_tokens=20)
+        with mock.patch("api.chat.completion", return_value=summary) as completion:
+            messages = build_messages(self.user, self.session, "Next?")
+            build_messages(self.user, self.session, "And then?")
+
+        completion.assert_called_once()
+        self.assertIn("message 19", completion.call_args[0][0][1]["content"])
+        self.assertNotIn("message 20", completion.call_args[0][0][1]["content"])
+        self.assertIn("User wants to cut.", messages[1]["content"])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, "User wants to cut.")
+        self.assertEqual(usage.tokens_used(self.user.pk), 420)
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        other = make_user("other@example.com")
+        for n in range(25):
+            session = ChatSession.objects.create(user=self.user, title=f"Chat {n}")
+            ChatMessage.objects.create(session=session, is_user=True, message="Q" * 500)
+            ChatMessage.objects.create(session=session, is_user=False, message=f"Answer {n}")
+        ChatSession.objects.create(user=other, title="Not mine")
+        self.session = session
+
+    def test_session_list_is_paginated_with_counts_and_preview(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/ai/chat-history/", headers=auth_header(self.user))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["results"]), 20)
+        self.assertIsNotNone(data["next"])
+        first = data["results"][0]
+        self.assertEqual(first["title"], "Chat 24")
+        self.assertEqual(first["message_count"], 2)
+        self.assertEqual(first["last_message"], "Answer 24")
+        self.assertNotIn("messages", first)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(data["next"], headers=auth_header(self.user))
+        self.assertEqual([s["title"] for s in response.json()["results"]], [f"Chat {n}" for n in range(4, -1, -1)])
+
+    def test_session_messages_are_paginated(self):
+        for n in range(60):
+            ChatMessage.objects.create(session=self.session, is_user=True, message=f"more {n}")
+        url = f"/api/ai/chat-history/{self.session.id}/messages/"
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, headers=auth_header(self.user))
+
+        data = response.json()
+        self.assertEqual(len(data["results"]), 50)
+        self.assertEqual(data["results"][0]["message"], "more 59")
+        response = self.client.get(data["next"], headers=auth_header(self.user))
+        self.assertEqual(len(response.json()["results"]), 12)
+
+    def test_session_messages_of_other_user_are_not_found(self):
+        other = ChatSession.objects.get(title="Not mine")
+        response = self.client.get(f"/api/ai/chat-history/{other.id}/messages/", headers=auth_header(self.user))
+        self.assertEqual(response.status_code, 404)
+
+
+class MealCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_meal_cache().clear()
+        self.user = make_user(is_premium=True)
+
+    def _upload(self, content):
+        return self.client.post("/api/analyze-meal/", {"image": SimpleUploadedFile("meal.jpg", content)},
+                                headers=auth_header(self.user))
+
+    def test_repeat_upload_is_served_from_cache(self):
+        with mock.patch("api.llm.completion", return_value=completion_response("30g protein")) as post:
+            first = self._upload(jpeg_bytes(color="red"))
+            second = self._upload(jpeg_bytes(color="red"))
+            third = self._upload(jpeg_bytes(color="blue"))
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.json(), {"macros": "30g protein"})
+        self.assertEqual(third["X-Cache"], "MISS")
+        stats = get_meal_cache().stats()
+        self.assertGreaterEqual(stats["hits"], 1)
+
+    @override_settings(AI_RATE_BURST={"free": 2, "premium": 2}, AI_IMAGE_REQUEST_COST=2)
+    def test_cache_hits_are_not_throttled(self):
+        with mock.patch("api.llm.completion", return_value=completion_response("30g protein")) as post:
+            self.assertEqual(self._upload(jpeg_bytes(color="red"))["X-Cache"], "MISS")
+            for _ in range(3):
+                self.assertEqual(self._upload(jpeg_bytes(color="red"))["X-Cache"], "HIT")
+            self.assertEqual(self._upload(jpeg_bytes(color="blue")).status_code, 429)
+        self.assertEqual(post.call_count, 1)
+
+    def test_cache_hits_are_served_once_the_budget_is_spent(self):
+        with mock.patch("api.llm.completion", return_value=completion_response("30g protein")):
+            self._upload(jpeg_bytes(color="red"))
+        AiUsage.objects.filter(user=self.user).update(prompt_tokens=10 ** 9)
+        self.assertEqual(self._upload(jpeg_bytes(color="red")).status_code, 200)
+        self.assertEqual(self._upload(jpeg_bytes(color="blue")).status_code, 429)
+
+    def test_upstream_failures_are_not_cached(self):
+        with mock.patch("api.llm.completion", side_effect=llm.LLMUnavailable("down", retry_after=5)) as post:
+            self._upload(jpeg_bytes())
+            response = self._upload(jpeg_bytes())
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+
+    def test_non_image_upload_is_rejected(self):
+        with mock.patch("api.llm.completion") as post:
+            response = self._upload(b"not an image")
+        self.assertEqual(response.status_code, 400)
+        post.assert_not_called()
+
+    def test_decompression_bomb_is_rejected(self):
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000), mock.patch("api.llm.completion") as post:
+            response = self._upload(jpeg_bytes((200, 200)))
+        self.assertEqual(response.status_code, 400)
+        post.assert_not_called()
+
+
+class LocMemResultCacheTests(TestCase):
+    def test_lru_eviction_and_ttl(self):
+        cache = LocMemResultCache(ttl=60, max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+
+        with mock.patch("api.cache.time.monotonic", return_value=10 ** 9):
+            self.assertIsNone(cache.get("c"))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+
+class PrepareImageTests(TestCase):
+    def test_downscales_and_strips_metadata(self):
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        upload = SimpleUploadedFile("big.png", jpeg_bytes((3000, 2000), exif=exif.tobytes()))
+
+        data, mime_type = prepare_image(upload, max_dimension=512, output_format="webp")
+
+        self.assertEqual(mime_type, "image/webp")
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual(image.format, "WEBP")
+        self.assertEqual(max(image.size), 512)
+        self.assertEqual(dict(image.getexif()), {})
+
+
+class NutritionRollupTests(TestCase):
+    def setUp(self):
+        self.user = make_user(current_calorie_goal=2000)
+
+    def _post(self, day, calories, **macros):
+        return self.client.post(
+            "/api/calorie-logs/", {"date": day, "calories": calories, **macros}, headers=auth_header(self.user)
+        )
+
+    def _rollups(self):
+        return sorted(NutritionRollup.objects.filter(user=self.user).values_list(
+            "period", "period_start", "days_logged", "calories", "protein", "days_with_goal", "days_on_goal"
+        ))
+
+    def test_rollups_follow_create_update_delete(self):
+        self._post("2025-03-03", 2000, protein=150)
+        self._post("2025-03-04", 2600, protein=100)
+        log_id = self._post("2025-03-31", 1900).json()["id"]
+
+        self.assertEqual(
+            NutritionRollup.objects.get(user=self.user, period="week", period_start=date(2025, 3, 3)).calories,
+            4600,
+        )
+        self.client.patch(f"/api/calorie-logs/{log_id}/", {"calories": 1000}, headers=auth_header(self.user),
+                          content_type="application/json")
+        self.client.delete(
+            f"/api/calorie-logs/{CalorieLog.objects.get(date='2025-03-04').id}/", headers=auth_header(self.user)
+        )
+
+        incremental = [r for r in self._rollups() if r[2]]
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        self.assertEqual(incremental, self._rollups())
+        month = NutritionRollup.objects.get(user=self.user, period="month", period_start=date(2025, 3, 1))
+        self.assertEqual((month.days_logged, month.calories, month.days_on_goal), (2, 3000, 1))
+
+    def test_summary_combines_rollups_and_partial_edges(self):
+        for day, calories in [("2025-03-02", 1000), ("2025-03-03", 2000), ("2025-03-09", 2200),
+                              ("2025-03-10", 3000), ("2025-03-12", 1500)]:
+            self._post(day, calories, protein=100)
+
+        response = self.client.get(
+            "/api/calorie-logs/summary/?period=week&from=2025-03-03&to=2025-03-10", headers=auth_header(self.user)
+        )
+
+        data = response.json()
+        self.assertEqual([p["period_start"] for p in data["periods"]], ["2025-03-03", "2025-03-10"])
+        self.assertEqual(data["periods"][0]["calories_total"], 4200)
+        self.assertEqual(data["periods"][0]["calories_avg"], 2100)
+        self.assertEqual(data["periods"][1]["calories_total"], 3000)
+        self.assertEqual(data["totals"]["days_logged"], 3)
+        self.assertEqual(data["totals"]["protein_avg"], 100)
+        self.assertEqual(data["totals"]["adherence"], round(2 / 3, 3))
+
+    def test_deleting_user_cascades_cleanly(self):
+        self._post("2025-03-03", 2000)
+        self.user.delete()
+        self.assertFalse(NutritionRollup.objects.exists())
+
+
+class CalorieLogBulkTests(TestCase):
+    def setUp(self):
+        self.user = make_user(current_calorie_goal=2000)
+
+    def test_bulk_upsert_json(self):
+        CalorieLog.objects.create(user=self.user, date=date(2025, 1, 1), calories=100)
+        rows = [{"date": f"2025-01-{d:02d}", "calories": 1800 + d, "protein": 120} for d in range(1, 31)]
+        rows.append({"date": "2025-01-05", "calories": 1})
+        rows.append({"date": "nope", "calories": 1})
+
+        response = self.client.post("/api/calorie-logs/bulk/", rows, content_type="application/json",
+                                    headers=auth_header(self.user))
+
+        data = response.json()
+        self.assertEqual((data["created"], data["updated"], data["invalid"]), (29, 1, 2))
+        self.assertEqual(data["results"][0]["status"], "updated")
+        self.assertIn("date", data["results"][31]["errors"])
+        self.assertEqual(CalorieLog.objects.get(user=self.user, date=date(2025, 1, 1)).calories, 1801)
+        self.assertEqual(CalorieLog.objects.filter(user=self.user).count(), 30)
+        month = NutritionRollup.objects.get(user=self.user, period="month", period_start=date(2025, 1, 1))
+        self.assertEqual(month.days_logged, 30)
+        self.assertEqual(month.calories, sum(r["calories"] for r in rows[:30]))
+
+    def test_bulk_upsert_ndjson(self):
+        body = "\n".join(json.dumps({"date": f"2025-02-{d:02d}", "calories": 2000}) for d in range(1, 11))
+        response = self.client.post("/api/calorie-logs/bulk/", body, content_type="application/x-ndjson",
+                                    headers=auth_header(self.user))
+        self.assertEqual(response.json()["created"], 10)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+
+    def _export(self, path, **headers):
+        return self.client.get(f"/api/export/{path}", headers={**auth_header(self.user), **headers})
+
+    def test_calorie_log_csv_export_streams_with_flat_memory(self):
+        start = date(1800, 1, 1)
+        CalorieLog.objects.bulk_create(
+            [CalorieLog(user=self.user, date=start + timedelta(days=i), calories=2000, protein=100.5, notes="ok")
+             for i in range(100_000)],
+            batch_size=5000,
+        )
+
+        response = self._export("calorie-logs.csv", Accept="text/csv")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+
+        tracemalloc.start()
+        lines = 0
+        size = 0
+        for chunk in response.streaming_content:
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(lines, 100_001)
+        self.assertLess(peak, 10 * 1024 * 1024)
+        self.assertLess(peak, size / 2)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        start = date(1800, 1, 1)
+        await CalorieLog.objects.abulk_create(
+            [CalorieLog(user=self.user, date=start + timedelta(days=i), calories=2000, protein=100.5, notes="ok")
+             for i in range(100_000)],
+            batch_size=5000,
+        )
+
+        response = await self.async_client.get("/api/export/calorie-logs.csv", headers=auth_header(self.user))
+        self.assertTrue(response.is_async)
+
+        # the first chunk pays for the query and the worker thread; the rest must not accumulate
+        chunks = aiter(response.streaming_content)
+        first = await anext(chunks)
+        tracemalloc.start()
+        lines = first.count(b"\n")
+        size = len(first)
+        async for chunk in chunks:
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(lines, 100_001)
+        self.assertLess(peak, size / 2)
+
+    def test_chat_ndjson_export(self):
+        session = ChatSession.objects.create(user=self.user, title="Chat")
+        ChatMessage.objects.create(session=session, is_user=True, message="hi")
+        ChatMessage.objects.create(session=session, is_user=False, message="hello")
+        ChatSession.objects.create(user=make_user("other@example.com"), title="Other")
+
+        response = self._export("chat.ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        self.assertEqual([r["message"] for r in rows], ["hi", "hello"])
+        self.assertEqual(rows[0]["session_title"], "Chat")
+
+    def test_calorie_log_csv_columns(self):
+        CalorieLog.objects.create(user=self.user, date=date(2025, 1, 1), calories=1500)
+        reader = csv.reader(io.StringIO(b"".join(self._export("calorie-logs.csv").streaming_content).decode()))
+        header, row = list(reader)
+        self.assertEqual(header, ["id", "date", "calories", "protein", "fat", "carbs", "notes"])
+        self.assertEqual(row[1:3], ["2025-01-01", "1500"])
+
+    def test_unknown_export(self):
+        self.assertEqual(self._export("everything.xml").status_code, 404)
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        self.user = make_user(weight_kg=80, current_calorie_goal=2500)
+
+    def _etag_round_trip(self):
+        first = self.client.get("/api/profile/", headers=auth_header(self.user))
+        etag = first["ETag"]
+        not_modified = self.client.get("/api/profile/", headers={**auth_header(self.user), "If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.client.patch("/api/profile/", {"weight_kg": 75}, content_type="application/json",
+                          headers=auth_header(self.user))
+        changed = self.client.get("/api/profile/", headers={**auth_header(self.user), "If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(changed.json()["weight_kg"], 75)
+
+    def test_database_cache_is_not_used_for_responses(self):
+        self.assertIsInstance(caches[settings.PROFILE_CACHE_ALIAS], DatabaseCache)
+        self._etag_round_trip()
+        self.client.get("/api/calorie-goal/", headers=auth_header(self.user))
+        headers = auth_header(self.user)
+        etag = self.client.get("/api/profile/", headers=headers)["ETag"]
+        for url_headers in (headers, {**headers, "If-None-Match": etag}):
+            with self.assertNumQueries(1):  # the user row, as before the cache existed
+                self.client.get("/api/profile/", headers=url_headers)
+            with self.assertNumQueries(1):
+                self.client.get("/api/calorie-goal/", headers=url_headers)
+
+    @override_settings(CACHES={**settings.CACHES, "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                       PROFILE_CACHE_ALIAS="local")
+    def test_shared_cache_serves_bodies_without_queries(self):
+        self._etag_round_trip()
+        pair = self.client.post("/api/token/obtain/", {"email": self.user.email, "password": "pass12345"}).json()
+        headers = {"Authorization": f"Bearer {pair['access']}"}  # claims: no user lookup
+        self.client.get("/api/profile/", headers=headers)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/profile/", headers=headers).json()["weight_kg"], 75)
+
+    @override_settings(CACHES={**settings.CACHES, "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                       PROFILE_CACHE_ALIAS="local")
+    def test_profile_etag_round_trip_and_invalidation(self):
+        first = self.client.get("/api/profile/", headers=auth_header(self.user))
+        etag = first["ETag"]
+        self.assertEqual(first.json()["weight_kg"], 80)
+
+        with mock.patch("api.views.RegisterSerializer.to_representation") as serialize:
+            cached = self.client.get("/api/profile/", headers=auth_header(self.user))
+            not_modified = self.client.get("/api/profile/", headers={**auth_header(self.user), "If-None-Match": etag})
+        serialize.assert_not_called()
+        self.assertEqual(cached.json()["weight_kg"], 80)
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.client.patch("/api/profile/", {"weight_kg": 75}, content_type="application/json",
+                          headers=auth_header(self.user))
+
+        changed = self.client.get("/api/profile/", headers={**auth_header(self.user), "If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(changed.json()["weight_kg"], 75)
+
+    def test_calorie_goal_etag(self):
+        first = self.client.get("/api/calorie-goal/", headers=auth_header(self.user))
+        self.assertEqual(first.json()["current_calorie_goal"], 2500)
+        second = self.client.get("/api/calorie-goal/", headers={**auth_header(self.user), "If-None-Match": first["ETag"]})
+        self.assertEqual(second.status_code, 304)
+        self.assertNotEqual(first["ETag"], self.client.get("/api/profile/", headers=auth_header(self.user))["ETag"])
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user(is_premium=True, current_calorie_goal=2100, weight_kg=70)
+        CalorieLog.objects.create(user=self.user, date=date(2025, 1, 1), calories=2000)
+
+    def _tokens(self):
+        return self.client.post(
+            "/api/token/obtain/", {"email": self.user.email, "password": "pass12345"}
+        ).json()
+
+    def test_list_skips_user_lookup(self):
+        headers = {"Authorization": f"Bearer {self._tokens()['access']}"}
+        with self.assertNumQueries(2):  # logs + prefetched meal entries
+            response = self.client.get("/api/calorie-logs/", headers=headers)
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def test_writes_by_deactivated_or_deleted_users_are_rejected(self):
+        headers = {"Authorization": f"Bearer {self._tokens()['access']}"}
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get("/api/calorie-logs/", headers=headers).status_code, 200)  # claims only
+        response = self.client.post("/api/calorie-logs/", {"date": "2025-01-02", "calories": 1800},
+                                    content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 401)
+
+        self.user.delete()
+        response = self.client.post("/api/meal-entries/", {"date": "2025-01-02", "calories": 300},
+                                    content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_deleted_mid_write_gets_401(self):
+        headers = {"Authorization": f"Bearer {self._tokens()['access']}"}
+
+        def deleted_meanwhile(*args, **kwargs):
+            CustomUser.objects.filter(pk=self.user.pk).delete()
+            raise IntegrityError("FOREIGN KEY constraint failed")
+
+        with mock.patch("api.meals.add_entry", side_effect=deleted_meanwhile):
+            response = self.client.post("/api/meal-entries/", {"date": "2025-01-02", "calories": 300},
+                                        content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_fields_load_lazily_in_one_query(self):
+        user = TokenUser.from_claims(self.user.id, {"email": self.user.email, "is_premium": True})
+        with self.assertNumQueries(1):
+            self.assertEqual(user.weight_kg, 70)
+            self.assertEqual(user.current_calorie_goal, 2100)
+            self.assertTrue(user.is_active)
+
+    def test_refresh_picks_up_profile_changes(self):
+        refresh = self._tokens()["refresh"]
+        CustomUser.objects.filter(pk=self.user.pk).update(current_calorie_goal=1800)
+        access = self.client.post("/api/token/refresh/", {"refresh": refresh}).json()["access"]
+        self.assertEqual(AccessToken(access)["current_calorie_goal"], 1800)
+
+    def test_profile_patch_keeps_fields_changed_since_the_token_was_issued(self):
+        headers = {"Authorization": f"Bearer {self._tokens()['access']}"}
+        CustomUser.objects.filter(pk=self.user.pk).update(is_premium=False, current_calorie_goal=2500)
+
+        response = self.client.patch("/api/profile/", {"first_name": "Ada"}, content_type="application/json",
+                                     headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Ada")
+        self.assertFalse(self.user.is_premium)
+        self.assertEqual(self.user.current_calorie_goal, 2500)
+
+    def test_profile_patch_then_get_serves_the_new_body(self):
+        headers = {"Authorization": f"Bearer {self._tokens()['access']}"}
+        first = self.client.get("/api/profile/", headers=headers)
+        self.client.patch("/api/profile/", {"first_name": "Ada"}, content_type="application/json", headers=headers)
+        second = self.client.get("/api/profile/", headers={**headers, "If-None-Match": first["ETag"]})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["first_name"], "Ada")
+
+    def test_saving_a_token_user_invalidates_the_profile(self):
+        etag = self.client.get("/api/profile/", headers={"Authorization": f"Bearer {self._tokens()['access']}"})["ETag"]
+        user = TokenUser.from_claims(self.user.id, {"email": self.user.email})
+        user.first_name = "Ada"
+        user.save(update_fields=["first_name"])
+        response = self.client.get("/api/profile/", headers=auth_header(self.user))
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_profile_and_goal_read_the_row_not_the_claims(self):
+        headers = {"Authorization": f"Bearer {self._tokens()['access']}"}
+        CustomUser.objects.filter(pk=self.user.pk).update(current_calorie_goal=2500)
+        self.assertEqual(self.client.get("/api/profile/", headers=headers).json()["current_calorie_goal"], 2500)
+        self.assertEqual(self.client.get("/api/calorie-goal/", headers=headers).json()["current_calorie_goal"], 2500)
+
+
+class RefreshRotationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tokens.get_blacklist().clear()
+        self.user = make_user()
+
+    def _obtain(self, **extra):
+        return self.client.post(
+            "/api/token/obtain/", {"email": self.user.email, "password": "pass12345", **extra}
+        ).json()
+
+    def _refresh(self, refresh):
+        return self.client.post("/api/token/refresh/", {"refresh": refresh})
+
+    def test_refresh_tokens_rotate_and_work_once(self):
+        first = self._obtain()["refresh"]
+        response = self._refresh(first)
+        self.assertEqual(response.status_code, 200)
+        second = response.json()["refresh"]
+        self.assertNotEqual(second, first)
+        self.assertEqual(RefreshToken(second)["family"], RefreshToken(first)["jti"])
+        self.assertEqual(self._refresh(second).status_code, 200)
+
+    def test_retry_within_grace_window_gets_the_same_pair(self):
+        first = self._obtain(client="mobile")["refresh"]
+        rotated = self._refresh(first).json()
+        retried = self._refresh(first)  # the first response was lost on the way
+        self.assertEqual(retried.status_code, 200)
+        self.assertEqual(retried.json(), rotated)
+        self.assertEqual(self._refresh(rotated["refresh"]).status_code, 200)
+
+    def test_reuse_after_grace_window_revokes_the_family(self):
+        first = self._obtain()["refresh"]
+        second = self._refresh(first).json()["refresh"]
+        cache.delete(f"jwt-successor:{RefreshToken(first)['jti']}")  # the window has passed
+        self.assertEqual(self._refresh(first).json()["code"], "token_reused")
+        self.assertEqual(self._refresh(second).json()["code"], "token_revoked")
+
+    @override_settings(JWT_REFRESH_REUSE_GRACE_SECONDS=0)
+    def test_reuse_revokes_the_family(self):
+        first = self._obtain()["refresh"]
+        second = self._refresh(first).json()["refresh"]
+        other_session = self._obtain()["refresh"]
+
+        reused = self._refresh(first)
+        self.assertEqual(reused.status_code, 401)
+        self.assertEqual(reused.json()["code"], "token_reused")
+        # the legitimate holder of the newest token is logged out too
+        revoked = self._refresh(second)
+        self.assertEqual(revoked.status_code, 401)
+        self.assertEqual(revoked.json()["code"], "token_revoked")
+        self.assertEqual(self._refresh(other_session).status_code, 200)
+
+    @override_settings(JWT_REFRESH_REUSE_GRACE_SECONDS=0)
+    def test_revocations_are_shared_between_workers(self):
+        first = self._obtain()["refresh"]
+        self._refresh(first)
+        tokens.get_blacklist().clear()  # another process: only the shared cache knows
+        self.assertEqual(self._refresh(first).status_code, 401)
+
+    def test_mobile_clients_get_longer_lifetimes(self):
+        web, mobile = self._obtain(), self._obtain(client="mobile")
+        lifetime = lambda token: token["exp"] - token["iat"]
+        self.assertEqual(lifetime(AccessToken(web["access"])), 5 * 60)
+        self.assertEqual(lifetime(AccessToken(mobile["access"])), 30 * 60)
+        self.assertEqual(lifetime(RefreshToken(mobile["refresh"])), 30 * 24 * 60 * 60)
+
+        rotated = self._refresh(mobile["refresh"]).json()
+        self.assertEqual(lifetime(AccessToken(rotated["access"])), 30 * 60)
+        self.assertEqual(RefreshToken(rotated["refresh"])["client"], "mobile")
+
+    def test_local_blacklist_evicts_expired_entries_first(self):
+        blacklist = tokens.Blacklist("default", max_local_entries=2)
+        now = time.time()
+        self.assertTrue(blacklist.add("a", now + 60))
+        blacklist._remember("b", now - 1)
+        self.assertTrue(blacklist.add("c", now + 60))
+        self.assertEqual(set(blacklist._local), {"a", "c"})
+        self.assertFalse(blacklist.add("a", now + 60))
+        self.assertIn("a", blacklist)
+        self.assertNotIn("b", blacklist)
+
+
+class SharedCacheCheckTests(TestCase):
+    LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+    def test_default_cache_is_shared(self):
+        self.assertEqual(checks.check_shared_caches(None), [])
+
+    def test_per_process_cache_fails_outside_debug(self):
+        with override_settings(CACHES=self.LOCMEM):
+            self.assertEqual([e.id for e in checks.check_shared_caches(None)],
+                             ["api.E002"] * len(checks.SHARED_CACHE_SETTINGS))
+        with override_settings(CACHES=self.LOCMEM, DEBUG=True):
+            self.assertEqual(checks.check_shared_caches(None), [])
+        with override_settings(TOKEN_BLACKLIST_CACHE_ALIAS="missing"):
+            self.assertEqual([e.id for e in checks.check_shared_caches(None)], ["api.E001"])
+
+    def test_profile_cache_needs_a_shared_cache(self):
+        caches = {**settings.CACHES, "local": self.LOCMEM["default"]}
+        with override_settings(CACHES=caches, PROFILE_CACHE_ALIAS="local"):
+            errors = checks.check_shared_caches(None)
+        self.assertEqual([e.id for e in errors], ["api.E002"])
+        self.assertIn("PROFILE_CACHE_ALIAS", errors[0].msg)
+
+    def test_replica_pins_need_a_shared_cache(self):
+        caches = {**settings.CACHES, "local": self.LOCMEM["default"]}
+        with override_settings(CACHES=caches, REPLICA_PIN_CACHE_ALIAS="local"):
+            errors = checks.check_shared_caches(None)
+        self.assertEqual([e.id for e in errors], ["api.E002"])
+        self.assertIn("REPLICA_PIN_CACHE_ALIAS", errors[0].msg)
+
+
+class PasswordHashingTests(TestCase):
+    def _login(self, user):
+        return self.client.post("/api/token/obtain/", {"email": user.email, "password": "pass12345"})
+
+    def test_new_passwords_use_argon2_with_configured_parameters(self):
+        user = make_user()
+        self.assertTrue(user.password.startswith("argon2$argon2id$v=19$m=19456,t=2,p=1$"))
+
+    def test_login_upgrades_older_hashes(self):
+        user = make_user()
+        user.password = make_password("pass12345", hasher="pbkdf2_sha256")
+        user.save(update_fields=["password"])
+
+        self.assertEqual(self._login(user).status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("argon2$"))
+
+        with override_settings(ARGON2_TIME_COST=3):
+            self.assertEqual(self._login(user).status_code, 200)
+        user.refresh_from_db()
+        self.assertIn(",t=3,", user.password)
+
+    @override_settings(PASSWORD_HASHERS=["api.hashers.ScryptPasswordHasher", "api.hashers.Argon2PasswordHasher"],
+                       SCRYPT_WORK_FACTOR=2 ** 15)
+    def test_scrypt(self):
+        user = make_user()
+        self.assertTrue(user.password.startswith("scrypt$32768$"))
+        self.assertTrue(user.check_password("pass12345"))
+        self.assertFalse(user.check_password("wrong"))
+
+    def test_hashing_runs_on_the_pool(self):
+        names = []
+        encode = hashers.hashers.Argon2PasswordHasher.encode
+
+        def record(self, *args, **kwargs):
+            names.append(threading.current_thread().name)
+            return encode(self, *args, **kwargs)
+
+        with mock.patch.object(hashers.hashers.Argon2PasswordHasher, "encode", record):
+            make_user()
+        self.assertTrue(names[0].startswith("password-hash"))
+        # a hash started on the pool runs inline rather than waiting on itself
+        self.assertEqual(hashers.offload(hashers.offload, lambda: threading.current_thread().name)[:13],
+                         "password-hash")
+
+
+class NutritionEngineTests(TestCase):
+    def test_batch_matches_scalar(self):
+        rows = [(30, "male", 180, 80, "moderate"), (45, "female", 165, 62.5, "sedentary"), (22, "male", 170, 20, "super")]
+        batch = nutrition.batch_targets(
+            [r[0] for r in rows], [r[1] == "male" for r in rows], [r[2] for r in rows], [r[3] for r in rows],
+            [nutrition.ACTIVITY_MULTIPLIERS[r[4]] for r in rows],
+        )
+        for i, row in enumerate(rows):
+            for field, value in nutrition.compute_targets(*row).items():
+                self.assertAlmostEqual(batch[field][i], value, places=6, msg=field)
+
+    def test_batch_and_scalar_round_halves_alike(self):
+        self.assertEqual(nutrition.round_tenth(0.25), 0.3)  # half up, not to even
+        # weights whose protein, fat or carbs land on (or float-wise near) a .x5 boundary
+        rows = [(30, gender, 170, weight / 20, "light") for weight in range(10, 2000) for gender in ("male", "female")]
+        batch = nutrition.batch_targets(
+            [r[0] for r in rows], [r[1] == "male" for r in rows], [r[2] for r in rows], [r[3] for r in rows],
+            [nutrition.ACTIVITY_MULTIPLIERS[r[4]] for r in rows],
+        )
+        for i, row in enumerate(rows):
+            for field, value in nutrition.compute_targets(*row).items():
+                self.assertEqual(batch[field][i], value, msg=f"{field} for weight {row[3]}")
+
+    def _register(self):
+        response = self.client.post("/api/register/", {
+            "email": "new@example.com", "username": "new", "password": "pass12345", "age": 30,
+            "gender": "male", "height_cm": 180, "weight_kg": 80, "activity_level": "moderate",
+            "calorie_goal_type": "lose",
+        })
+        self.assertEqual(response.status_code, 201)
+        return CustomUser.objects.get(email="new@example.com")
+
+    def test_profile_patch_recomputes_targets(self):
+        user = self._register()
+        self.assertEqual(user.current_calorie_goal, user.loss_calories)
+
+        response = self.client.patch("/api/profile/", {"weight_kg": 90, "calorie_goal_type": "gain"},
+                                     content_type="application/json", headers=auth_header(user))
+
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        expected = nutrition.compute_targets(30, "male", 180, 90, "moderate")
+        self.assertEqual(user.gain_calories, expected["gain_calories"])
+        self.assertEqual(user.current_calorie_goal, expected["gain_calories"])
+        self.assertEqual(user.current_protein_goal, expected["gain_protein"])
+
+    def test_recompute_targets_command(self):
+        user = self._register()
+        CustomUser.objects.filter(pk=user.pk).update(weight_kg=70, bmr=None)
+        make_user("incomplete@example.com")
+
+        call_command("recompute_targets", chunk_size=1, stdout=io.StringIO())
+
+        user.refresh_from_db()
+        expected = nutrition.compute_targets(30, "male", 180, 70, "moderate")
+        self.assertAlmostEqual(user.bmr, expected["bmr"])
+        self.assertAlmostEqual(user.current_calorie_goal, expected["loss_calories"])
+        self.assertIsNone(CustomUser.objects.get(email="incomplete@example.com").bmr)
+
+
+class AiJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_meal_cache().clear()
+        self.user = make_user()
+
+    def _run_due(self):
+        return [jobs.run(job_id) for job_id in jobs.claim(10, "test")]
+
+    def test_chat_job_round_trip(self):
+        response = self.client.post("/api/ai/?async=1", {"message": "Hello"}, content_type="application/json",
+                                    headers=auth_header(self.user))
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+        self.assertFalse(ChatMessage.objects.exists())
+
+        with mock.patch("api.jobs.completion", return_value=completion_response("Hi there")) as completion:
+            self._run_due()
+        completion.assert_called_once()
+
+        data = self.client.get(f"/api/ai/jobs/{job_id}/", headers=auth_header(self.user)).json()
+        self.assertEqual(data["status"], "succeeded")
+        self.assertEqual(data["result"]["reply"], "Hi there")
+        self.assertEqual(ChatMessage.objects.count(), 2)
+        self.assertEqual(self._run_due(), [])
+
+    def test_meal_job(self):
+        response = self.client.post("/api/analyze-meal/?async=1", {"image": SimpleUploadedFile("m.jpg", jpeg_bytes())},
+                                    headers=auth_header(self.user))
+        self.assertEqual(response.status_code, 202)
+        with mock.patch("api.jobs.completion", return_value=completion_response("20g protein")):
+            job, = self._run_due()
+        self.assertEqual(job.result, {"macros": "20g protein"})
+        job.refresh_from_db()
+        self.assertNotIn("image_url", job.payload)  # the upload is not kept for the retention period
+        self.assertIn("cache_key", job.payload)
+
+    @override_settings(AI_JOB_MAX_ATTEMPTS=2, AI_JOB_BACKOFF_SECONDS=60)
+    def test_failed_job_retries_with_backoff(self):
+        session = ChatSession.objects.create(user=self.user)
+        job = jobs.enqueue(self.user, "chat", {"session_id": session.id, "message": "Hi"})
+
+        with mock.patch("api.jobs.completion", side_effect=RuntimeError("upstream down")):
+            retried, = self._run_due()
+            self.assertEqual(retried.status, "queued")
+            self.assertGreaterEqual((retried.run_after - timezone.now()).total_seconds(), 59)
+            self.assertEqual(self._run_due(), [])
+
+            AiJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            failed, = self._run_due()
+        self.assertEqual((failed.status, failed.attempts, failed.error), ("failed", 2, "upstream down"))
+
+    @override_settings(AI_JOB_MAX_ATTEMPTS=2, AI_JOB_STALE_SECONDS=60)
+    def test_stale_jobs_use_up_attempts(self):
+        job = jobs.enqueue(self.user, "chat", {})
+        long_ago = timezone.now() - timedelta(minutes=5)
+        for expected in [("queued", 1), ("failed", 2)]:
+            self.assertEqual(jobs.claim(10, "dead-worker"), [job.id])
+            AiJob.objects.filter(pk=job.pk).update(locked_at=long_ago)
+            jobs.requeue_stale()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), expected)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.claim(10, "test"), [])
+
+    def test_run_taken_over_by_another_worker_is_dropped(self):
+        session = ChatSession.objects.create(user=self.user)
+        job = jobs.enqueue(self.user, "chat", {"session_id": session.id, "message": "Hi"})
+
+        def slow_completion(*args, **kwargs):
+            # meanwhile this run looks stale and another worker claims the job
+            AiJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(days=1))
+            jobs.requeue_stale()
+            jobs.claim(1, "other-worker")
+            return completion_response("late reply")
+
+        jobs.claim(1, "slow-worker")
+        with mock.patch("api.jobs.completion", side_effect=slow_completion):
+            result = jobs.run(job.id)
+
+        self.assertEqual((result.status, result.locked_by), ("running", "other-worker"))
+        self.assertIsNone(result.result)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    @override_settings(AI_JOB_RETENTION_SECONDS=3600)
+    def test_finished_jobs_are_pruned(self):
+        old, recent, pending = (jobs.enqueue(self.user, "chat", {}) for _ in range(3))
+        AiJob.objects.filter(pk=old.pk).update(status="succeeded", finished_at=timezone.now() - timedelta(hours=2))
+        AiJob.objects.filter(pk=recent.pk).update(status="failed", finished_at=timezone.now())
+        self.assertEqual(jobs.prune_finished(), 1)
+        self.assertEqual(set(AiJob.objects.values_list("pk", flat=True)), {recent.pk, pending.pk})
+
+    def test_other_users_job_is_hidden(self):
+        job = jobs.enqueue(make_user("other@example.com"), "chat", {})
+        response = self.client.get(f"/api/ai/jobs/{job.id}/", headers=auth_header(self.user))
+        self.assertEqual(response.status_code, 404)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+
+    def _upstream(self, reply="Drink water"):
+        return completion_response(reply)
+
+    def _ask(self, message="Hi", session_id=None, idempotency_key=None):
+        headers = auth_header(self.user)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        data = {"message": message, **({"session_id": session_id} if session_id else {})}
+        return self.client.post("/api/ai/", data, content_type="application/json", headers=headers)
+
+    def test_retried_submit_with_idempotency_key_is_replayed(self):
+        with mock.patch("api.llm.completion", return_value=self._upstream()) as post:
+            first = self._ask(idempotency_key="abc")
+            second = self._ask(idempotency_key="abc")
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(ChatSession.objects.count(), 1)
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+    def test_repeated_message_is_a_new_turn(self):
+        with mock.patch("api.llm.completion", side_effect=[self._upstream("Sure"), self._upstream("Done")]) as post:
+            session_id = self._ask("ok").json()["session_id"]
+            second = self._ask("ok", session_id=session_id)
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(second.json()["reply"], "Done")
+        self.assertEqual(list(ChatMessage.objects.order_by("id").values_list("message", flat=True)),
+                         ["ok", "Sure", "ok", "Done"])
+
+    def test_failed_request_is_not_replayed(self):
+        failing = llm.LLMUnavailable("busy")
+        with mock.patch("api.llm.completion", side_effect=[failing, self._upstream()]) as post:
+            self.assertEqual(self._ask().status_code, 503)
+            self.assertEqual(self._ask().status_code, 200)
+        self.assertEqual(post.call_count, 2)
+
+    def test_waits_for_request_running_in_another_worker(self):
+        key = singleflight.request_key(self.user.pk, None, "Hi", "sync")
+        record = AiRequest.objects.create(key=key, user=self.user)
+
+        def finish(_):
+            AiRequest.objects.filter(pk=record.pk).update(
+                status="done", response={"reply": "From the other worker", "session_id": "1"}, status_code=200
+            )
+
+        with mock.patch("api.singleflight.time.sleep", side_effect=finish), \
+                mock.patch("api.llm.completion") as post:
+            response = self._ask()
+
+        post.assert_not_called()
+        self.assertEqual(response.json()["reply"], "From the other worker")
+
+    def test_in_process_callers_share_one_call(self):
+        calls = InFlightCallsProbe()
+        flight = singleflight.InFlightCalls()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", calls))) for _ in range(5)]
+        with mock.patch("api.singleflight._Call", WaitCountingCall):
+            for t in threads:
+                t.start()
+            # release only once the leader is running and the other four wait on it
+            deadline = time.monotonic() + 5
+            while calls.count < 1 or flight._calls["k"].done.waiters < 4:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.001)
+        calls.release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [1] * 5)
+        self.assertEqual(calls.count, 1)
+
+
+class WaitCountingEvent(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self.waiters = 0
+        self._count_lock = threading.Lock()
+
+    def wait(self, timeout=None):
+        with self._count_lock:
+            self.waiters += 1
+        return super().wait(timeout)
+
+
+class WaitCountingCall(singleflight._Call):
+    def __init__(self):
+        super().__init__()
+        self.done = WaitCountingEvent()
+
+
+class InFlightCallsProbe:
+    def __init__(self):
+        self.count = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.count += 1
+        self.release.wait()
+        return self.count
+
+
+def query_plan(queryset):
+    return queryset.explain()
+
+
+def assert_uses_index(test, queryset, table, index=None):
+    """Fail if ``table`` is read with a full scan, or ``index`` is missing from the plan."""
+    plan = query_plan(queryset)
+    test.assertNotRegex(plan, rf"(?m)(Seq Scan on {table}\b|SCAN {table}(?! USING)\b)", plan)
+    if index:
+        test.assertIn(index, plan)
+
+
+class QueryPlanTests(TestCase):
+    """Seeds realistic volumes and pins the plans and query counts of the hot querysets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"u{i}", email=f"u{i}@example.com", current_calorie_goal=2000) for i in range(40)
+        ])
+        start = date(2024, 1, 1)
+        CalorieLog.objects.bulk_create(
+            [CalorieLog(user=u, date=start + timedelta(days=d), calories=2000) for u in users for d in range(365)],
+            batch_size=5000,
+        )
+        sessions = ChatSession.objects.bulk_create(
+            [ChatSession(user=u, title=f"s{n}") for u in users for n in range(15)], batch_size=5000
+        )
+        ChatMessage.objects.bulk_create(
+            [ChatMessage(session=s, is_user=m % 2 == 0, message="m" * 40) for s in sessions for m in range(20)],
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.user = users[0]
+        cls.session = sessions[0]
+
+    def test_chat_window_uses_session_timestamp_index(self):
+        qs = ChatMessage.objects.filter(session=self.session).order_by("-timestamp", "-id")[:20]
+        assert_uses_index(self, qs, "api_chatmessage", "chatmessage_session_ts_idx")
+
+    def test_chat_history_uses_user_created_index(self):
+        view = ChatHistoryView()
+        view.request = mock.Mock(user=self.user)
+        qs = view.get_queryset().order_by("-created_at", "-id")[:20]
+        assert_uses_index(self, qs, "api_chatsession", "chatsession_user_created_idx")
+        assert_uses_index(self, qs, "api_chatmessage", "chatmessage_session_ts_idx")
+
+    def test_calorie_log_range_uses_user_date_index(self):
+        qs = CalorieLog.objects.filter(user=self.user, date__gte=date(2024, 3, 1), date__lte=date(2024, 3, 31))
+        assert_uses_index(self, qs.order_by("-date"), "api_calorielog")
+
+    def test_export_chat_uses_indexes(self):
+        qs = export.DATASETS["chat"][0](self.user)
+        assert_uses_index(self, qs, "api_chatmessage")
+        assert_uses_index(self, qs, "api_chatsession")
+
+    def test_hot_endpoint_query_counts(self):
+        headers = auth_header(self.user)
+        with self.assertNumQueries(2):
+            self.client.get("/api/ai/chat-history/", headers=headers)
+        with self.assertNumQueries(3):
+            self.client.get(f"/api/ai/chat-history/{self.session.id}/messages/", headers=headers)
+        with self.assertNumQueries(2):
+            self.client.get("/api/calorie-logs/?from=2024-03-01&to=2024-03-31&fields=date,calories", headers=headers)
+        with self.assertNumQueries(2):
+            self.client.get("/api/calorie-logs/summary/?period=month&from=2024-01-01&to=2024-12-31", headers=headers)
+
+
+class DatabaseConnectionTests(TestCase):
+    def test_asgi_turns_off_persistent_connections(self):
+        from core.asgi import disable_persistent_connections
+
+        databases = {
+            "default": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True},
+            "forever": {"CONN_MAX_AGE": None},
+            "pooled": {"CONN_MAX_AGE": 0, "OPTIONS": {"pool": {"max_size": 4}}},
+        }
+        with self.assertLogs("core.asgi", "WARNING"):
+            disable_persistent_connections(databases)
+        self.assertEqual([db["CONN_MAX_AGE"] for db in databases.values()], [0, 0, 0])
+        self.assertEqual(databases["pooled"]["OPTIONS"], {"pool": {"max_size": 4}})
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.state = replicas.RequestState(RequestFactory().get("/"))
+        self.state.replica = "replica1"
+
+    def test_opt_in_is_per_handler_and_action(self):
+        get, post = RequestFactory().get("/"), RequestFactory().post("/")
+        logs = resolve("/api/calorie-logs/").func
+        self.assertTrue(replicas._opted_in(get, logs))
+        self.assertFalse(replicas._opted_in(post, logs))
+        self.assertTrue(replicas._opted_in(get, resolve("/api/ai/chat-history/").func))
+        self.assertFalse(replicas._opted_in(get, resolve("/api/ai/jobs/1/").func))
+
+    def test_reads_stay_on_primary_once_the_request_writes(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(CalorieLog))  # outside a request
+        token = replicas._state.set(self.state)
+        try:
+            self.assertEqual(router.db_for_read(CalorieLog), "replica1")
+            self.assertEqual(router.db_for_write(CalorieLog), "default")
+            self.assertEqual(router.db_for_read(CalorieLog), "default")
+        finally:
+            replicas._state.reset(token)
+
+    def test_recent_writer_is_pinned_to_primary(self):
+        self.state.request.user = self.user
+        self.assertEqual(self.state.read_alias(), "replica1")
+        replicas.pin(self.user.pk)
+        fresh = replicas.RequestState(self.state.request)
+        fresh.replica = "replica1"
+        self.assertEqual(fresh.read_alias(), "default")
+
+    def test_replicas_are_not_migrated(self):
+        router = replicas.ReplicaRouter()
+        self.assertFalse(router.allow_migrate("replica1", "api"))
+        self.assertTrue(router.allow_migrate("default", "api"))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "set DATABASE_REPLICA_URLS to run against a replica")
+class ReadReplicaTests(TransactionTestCase):
+    # committed rows, so the replica connection sees them
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        CalorieLog.objects.create(user=self.user, date=date(2025, 1, 1), calories=2000)
+        self.replica = connections[settings.DATABASE_REPLICAS[0]]
+
+    def _list(self):
+        with CaptureQueriesContext(self.replica) as replica, CaptureQueriesContext(connection) as primary:
+            response = self.client.get("/api/calorie-logs/", headers=auth_header(self.user))
+        self.assertEqual(response.status_code, 200)
+        # pin lookups in the database-backed cache always hit the primary
+        data_queries = [q for q in primary.captured_queries if "django_cache" not in q["sql"]]
+        return len(replica.captured_queries), len(data_queries)
+
+    @override_settings(DATABASE_REPLICAS=["replica1"])
+    def test_list_reads_from_replica_until_the_user_writes(self):
+        on_replica, on_primary = self._list()
+        self.assertGreater(on_replica, 0)
+        self.assertEqual(on_primary, 0)
+
+        response = self.client.post("/api/calorie-logs/", {"date": "2025-01-02", "calories": 1800},
+                                    content_type="application/json", headers=auth_header(self.user))
+        self.assertEqual(response.status_code, 201)
+        on_replica, on_primary = self._list()
+        self.assertEqual(on_replica, 0)
+        self.assertGreater(on_primary, 0)
+
+
+class SeedLoadDataTests(TestCase):
+    def test_seeds_consistent_history_and_can_be_rerun(self):
+        args = dict(users=3, days=14, sessions=2, messages=4, stdout=io.StringIO())
+        call_command("seed_load_data", **args)
+        call_command("seed_load_data", clear=True, **args)
+
+        users = CustomUser.objects.filter(email__startswith="loadtest-")
+        self.assertEqual(users.count(), 3)
+        self.assertTrue(users[0].check_password("loadtest-password"))
+        self.assertEqual(ChatSession.objects.count(), 6)
+        self.assertEqual(ChatMessage.objects.count(), 24)
+        log = CalorieLog.objects.filter(user__in=users).first()
+        self.assertEqual(log.calories, sum(e.calories for e in log.entries.all()))
+        self.assertTrue(NutritionRollup.objects.filter(user=log.user).exists())
+
+
+class CalorieLogListTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        start = date(2024, 1, 1)
+        CalorieLog.objects.bulk_create(
+            [CalorieLog(user=self.user, date=start + timedelta(days=d), calories=1500 + d) for d in range(120)]
+        )
+        CalorieLog.objects.create(user=make_user("other@example.com"), date=start, calories=9999)
+
+    def _get(self, url):
+        return self.client.get(url, headers=auth_header(self.user))
+
+    def test_pages_walk_history_newest_first_without_overlap(self):
+        seen = []
+        url = "/api/calorie-logs/?page_size=50"
+        while url:
+            body = self._get(url).json()
+            seen.extend(row["date"] for row in body["results"])
+            url = body["next"]
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(seen, sorted(set(seen), reverse=True))
+
+    def test_date_range_filters(self):
+        body = self._get("/api/calorie-logs/?from=2024-02-01&to=2024-02-10").json()
+        self.assertEqual([row["date"] for row in body["results"]][::-1], [f"2024-02-{d:02d}" for d in range(1, 11)])
+
+    def test_fields_projection(self):
+        body = self._get("/api/calorie-logs/?fields=date,calories&page_size=1").json()
+        self.assertEqual(body["results"], [{"date": "2024-04-29", "calories": 1619}])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self._get("/api/calorie-logs/?from=2024-02-31").status_code, 400)
+        self.assertEqual(self._get("/api/calorie-logs/?from=garbage").status_code, 400)
+        self.assertEqual(self._get("/api/calorie-logs/?to=03/01/2024").status_code, 400)
+        self.assertEqual(self._get("/api/calorie-logs/summary/?from=garbage").status_code, 400)
+        self.assertEqual(self._get("/api/calorie-logs/summary/?to=2024-02-31").status_code, 400)
+        self.assertEqual(self._get("/api/calorie-logs/?from=2024-03-01&to=2024-02-01").status_code, 400)
+        self.assertEqual(self._get("/api/calorie-logs/?fields=date,user").status_code, 400)
+
+
+class FoodSearchTests(TestCase):
+    def setUp(self):
+        foods.reset_index()
+        self.user = make_user()
+        self.apple = Food.objects.create(name="Apple, raw", external_id="1", calories=52, protein=0.3, fat=0.2, carbs=14)
+        self.pie = Food.objects.create(name="Apple pie", brand="Bakery", external_id="2", calories=237, fat=11, carbs=34)
+        self.banana = Food.objects.create(name="Banana", external_id="3", calories=89, protein=1.1, fat=0.3, carbs=23)
+        Food.objects.create(name="Crème brûlée", external_id="4", calories=300)
+
+    def test_index_prefix_and_fuzzy(self):
+        index = foods.FoodIndex(Food.objects.values_list("id", "name", "brand"))
+        self.assertEqual(index.prefix("APP", 10), [self.pie.id, self.apple.id])
+        self.assertEqual(index.fuzzy("banan", 10, 0.3), [self.banana.id])
+        self.assertEqual(index.search("creme brulee", 5), [Food.objects.get(external_id="4").id])
+        self.assertEqual(index.search("zzz", 5), [])
+
+    def test_search_endpoint(self):
+        headers = auth_header(self.user)
+        body = self.client.get("/api/foods/search/?q=apple", headers=headers).json()
+        self.assertEqual([f["name"] for f in body["results"]], ["Apple pie", "Apple, raw"])
+        self.assertEqual(self.client.get("/api/foods/search/?q=a", headers=headers).status_code, 400)
+        self.assertEqual(self.client.get("/api/foods/search/?q=apple").status_code, 401)
+
+    def test_load_foods_upserts_rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "foods.tsv")
+            with open(path, "w") as f:
+                f.write("code\tproduct_name\tbrands\tenergy-kcal_100g\tproteins_100g\tfat_100g\tcarbohydrates_100g\n")
+                f.write("001\tOat milk\tOatly,Other\t46\t1\t1.5\t6.7\n")
+                f.write("002\t\tNo name\t10\t0\t0\t0\n")
+                f.write("001\tOat drink\tOatly\t45\t1\t1.5\t6.6\n")
+            call_command("load_foods", path, stdout=io.StringIO())
+            call_command("load_foods", path, stdout=io.StringIO())
+        food = Food.objects.get(source="off")
+        self.assertEqual((food.name, food.brand, food.calories), ("Oat drink", "Oatly", 45))
+
+    def test_log_entries_compute_totals(self):
+        headers = auth_header(self.user)
+        response = self.client.post("/api/calorie-logs/", {
+            "date": "2025-01-01",
+            "entries": [{"food": self.apple.id, "grams": 200}, {"food": self.banana.id, "grams": 100}],
+        }, content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual((body["calories"], body["carbs"]), (193, 51.0))
+        entry = body["entries"][0]
+        self.assertEqual(
+            {k: entry[k] for k in ("name", "food", "grams", "calories", "protein", "fat", "carbs")},
+            {"name": "Apple, raw", "food": self.apple.id, "grams": 200.0, "calories": 104,
+             "protein": 0.6, "fat": 0.4, "carbs": 28.0},
+        )
+
+        response = self.client.patch(f"/api/calorie-logs/{body['id']}/", {
+            "entries": [{"food": self.pie.id, "grams": 100}],
+        }, content_type="application/json", headers=headers)
+        self.assertEqual((response.json()["calories"], len(response.json()["entries"])), (237, 1))
+        self.assertEqual(NutritionRollup.objects.get(user=self.user, period="week").calories, 237)
+
+        response = self.client.post("/api/calorie-logs/", {
+            "date": "2025-01-02", "entries": [{"food": 999999, "grams": 100}],
+        }, content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post("/api/calorie-logs/", {"date": "2025-01-03"}, headers=headers).status_code, 400)
+
+
+class FoodIndexRefreshTests(TransactionTestCase):
+    # committed rows, so the background rebuild's connection sees them
+    def setUp(self):
+        foods.reset_index()
+        self.user = make_user()
+        Food.objects.create(name="Apple pie", external_id="1", calories=237)
+
+    def tearDown(self):
+        foods.reset_index()
+
+    def _names(self):
+        body = self.client.get("/api/foods/search/?q=apple&limit=5", headers=auth_header(self.user)).json()
+        return [f["name"] for f in body["results"]]
+
+    def test_catalogue_changes_rebuild_off_the_request_path(self):
+        self.assertEqual(self._names(), ["Apple pie"])
+        Food.objects.create(name="Applesauce", external_id="2", calories=68)
+        self.assertEqual(self._names(), ["Apple pie"])  # served from the previous index meanwhile
+        foods.wait_for_rebuild()
+        self.assertEqual(self._names(), ["Apple pie", "Applesauce"])
+
+    def test_loads_in_another_process_reach_this_one(self):
+        self.assertEqual(self._names(), ["Apple pie"])
+        Food.objects.bulk_create([Food(name="Apple juice", external_id="3", calories=46)])  # no signals
+        self.assertEqual(self._names(), ["Apple pie"])
+        foods.invalidate_index()  # what load_foods does, through the shared version row
+        self._names()
+        foods.wait_for_rebuild()
+        self.assertEqual(self._names(), ["Apple juice", "Apple pie"])
+
+
+class MealEntryTests(TestCase):
+    def setUp(self):
+        self.user = make_user(current_calorie_goal=2000)
+        self.headers = auth_header(self.user)
+        self.oats = Food.objects.create(name="Oats", external_id="oats", calories=380, protein=13, fat=7, carbs=60)
+
+    def _add(self, **data):
+        response = self.client.post("/api/meal-entries/", {"date": "2025-03-03", **data},
+                                    content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def _totals(self):
+        log = CalorieLog.objects.get(user=self.user, date=date(2025, 3, 3))
+        return log.calories, log.protein, log.fat, log.carbs
+
+    def _rollup(self):
+        return NutritionRollup.objects.get(user=self.user, period="month", period_start=date(2025, 3, 1))
+
+    def test_entries_accumulate_into_day_totals(self):
+        self._add(meal="breakfast", food=self.oats.id, grams=50)
+        self._add(meal="lunch", name="Sandwich", calories=450, protein=20, fat=15, carbs=50)
+        self.assertEqual(self._totals(), (640, 26.5, 18.5, 80.0))
+        rollup = self._rollup()
+        self.assertEqual((rollup.days_logged, rollup.calories, rollup.days_on_goal), (1, 640, 0))
+
+    def test_concurrent_style_writes_do_not_overwrite_each_other(self):
+        # Two devices that each saw an empty day both add an entry.
+        log = CalorieLog.objects.create(user=self.user, date=date(2025, 3, 3), calories=0)
+        stale = CalorieLog.objects.get(pk=log.pk)
+        self._add(calories=300)
+        self._add(calories=500)
+        stale.refresh_from_db()
+        self.assertEqual(stale.calories, 800)
+        self.assertEqual(MealEntry.objects.filter(log=log).count(), 2)
+
+    def test_update_move_and_delete_shift_totals(self):
+        first = self._add(calories=300, protein=10)
+        second = self._add(food=self.oats.id, grams=100)
+        url = f"/api/meal-entries/{second['id']}/"
+
+        response = self.client.patch(url, {"grams": 50}, content_type="application/json", headers=self.headers)
+        self.assertEqual(response.json()["calories"], 190)
+        self.assertEqual(self._totals(), (490, 16.5, 3.5, 30.0))
+
+        response = self.client.patch(url, {"date": "2025-03-04"}, content_type="application/json", headers=self.headers)
+        self.assertEqual(response.json()["date"], "2025-03-04")
+        self.assertEqual(self._totals()[0], 300)
+        self.assertEqual(CalorieLog.objects.get(user=self.user, date=date(2025, 3, 4)).calories, 190)
+
+        self.client.delete(f"/api/meal-entries/{first['id']}/", headers=self.headers)
+        self.assertFalse(CalorieLog.objects.filter(user=self.user, date=date(2025, 3, 3)).exists())
+        rollup = self._rollup()
+        self.assertEqual((rollup.days_logged, rollup.calories), (1, 190))
+
+    def test_moving_a_days_last_entry_drops_the_empty_day(self):
+        entry = self._add(calories=300)
+        self.client.patch(f"/api/meal-entries/{entry['id']}/", {"date": "2025-03-04"},
+                          content_type="application/json", headers=self.headers)
+        self.assertEqual(list(CalorieLog.objects.values_list("date", flat=True)), [date(2025, 3, 4)])
+        rollup = self._rollup()
+        self.assertEqual((rollup.days_logged, rollup.calories), (1, 300))
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        self.assertEqual(self._rollup().days_logged, 1)
+
+    def test_list_filters_by_date_and_user(self):
+        self._add(calories=100)
+        self._add(calories=200, date="2025-03-04")
+        other = make_user("other@example.com")
+        self.client.post("/api/meal-entries/", {"date": "2025-03-03", "calories": 999},
+                         content_type="application/json", headers=auth_header(other))
+        body = self.client.get("/api/meal-entries/?date=2025-03-03", headers=self.headers).json()
+        self.assertEqual([e["calories"] for e in body["results"]], [100])
+
+    def test_day_total_writes_do_not_replace_meal_entries(self):
+        self._add(calories=300)
+        self._add(calories=400)
+        log = CalorieLog.objects.get(user=self.user, date=date(2025, 3, 3))
+        response = self.client.patch(f"/api/calorie-logs/{log.id}/", {"calories": 1500},
+                                     content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("/api/meal-entries/", response.json()["non_field_errors"][0])
+
+        response = self.client.post("/api/calorie-logs/bulk/", [{"date": "2025-03-03", "calories": 1800}],
+                                    content_type="application/json", headers=self.headers)
+        self.assertEqual(response.json()["results"][0]["status"], "invalid")
+        self.assertEqual(sorted(log.entries.values_list("calories", flat=True)), [300, 400])
+        self.assertEqual(self._totals()[0], 700)
+
+        response = self.client.patch(f"/api/calorie-logs/{log.id}/", {"notes": "cheat day"},
+                                     content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(log.entries.count(), 2)
+
+    def test_day_total_writes_replace_a_day_total(self):
+        self.client.post("/api/calorie-logs/bulk/", [{"date": "2025-03-03", "calories": 1500}],
+                         content_type="application/json", headers=self.headers)
+        log = CalorieLog.objects.get(user=self.user, date=date(2025, 3, 3))
+        self.client.patch(f"/api/calorie-logs/{log.id}/", {"calories": 1600},
+                          content_type="application/json", headers=self.headers)
+        self.client.post("/api/calorie-logs/bulk/", [{"date": "2025-03-03", "calories": 1800}],
+                         content_type="application/json", headers=self.headers)
+        self.assertEqual(list(log.entries.values_list("name", "calories")), [("Daily total", 1800)])
+        self.assertEqual(self._totals()[0], 1800)
+
+    def test_requires_calories_or_food(self):
+        response = self.client.post("/api/meal-entries/", {"date": "2025-03-03", "meal": "snack"},
+                                    content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/api/meal-entries/", {"date": "2025-03-03", "food": self.oats.id},
+                                    content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    AI_RATE_LIMITS={"free": "60/hour", "premium": "600/hour"},
+    AI_RATE_BURST={"free": 3, "premium": 10},
+    AI_DAILY_TOKEN_BUDGET={"free": 1000, "premium": 100000},
+    AI_IMAGE_REQUEST_COST=2,
+)
+class AiThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+
+    def _upstream(self):
+        return completion_response("Sure", prompt_tokens=300, completion_tokens=50)
+
+    def _ask(self, user, message):
+        return self.client.post("/api/ai/", {"message": message}, content_type="application/json",
+                                headers=auth_header(user))
+
+    def test_bucket_refills_over_time(self):
+        self.assertEqual([throttling.take(self.user, now=0) for _ in range(3)], [None] * 3)
+        self.assertAlmostEqual(throttling.take(self.user, now=0), 60)
+        self.assertIsNone(throttling.take(self.user, now=60))
+        self.assertIsNotNone(throttling.take(self.user, now=60))
+
+    def test_taking_a_token_is_a_single_conditional_update(self):
+        throttling.take(self.user, now=0)
+        # no read-modify-write for concurrent requests to interleave with
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNone(throttling.take(self.user, now=0))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(ctx.captured_queries[0]["sql"].startswith("UPDATE"))
+        self.assertEqual(AiRateBucket.objects.get(user=self.user).full_at, 2 * 60)
+
+    def test_bucket_is_shared_across_processes(self):
+        throttling.take(self.user, now=0)
+        cache.clear()  # nothing of the bucket lives in a per-process cache
+        throttling.take(self.user, now=0)
+        throttling.take(self.user, now=0)
+        self.assertIsNotNone(throttling.take(self.user, now=0))
+
+    def test_free_tier_is_throttled_before_premium(self):
+        premium = make_user("premium@example.com", is_premium=True)
+        with mock.patch("api.llm.completion", return_value=self._upstream()) as post:
+            free = [self._ask(self.user, f"q{i}").status_code for i in range(4)]
+            paid = [self._ask(premium, f"q{i}").status_code for i in range(4)]
+        self.assertEqual(free, [200, 200, 200, 429])
+        self.assertEqual(paid, [200] * 4)
+        self.assertEqual(post.call_count, 7)
+        self.assertIn("Retry-After", self._ask(self.user, "again"))
+
+    @override_settings(AI_RATE_BURST={"free": 10, "premium": 10})
+    def test_usage_is_recorded_and_budget_rejects_early(self):
+        with mock.patch("api.llm.completion", return_value=self._upstream()) as post:
+            self.assertEqual(self._ask(self.user, "one").status_code, 200)
+            self.assertEqual(self._ask(self.user, "two").status_code, 200)
+            self.assertEqual(usage.tokens_used(self.user.pk), 700)
+            self.assertEqual(self._ask(self.user, "three").status_code, 200)
+            response = self._ask(self.user, "four")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.assertEqual(post.call_count, 3)
+        self.assertIsNone(throttling.take(self.user))  # rejected by the budget, not the bucket
+        row = AiUsage.objects.get(user=self.user)
+        self.assertEqual((row.requests, row.prompt_tokens, row.completion_tokens), (3, 900, 150))
+
+    def test_meal_analysis_requires_auth_and_costs_more(self):
+        upload = lambda color: {"image": SimpleUploadedFile("m.jpg", jpeg_bytes(color=color))}
+        self.assertEqual(self.client.post("/api/analyze-meal/", upload("red")).status_code, 401)
+        get_meal_cache().clear()
+        with mock.patch("api.llm.completion", return_value=self._upstream()):
+            first = self.client.post("/api/analyze-meal/", upload("red"), headers=auth_header(self.user))
+            second = self.client.post("/api/analyze-meal/", upload("blue"), headers=auth_header(self.user))
+        self.assertEqual((first.status_code, second.status_code), (200, 429))
+
+    async def test_stream_records_usage_and_is_throttled(self):
+        with MockCompletionsServer() as server, override_settings(TOGETHER_API_URL=server.url):
+            for _ in range(3):
+                response = await self.async_client.post(
+                    "/api/ai/stream/", {"message": "Hi"}, content_type="application/json",
+                    headers=auth_header(self.user),
+                )
+                b"".join([chunk async for chunk in response.streaming_content])
+            throttled = await self.async_client.post(
+                "/api/ai/stream/", {"message": "Hi"}, content_type="application/json", headers=auth_header(self.user)
+            )
+        self.assertEqual(throttled.status_code, 429)
+        self.assertTrue(server.requests[0]["stream_options"]["include_usage"])
+        row = await AiUsage.objects.aget(user=self.user)
+        self.assertEqual((row.requests, row.prompt_tokens, row.completion_tokens), (3, 36, 9))
+
+
+@override_settings(METRICS_TOKEN="scrape", METRICS_DIR="")
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+
+    def _counter(self, name, labels):
+        return metrics.snapshot()["counters"].get(name, {}).get(labels, 0)
+
+    def _histogram(self, name, labels):
+        return metrics.snapshot()["histograms"].get(name, {}).get(labels)
+
+    def test_request_latency_queries_and_sizes_are_recorded(self):
+        labels = 'method="POST",route="api/calorie-logs/bulk/",status="200"'
+        before = self._counter("http_requests_total", labels)
+        rows = [{"date": f"2024-01-0{i}", "calories": 2000} for i in range(1, 4)]
+        response = self.client.post("/api/calorie-logs/bulk/", rows, content_type="application/json",
+                                    headers=auth_header(self.user))
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self._counter("http_requests_total", labels), before + 1)
+        queries = self._histogram("http_request_db_queries", 'route="api/calorie-logs/bulk/"')
+        self.assertGreater(queries[-2], 0)
+        self.assertGreater(self._histogram("http_request_size_bytes", 'route="api/calorie-logs/bulk/"')[-2], 0)
+        self.assertGreater(self._histogram("http_response_size_bytes", 'route="api/calorie-logs/bulk/"')[-1], 0)
+
+    def test_unmatched_paths_share_one_series(self):
+        before = self._counter("http_requests_total", 'method="GET",route="unmatched",status="404"')
+        self.client.get("/no/such/page/")
+        self.client.get("/another/")
+        self.assertEqual(self._counter("http_requests_total", 'method="GET",route="unmatched",status="404"'), before + 2)
+
+    def test_llm_latency_and_tokens_are_recorded(self):
+        labels = 'kind="completion",model="m",route="background"'
+        before = self._counter("llm_tokens_total", labels)
+        metrics.record_llm("m", 0.2, "ok", {"prompt_tokens": 30, "completion_tokens": 7})
+        self.assertEqual(self._counter("llm_tokens_total", labels), before + 7)
+        latency = self._histogram("llm_request_duration_seconds", 'model="m",outcome="ok",route="background"')
+        self.assertGreater(latency[metrics.LATENCY_BUCKETS.index(0.25)], 0)
+
+    def test_exposition_format(self):
+        totals = {
+            "counters": {"http_requests_total": {'method="GET",route="x",status="200"': 3}},
+            "histograms": {"http_request_db_queries": {'route="x"': [1, 0, 2, 0, 0, 0, 0, 0, 0, 0, 4, 3]}},
+        }
+        text = metrics.render(totals)
+        self.assertIn("# TYPE http_requests_total counter", text)
+        self.assertIn('http_requests_total{method="GET",route="x",status="200"} 3', text)
+        self.assertIn('http_request_db_queries_bucket{route="x",le="0"} 1', text)
+        self.assertIn('http_request_db_queries_bucket{route="x",le="2"} 3', text)
+        self.assertIn('http_request_db_queries_bucket{route="x",le="+Inf"} 3', text)
+        self.assertIn('http_request_db_queries_sum{route="x"} 4', text)
+
+    def test_endpoint_requires_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer scrape"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    def test_totals_are_summed_across_worker_files(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            labels = 'kind="prompt",model="shared",route="background"'
+            other = {"counters": {"llm_tokens_total": {labels: 100}}, "histograms": {}}
+            with open(os.path.join(directory, "1.json"), "w") as f:
+                json.dump(other, f)
+            metrics.inc("llm_tokens_total", 5, model="shared", kind="prompt", route="background")
+            metrics.flush()
+
+            self.assertTrue(os.path.exists(os.path.join(directory, f"{os.getpid()}.json")))
+            mine = self._counter("llm_tokens_total", labels)
+            self.assertEqual(metrics.collect()["counters"]["llm_tokens_total"][labels], mine + 100)
+
+    async def test_streamed_reply_tokens_are_attributed_to_its_route(self):
+        await cache.aclear()
+        labels = f'kind="completion",model="{settings.TOGETHER_MODEL}",route="api/ai/stream/"'
+        before = self._counter("llm_tokens_total", labels)
+        with MockCompletionsServer() as server, override_settings(TOGETHER_API_URL=server.url):
+            response = await self.async_client.post(
+                "/api/ai/stream/", {"message": "Hi"}, content_type="application/json", headers=auth_header(self.user)
+            )
+            b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(self._counter("llm_tokens_total", labels), before + len(MockCompletionsHandler.tokens))
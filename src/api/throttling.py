@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from rest_framework.throttling import BaseThrottle
+
+from . import usage
+from .models import AiRateBucket
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'30/hour' -> (30, 3600), in the style of DRF throttle rates."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def take(user, cost=1, now=None):
+    """Take ``cost`` tokens from the user's AI bucket.
+
+    Returns None when allowed, otherwise the seconds until enough tokens
+    have refilled. The bucket holds AI_RATE_BURST tokens and refills at
+    AI_RATE_LIMITS, both per tier. It is stored GCRA style as the single
+    "theoretical arrival time" at which the bucket would be full again, in
+    an AiRateBucket row shared by every worker. Taking tokens is one
+    conditional UPDATE, so concurrent requests cannot both spend the last
+    token.
+    """
+    tier = usage.tier(user)
+    count, period = parse_rate(settings.AI_RATE_LIMITS[tier])
+    interval = period / count
+    capacity = settings.AI_RATE_BURST[tier] * interval
+    now = time.time() if now is None else now
+    step = cost * interval
+
+    for _ in range(2):
+        # max(full_at, now) + step - now <= capacity  <=>  full_at <= now + capacity - step
+        if AiRateBucket.objects.filter(user_id=user.pk, full_at__lte=now + capacity - step).update(
+            full_at=Greatest(F('full_at'), Value(now)) + step
+        ):
+            return None
+        full_at = AiRateBucket.objects.filter(user_id=user.pk).values_list('full_at', flat=True).first()
+        if full_at is not None:
+            wait = max(full_at, now) + step - now - capacity
+            if wait > 0:
+                return wait
+            continue  # refilled between the two queries
+        if step > capacity:
+            return step - capacity
+        _, created = AiRateBucket.objects.get_or_create(user_id=user.pk, defaults={'full_at': now + step})
+        if created:
+            return None
+    return interval
+
+
+def check(user, cost=1):
+    """Budget and rate checks for views outside DRF; None if allowed, else seconds to wait."""
+    if usage.remaining_tokens(user) <= 0:
+        return usage.seconds_until_reset()
+    return take(user, cost)
+
+
+class AiRateThrottle(BaseThrottle):
+    """Per-user token bucket for AI endpoints, tiered by is_premium.
+
+    Views may set ``ai_request_cost`` to charge more than one token.
+    """
+
+    def allow_request(self, request, view):
+        if not request.user.is_authenticated:
+            return True
+        self.retry_after = take(request.user, getattr(view, 'ai_request_cost', 1))
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
+
+
+class AiTokenBudgetThrottle(BaseThrottle):
+    """Rejects AI requests once the user's daily upstream token budget is spent."""
+
+    def allow_request(self, request, view):
+        if not request.user.is_authenticated:
+            return True
+        return usage.remaining_tokens(request.user) > 0
+
+    def wait(self):
+        return usage.seconds_until_reset()
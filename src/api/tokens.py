@@ -0,0 +1,131 @@
+"""Refresh-token rotation with reuse detection.
+
+Every refresh token carries a ``family`` claim: the jti of the refresh token
+issued at login, copied to each token rotated from it. Refreshing revokes
+the presented token's jti until it expires. Presenting a revoked jti again
+means a copy leaked or a client replayed it, so the whole family is revoked
+and whoever holds its newest token has to log in again. The exception is a
+retry within JWT_REFRESH_REUSE_GRACE_SECONDS of the rotation, typically a
+mobile client that never received the response: it gets the same successor
+pair again. Access tokens are not checked; they stay valid for the rest of
+their (short) lifetime.
+
+Revocations live in TOKEN_BLACKLIST_CACHE_ALIAS, each timing out with the
+token it revokes, fronted by a bounded in-process map of known revocations.
+Revocation is permanent, so local hits never go stale.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.settings import api_settings
+
+FAMILY_CLAIM = 'family'
+CLIENT_CLAIM = 'client'
+CLIENTS = ('web', 'mobile')
+
+
+class Blacklist:
+    def __init__(self, alias, max_local_entries):
+        self.alias = alias
+        self.max_local_entries = max_local_entries
+        self._local = {}  # key -> expiry as a unix timestamp
+        self._lock = threading.Lock()
+
+    def _remember(self, key, expires):
+        with self._lock:
+            self._local[key] = expires
+            if len(self._local) > self.max_local_entries:
+                now = time.time()
+                for stale in [k for k, exp in self._local.items() if exp <= now]:
+                    del self._local[stale]
+                while len(self._local) > self.max_local_entries:
+                    del self._local[next(iter(self._local))]
+
+    def __contains__(self, key):
+        with self._lock:
+            expires = self._local.get(key)
+        if expires is not None and expires > time.time():
+            return True
+        expires = caches[self.alias].get(key)
+        if expires is None:
+            return False
+        self._remember(key, expires)
+        return True
+
+    def add(self, key, expires):
+        """Revoke ``key`` until ``expires``; False if it was already revoked, by any worker."""
+        timeout = expires - time.time()
+        if timeout <= 0:
+            return True
+        added = caches[self.alias].add(key, expires, timeout)
+        self._remember(key, expires)
+        return added
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+_blacklist = None
+
+
+def get_blacklist():
+    global _blacklist
+    if _blacklist is None:
+        _blacklist = Blacklist(settings.TOKEN_BLACKLIST_CACHE_ALIAS, settings.TOKEN_BLACKLIST_LOCAL_ENTRIES)
+    return _blacklist
+
+
+def lifetimes(client):
+    """(access, refresh) lifetimes for a client type."""
+    return settings.JWT_LIFETIMES.get(client, settings.JWT_LIFETIMES['web'])
+
+
+def issue(refresh, client, family=None):
+    """Stamp ``refresh`` for ``client`` and return the serialized token pair."""
+    access_lifetime, refresh_lifetime = lifetimes(client)
+    refresh[CLIENT_CLAIM] = client
+    refresh[FAMILY_CLAIM] = family or refresh[api_settings.JTI_CLAIM]
+    refresh.set_exp(lifetime=refresh_lifetime)
+    access = refresh.access_token
+    access.set_exp(from_time=refresh.current_time, lifetime=access_lifetime)
+    return {"refresh": str(refresh), "access": str(access)}
+
+
+def family(refresh):
+    # tokens issued before rotation existed start their own family
+    return refresh.payload.get(FAMILY_CLAIM) or refresh[api_settings.JTI_CLAIM]
+
+
+def family_revoked(refresh):
+    return f"jwt-family:{family(refresh)}" in get_blacklist()
+
+
+def consume(refresh):
+    """Revoke ``refresh`` as it is rotated.
+
+    Returns ``(True, None)`` the first time, ``(True, pair)`` for a retry
+    within the grace window, with the pair that remember_successor() stored,
+    and ``(False, None)`` after revoking the family on any other reuse.
+    """
+    blacklist = get_blacklist()
+    jti = refresh[api_settings.JTI_CLAIM]
+    if blacklist.add(f"jwt:{jti}", refresh['exp']):
+        return True, None
+    successor = caches[blacklist.alias].get(f"jwt-successor:{jti}")
+    if successor is not None:
+        return True, successor
+    # the newest token in the family can live for one more refresh lifetime
+    refresh_lifetime = lifetimes(refresh.payload.get(CLIENT_CLAIM))[1]
+    blacklist.add(f"jwt-family:{family(refresh)}", time.time() + refresh_lifetime.total_seconds())
+    return False, None
+
+
+def remember_successor(jti, pair):
+    """Keep the pair rotated from ``jti`` for retries of the same refresh."""
+    if settings.JWT_REFRESH_REUSE_GRACE_SECONDS > 0:
+        caches[settings.TOKEN_BLACKLIST_CACHE_ALIAS].set(
+            f"jwt-successor:{jti}", pair, settings.JWT_REFRESH_REUSE_GRACE_SECONDS
+        )
@@ -1,18 +1,26 @@
 from django.urls import include, path
 from rest_framework_simplejwt.views import TokenRefreshView, TokenObtainPairView
-from .views import  AiView, CalorieLogViewSet, UserProfileView, RegisterView, ChatHistoryView, MacroFromImageView
+from .views import  AiView, AiJobView, CalorieGoalView, ai_stream_view, CalorieLogViewSet, MealEntryViewSet, UserProfileView, RegisterView, ChatHistoryView, ChatSessionMessagesView, MacroFromImageView, MealCacheStatsView, ExportView, FoodSearchView
 from rest_framework.routers import DefaultRouter
 
 calorie_router = DefaultRouter()
 calorie_router.register(r'calorie-logs', CalorieLogViewSet, basename='calorie-log')
+calorie_router.register(r'meal-entries', MealEntryViewSet, basename='meal-entry')
 
 urlpatterns = [
     path('register/', RegisterView.as_view()),
     path('ai/', AiView.as_view()),
+    path('ai/stream/', ai_stream_view),
+    path('ai/jobs/<int:job_id>/', AiJobView.as_view()),
     path('ai/chat-history/', ChatHistoryView.as_view()),
+    path('ai/chat-history/<int:session_id>/messages/', ChatSessionMessagesView.as_view()),
     path('token/obtain/', TokenObtainPairView.as_view()),
     path('analyze-meal/', MacroFromImageView.as_view(), name='analyze-meal'),
+    path('analyze-meal/cache-stats/', MealCacheStatsView.as_view()),
     path('token/refresh/', TokenRefreshView.as_view()),
     path('', include(calorie_router.urls)),
+    path('foods/search/', FoodSearchView.as_view()),
     path('profile/', UserProfileView.as_view()),
+    path('calorie-goal/', CalorieGoalView.as_view()),
+    path('export/<str:dataset>.<str:fmt>', ExportView.as_view()),
 ]
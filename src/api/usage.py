@@ -0,0 +1,45 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AiUsage
+
+
+def tier(user):
+    return 'premium' if user.is_premium else 'free'
+
+
+def record(user_id, usage):
+    """Add one upstream response's ``usage`` block to the user's daily totals."""
+    usage = usage or {}
+    prompt = int(usage.get('prompt_tokens') or 0)
+    completion = int(usage.get('completion_tokens') or 0)
+    day = timezone.localdate()
+
+    AiUsage.objects.get_or_create(user_id=user_id, date=day)
+    AiUsage.objects.filter(user_id=user_id, date=day).update(
+        requests=F('requests') + 1,
+        prompt_tokens=F('prompt_tokens') + prompt,
+        completion_tokens=F('completion_tokens') + completion,
+    )
+
+
+def tokens_used(user_id, day=None):
+    # read from the row record() updates with F() expressions: a cached
+    # counter would need an atomic incr, which the database cache lacks
+    row = AiUsage.objects.filter(user_id=user_id, date=day or timezone.localdate()).values(
+        'prompt_tokens', 'completion_tokens'
+    ).first()
+    return row['prompt_tokens'] + row['completion_tokens'] if row else 0
+
+
+def remaining_tokens(user):
+    return settings.AI_DAILY_TOKEN_BUDGET[tier(user)] - tokens_used(user.pk)
+
+
+def seconds_until_reset():
+    now = timezone.localtime()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    return (tomorrow - now).total_seconds()
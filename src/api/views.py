@@ -1,15 +1,37 @@
-import base64
-from django.shortcuts import render
-from rest_framework.parsers import MultiPartParser
+from datetime import timedelta
+from django.shortcuts import render, get_object_or_404
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Substr
+from rest_framework.parsers import JSONParser, MultiPartParser
+from django.db import transaction
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-import requests
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+import json
+import math
+import httpx
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework import viewsets, permissions, status
-from .models import CalorieLog, CustomUser, ChatMessage, ChatSession
-from .serializers import CalorieLogSerializer, RegisterSerializer, ChatMessageSerializer, ChatSessionSerializer
+from rest_framework.decorators import action
+from rest_framework.negotiation import BaseContentNegotiation
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import export, foods, jobs, llm, meals, replicas, rollups, singleflight, throttling, usage
+from .models import AiJob, CalorieLog, CustomUser, ChatMessage, ChatSession, MealEntry
+from .serializers import ITEMIZED_DAY_ERROR, CalorieLogSerializer, FoodSerializer, MealEntryDetailSerializer, RegisterSerializer, ChatMessageSerializer, ChatSessionListSerializer
+from .parsers import NDJSONParser
+from .throttling import AiRateThrottle, AiTokenBudgetThrottle
+from .pagination import CalorieLogCursorPagination, MealEntryCursorPagination, ChatSessionCursorPagination, ChatMessageCursorPagination
+from .authentication import ClaimsJWTAuthentication
+from .cache import cached_user_response, content_key, get_meal_cache
+from .chat import build_messages
+from .images import InvalidImage, data_url, meal_messages, prepare_image
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.sites.shortcuts import get_current_site
@@ -19,6 +41,9 @@ from django.conf import settings
 
 # Create your views here.
 
+LAST_MESSAGE_PREVIEW_LENGTH = 120
+
+
 class RegisterView(APIView):
     permission_classes = [] 
     def post(self, request):
@@ -32,12 +57,25 @@ class RegisterView(APIView):
 
 
 
+def _profile_user(request):
+    # request.user may be a TokenUser whose claims lag the row by up to a token
+    # lifetime: profile responses are built from, and saved to, the row itself.
+    user = request.user
+    return user if type(user) is CustomUser else CustomUser.objects.get(pk=user.pk)
+
+
 class CalorieGoalView(APIView):
     permission_classes = [IsAuthenticated]
+    read_replicas = {'get'}
 
     def get(self, request):
-        user = request.user
-        data = {
+        return cached_user_response(
+            request, "calorie-goal", lambda: self.goal_data(_profile_user(request))
+        )
+
+    @staticmethod
+    def goal_data(user):
+        return {
             "bmr": user.bmr,
             "maintenance_calories": user.maintenance_calories,
             "gain_calories": user.gain_calories,
@@ -53,59 +91,90 @@ class CalorieGoalView(APIView):
             "loss_fat": user.loss_fat,
             "loss_carbs": user.loss_carbs,
         }
-        return Response(data)
 
 
 
+def _llm_error_body(error):
+    """Body and status for an upstream failure: 503 when no model could answer, else 502."""
+    if isinstance(error, llm.LLMUnavailable):
+        body = {"error": "AI service unavailable", "detail": str(error)}
+        if error.retry_after:
+            body["retry_after"] = math.ceil(error.retry_after)
+        return body, status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"error": "AI error", "detail": str(error)}, status.HTTP_502_BAD_GATEWAY
+
+
+def _llm_error_response(error):
+    body, code = _llm_error_body(error)
+    response = Response(body, status=code)
+    if body.get("retry_after"):
+        response["Retry-After"] = str(body["retry_after"])
+    return response
+
+
 class MacroFromImageView(APIView):
     parser_classes = [MultiPartParser]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [AiTokenBudgetThrottle, AiRateThrottle]
+
+    @property
+    def ai_request_cost(self):
+        return settings.AI_IMAGE_REQUEST_COST
+
+    def check_throttles(self, request):
+        pass  # deferred to post(): a meal-cache hit makes no upstream call, so it is free
 
     def post(self, request):
         image_file = request.FILES.get('image')
         if not image_file:
             return Response({"error": "No image provided."}, status=400)
 
-        image_bytes = image_file.read()
-        base64_image = base64.b64encode(image_bytes).decode()
-
-        payload = {
-            "model": "meta-llama/Llama-Vision-Free",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": "What are the estimated macros (protein, carbs, fat) in grams for this meal?"
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 512,
-            "temperature": 0.5
-        }
+        cache = get_meal_cache()
+        cache_key = content_key(image_file.chunks(), namespace=f"meal:{settings.TOGETHER_MODEL}")
+        cached = cache.get(cache_key)
+        if cached is not None:
+            response = Response({"macros": cached})
+            response["X-Cache"] = "HIT"
+            return response
+        super().check_throttles(request)
 
-        headers = {
-            "Authorization": f"Bearer {settings.TOGETHER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        try:
+            image_bytes, mime_type = prepare_image(
+                image_file,
+                max_dimension=settings.MEAL_IMAGE_MAX_DIMENSION,
+                output_format=settings.MEAL_IMAGE_FORMAT,
+                quality=settings.MEAL_IMAGE_QUALITY,
+            )
+        except InvalidImage:
+            return Response({"error": "Unsupported or corrupt image."}, status=400)
+        image_url = data_url(image_bytes, mime_type)
+
+        if request.query_params.get('async'):
+            job = jobs.enqueue(request.user, 'meal', {"image_url": image_url, "cache_key": cache_key})
+            return Response(jobs.job_status(job), status=status.HTTP_202_ACCEPTED)
 
         try:
-            res = requests.post("https://api.together.xyz/v1/chat/completions", headers=headers, json=payload)
-            res.raise_for_status()
-            result = res.json()["choices"][0]["message"]["content"]
-            return Response({"macros": result})
-        except Exception as e:
-            return Response({"error": "Failed to get response from Together AI", "details": str(e)}, status=500)
+            data = llm.completion(meal_messages(image_url), max_tokens=512)
+        except llm.LLMError as e:
+            return _llm_error_response(e)
+        usage.record(request.user.pk, data.get("usage"))
+        result = llm.content(data)
+        cache.set(cache_key, result)
+        response = Response({"macros": result})
+        response["X-Cache"] = "MISS"
+        return response
+
+
+class MealCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_meal_cache().stats())
+
 
 class AiView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [AiTokenBudgetThrottle, AiRateThrottle]
 
     def post(self, request):
         user = request.user
@@ -114,103 +183,393 @@ class AiView(APIView):
 
         if not user_input:
             return Response({"error": "No message provided"}, status=status.HTTP_400_BAD_REQUEST)
-            
+
+        session = None
         if session_id:
             try:
                 session = ChatSession.objects.get(id=session_id, user=user)
-            except ChatSession.DoesNotExist:
+            except (ChatSession.DoesNotExist, ValueError):
                 return Response({"error": "Session not found."}, status=404)
-        else:
+
+        mode = 'async' if request.query_params.get('async') else 'sync'
+        idempotency_key = request.headers.get('Idempotency-Key')
+        key = singleflight.request_key(user.pk, session_id, user_input, mode, idempotency_key)
+        try:
+            body, code = singleflight.run(key, user, lambda: self.reply(user, session, user_input, mode),
+                                          replay=bool(idempotency_key))
+        except singleflight.StillRunning:
+            return Response({"error": "An identical request is still in progress."}, status=409)
+        if body is None:
+            return Response({"error": "AI error"}, status=code or 500)
+        response = Response(body, status=code)
+        if body.get("retry_after"):
+            response["Retry-After"] = str(body["retry_after"])
+        return response
+
+    def reply(self, user, session, user_input, mode):
+        if session is None:
             session = ChatSession.objects.create(user=user, title=user_input)
-            session_id = str(session.id)
-
-        user_data = RegisterSerializer(user).data
-        user_details = (
-            f"User details: Name: {user_data.get('first_name', '')} {user_data.get('last_name', '')}, "
-            f"Age: {user_data.get('age', '')}, Gender: {user_data.get('gender', '')}, "
-            f"Height: {user_data.get('height_cm', '')} cm, Weight: {user_data.get('weight_kg', '')} kg, "
-            f"Activity Level: {user_data.get('activity_level', '')}, "
-            f"Current Calorie Goal: {user_data.get('current_calorie_goal', '')}, "
-            f"BMR: {user_data.get('bmr', '')}, "
-            f"Macros (protein/fat/carbs): {user_data.get('current_protein_goal', '')}/"
-            f"{user_data.get('current_fat_goal', '')}/{user_data.get('current_carbs_goal', '')} grams."
-        )
-        messages = [{
-            "role": "system",
-            "content": f"You are a helpful nutritionist, {user_details} Respond concisely and personally."
-        }]
-        for msg in ChatMessage.objects.filter(session=session).order_by('timestamp'):
-            messages.append({
-                "role": "user" if msg.is_user else "assistant",
-                "content": msg.message
-            })
-
-        messages.append({"role": "user", "content": user_input})
-
-        headers = {
-            "Authorization": f"Bearer {settings.TOGETHER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "meta-llama/Llama-Vision-Free",
-            "messages": messages,
-            "temperature": 0.5,
-            "max_tokens": 1024
-        }
+        session_id = str(session.id)
+
+        if mode == 'async':
+            job = jobs.enqueue(user, 'chat', {"session_id": session.id, "message": user_input})
+            return {**jobs.job_status(job), "session_id": session_id}, status.HTTP_202_ACCEPTED
+
+        messages = build_messages(user, session, user_input)
 
-        res = requests.post("https://api.together.xyz/v1/chat/completions", json=data, headers=headers)
-        if res.status_code != 200:
-            return Response({"error": "AI error", "detail": res.text}, status=500)
+        try:
+            data = llm.completion(messages, max_tokens=1024)
+        except llm.LLMError as e:
+            return _llm_error_body(e)
 
-        ai_reply = res.json()["choices"][0]["message"]["content"]
+        usage.record(user.pk, data.get("usage"))
+        ai_reply = llm.content(data)
 
         ChatMessage.objects.create(session=session, is_user=True, message=user_input)
         ChatMessage.objects.create(session=session, is_user=False, message=ai_reply)
 
-        return Response({
+        return {
             "reply": ai_reply,
             "session_id": session_id
-        })
+        }, 200
+
+
+def _sse(data, event=None):
+    payload = f"data: {json.dumps(data)}\n\n"
+    if event:
+        payload = f"event: {event}\n{payload}"
+    return payload
+
+
+@csrf_exempt
+async def ai_stream_view(request):
+    """Async variant of AiView that streams the reply as server-sent events."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed."}, status=405)
+
+    try:
+        auth = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=401)
+    if auth is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    user = auth[0]
+
+    wait = await sync_to_async(throttling.check)(user)
+    if wait is not None:
+        response = JsonResponse({"detail": f"Request was throttled. Expected available in {math.ceil(wait)} seconds."}, status=429)
+        response["Retry-After"] = str(math.ceil(wait))
+        return response
+
+    try:
+        body = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({"error": "Expected a JSON object."}, status=400)
+    user_input = body.get("message")
+    session_id = body.get("session_id")
+
+    if not user_input:
+        return JsonResponse({"error": "No message provided"}, status=400)
+
+    new_session = not session_id
+    if new_session:
+        session = await ChatSession.objects.acreate(user=user, title=user_input)
+    else:
+        try:
+            session = await ChatSession.objects.aget(id=session_id, user=user)
+        except (ChatSession.DoesNotExist, ValueError):
+            return JsonResponse({"error": "Session not found."}, status=404)
+    session_id = str(session.id)
+
+    messages = await sync_to_async(build_messages)(user, session, user_input)
+
+    async def events():
+        saved = False
+        try:
+            yield _sse({"session_id": session_id}, event="session")
+            parts = []
+            reported = {}
+            try:
+                async for token in llm.stream_chat_completion(messages, on_usage=reported.update):
+                    parts.append(token)
+                    yield _sse({"token": token})
+            except (llm.LLMError, httpx.HTTPError, ValueError) as e:
+                yield _sse({"error": "AI error", "detail": str(e)}, event="error")
+                return
+
+            ai_reply = "".join(parts)
+            await sync_to_async(usage.record)(user.pk, reported)
+            await ChatMessage.objects.acreate(session=session, is_user=True, message=user_input)
+            await ChatMessage.objects.acreate(session=session, is_user=False, message=ai_reply)
+            saved = True
+            await sync_to_async(replicas.pin)(user.pk)
+            yield _sse({"reply": ai_reply, "session_id": session_id}, event="done")
+        finally:
+            if new_session and not saved:
+                # failed or aborted before any message was stored: don't leave an empty chat behind
+                await ChatSession.objects.filter(pk=session.pk).adelete()
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class AiJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(
+            AiJob.objects.only('id', 'kind', 'status', 'result', 'error', 'attempts', 'created_at', 'finished_at'),
+            id=job_id, user=request.user,
+        )
+        return Response(jobs.job_status(job))
+
 
-class ChatHistoryView(APIView):
+class ChatHistoryView(ListAPIView):
     permission_classes = [IsAuthenticated]
+    read_replicas = {'get'}
+    serializer_class = ChatSessionListSerializer
+    pagination_class = ChatSessionCursorPagination
+
+    def get_queryset(self):
+        messages = ChatMessage.objects.filter(session=OuterRef('pk'))
+        latest = messages.order_by('-timestamp', '-id')
+        count = messages.order_by().values('session').annotate(n=Count('id')).values('n')
+        return ChatSession.objects.filter(user=self.request.user).annotate(
+            message_count=Coalesce(Subquery(count), 0),
+            last_message=Substr(Subquery(latest.values('message')[:1]), 1, LAST_MESSAGE_PREVIEW_LENGTH),
+            last_message_at=Subquery(latest.values('timestamp')[:1]),
+        ).only('id', 'title', 'created_at')
+
+
+class ChatSessionMessagesView(ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = ChatMessageSerializer
+    pagination_class = ChatMessageCursorPagination
+
+    def get_queryset(self):
+        session = get_object_or_404(ChatSession.objects.only('id'), id=self.kwargs['session_id'], user=self.request.user)
+        return ChatMessage.objects.filter(session=session)
+
+
+class FoodSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
     def get(self, request):
-            sessions = ChatSession.objects.filter(user=request.user).order_by('-created_at')
-            serializer = ChatSessionSerializer(sessions, many=True)
-            return Response(serializer.data)
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            return Response({"error": "q must be at least 2 characters."}, status=400)
+        try:
+            limit = min(int(request.query_params.get('limit', settings.FOOD_SEARCH_LIMIT)), 50)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=400)
+        results = foods.search(query, max(limit, 1))
+        return Response({"results": FoodSerializer(results, many=True).data})
+
+
+def _date_param(request, name):
+    """The ``name`` query param as a date, None if absent; ValueError if it does not parse."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)  # None when malformed, ValueError when well-formed but impossible
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
 
 
 class CalorieLogViewSet(viewsets.ModelViewSet):
     serializer_class = CalorieLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    read_replicas = {'list'}
+    pagination_class = CalorieLogCursorPagination
 
     def get_queryset(self):
-        return CalorieLog.objects.filter(user=self.request.user).order_by('-date')
+        return CalorieLog.objects.filter(user=self.request.user).prefetch_related('entries').order_by('-date', '-id')
+
+    def list(self, request, *args, **kwargs):
+        # ?from=&to= bound the date range; ?fields=date,calories projects columns.
+        try:
+            date_from = _date_param(request, 'from')
+            date_to = _date_param(request, 'to')
+        except ValueError:
+            return Response({"error": "Dates must be YYYY-MM-DD."}, status=400)
+        if date_from and date_to and date_from > date_to:
+            return Response({"error": "'from' must not be after 'to'."}, status=400)
+
+        fields = None
+        if request.query_params.get('fields'):
+            fields = [f.strip() for f in request.query_params['fields'].split(',') if f.strip()]
+            unknown = set(fields) - set(CalorieLogSerializer.Meta.fields)
+            if unknown:
+                return Response({"error": f"Unknown fields: {', '.join(sorted(unknown))}."}, status=400)
+
+        queryset = self.get_queryset()
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        if fields:
+            # date and id are the cursor position, so they are always loaded.
+            queryset = queryset.only('id', 'date', *(f for f in fields if f != 'entries'))
+            if 'entries' not in fields:
+                queryset = queryset.prefetch_related(None)
+
+        page = self.paginate_queryset(queryset)
+        serializer = CalorieLogSerializer(page, many=True, fields=fields)
+        return self.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        rows = request.data.get('logs') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list):
+            return Response({"error": "Expected a list of logs."}, status=400)
+        if len(rows) > settings.CALORIE_LOG_BULK_MAX_ROWS:
+            return Response({"error": f"At most {settings.CALORIE_LOG_BULK_MAX_ROWS} logs per request."}, status=400)
+
+        results = []
+        valid = {}
+        for index, row in enumerate(rows):
+            serializer = CalorieLogSerializer(data=row)
+            if not serializer.is_valid():
+                results.append({"index": index, "status": "invalid", "errors": serializer.errors})
+                continue
+            if 'entries' in serializer.validated_data:
+                results.append({"index": index, "status": "invalid", "errors": {"entries": ["Not supported in bulk uploads."]}})
+                continue
+            day = serializer.validated_data['date']
+            if day in valid:
+                results.append({"index": index, "status": "invalid", "errors": {"date": ["Duplicate date in batch."]}})
+                continue
+            valid[day] = (index, serializer.validated_data)
+            results.append(None)
+
+        user = request.user
+        fields = ['calories', 'protein', 'fat', 'carbs', 'notes']
+        with transaction.atomic():
+            # Uploaded rows are day totals; they must not replace days logged meal by meal.
+            for day in meals.itemized_days(user.id, valid):
+                index, _ = valid.pop(day)
+                results[index] = {"index": index, "status": "invalid", "errors": ITEMIZED_DAY_ERROR}
+            existing = {
+                log['date']: log
+                for log in CalorieLog.objects.select_for_update().filter(user=user, date__in=list(valid)).values(
+                    'date', 'calories', 'protein', 'fat', 'carbs', 'calorie_goal'
+                )
+            }
+            logs = [
+                CalorieLog(user=user, calorie_goal=user.current_calorie_goal, **data)
+                for _, data in valid.values()
+            ]
+            CalorieLog.objects.bulk_create(
+                logs,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=fields,
+            )
+            changes = []
+            for log in logs:
+                old = existing.get(log.date)
+                if old is not None:
+                    log.calorie_goal = old['calorie_goal']
+                changes.append((old, rollups.log_values(log)))
+            rollups.record_changes(user.id, changes)
+            # Each day's single day-total entry follows its new totals.
+            meals.reset_entries(
+                CalorieLog.objects.filter(user=user, date__in=list(valid)).values('id', *meals.TOTAL_FIELDS)
+            )
+
+        for day, (index, _) in valid.items():
+            results[index] = {"index": index, "date": day, "status": "updated" if day in existing else "created"}
+
+        counts = {s: sum(1 for r in results if r["status"] == s) for s in ("created", "updated", "invalid")}
+        return Response({**counts, "results": results}, status=200 if valid or not rows else 400)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        period = request.query_params.get('period', 'week')
+        if period not in rollups.PERIODS:
+            return Response({"error": f"period must be one of {', '.join(rollups.PERIODS)}."}, status=400)
+        try:
+            date_to = _date_param(request, 'to') or timezone.localdate()
+            date_from = _date_param(request, 'from') or date_to - timedelta(days=27)
+        except ValueError:
+            return Response({"error": "Dates must be YYYY-MM-DD."}, status=400)
+        if date_from > date_to:
+            return Response({"error": "'from' must not be after 'to'."}, status=400)
+        return Response(rollups.summarize(request.user, period, date_from, date_to))
+
+
+class MealEntryViewSet(viewsets.ModelViewSet):
+    """Individual meals; the day's CalorieLog totals move with every write."""
+
+    serializer_class = MealEntryDetailSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MealEntryCursorPagination
+
+    def get_queryset(self):
+        queryset = MealEntry.objects.filter(log__user=self.request.user).select_related('log')
+        day = self.request.query_params.get('date')
+        if day and self.action == 'list':
+            try:
+                day = parse_date(day)
+            except ValueError:
+                day = None
+            queryset = queryset.filter(log__date=day) if day else queryset.none()
+        return queryset
+
+    def perform_create(self, serializer):
+        data = dict(serializer.validated_data)
+        day = data.pop('log')['date']
+        serializer.instance = meals.add_entry(self.request.user, day, data)
+
+    def perform_update(self, serializer):
+        data = dict(serializer.validated_data)
+        day = data.pop('log', {}).get('date')
+        serializer.instance = meals.update_entry(serializer.instance, data, day)
+
+    def perform_destroy(self, instance):
+        meals.delete_entry(instance)
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    # The export is a plain streamed file, so don't 406 on e.g. "Accept: text/csv".
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, dataset, fmt):
+        if dataset not in export.DATASETS or fmt not in export.STREAMERS:
+            return Response({"error": "Unknown export."}, status=404)
+        streamer = export.astream if isinstance(request._request, ASGIRequest) else export.stream
+        response = StreamingHttpResponse(streamer(request.user, dataset, fmt), content_type=export.CONTENT_TYPES[fmt])
+        response["Content-Disposition"] = f'attachment; filename="{dataset}.{fmt}"'
+        return response
+
 
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
+    read_replicas = {'get'}
 
     def get(self, request):
-        serializer = RegisterSerializer(request.user)
-        return Response(serializer.data)
+        return cached_user_response(request, "profile", lambda: dict(RegisterSerializer(_profile_user(request)).data))
 
     def patch(self, request):
-        instance = request.user
-        goal = request.data.get('calorie_goal_type', None)
-        if goal:
-            instance.calorie_goal_type = goal
-            if goal == 'maintain':
-                instance.current_calorie_goal = instance.maintenance_calories
-            elif goal == 'gain':
-                instance.current_calorie_goal = instance.gain_calories
-            elif goal == 'lose':
-                instance.current_calorie_goal = instance.loss_calories
-
-        serializer = RegisterSerializer(instance, data=request.data, partial=True)
+        serializer = RegisterSerializer(_profile_user(request), data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
@@ -0,0 +1,141 @@
+"""Connection setup cost per request: new connection vs persistent vs pooled.
+
+Each request is wrapped in close_old_connections(), as Django's WSGI and
+ASGI handlers do on request_started/request_finished (the test client
+skips that), so the per-request mode really reconnects every time. Run it
+against the production-like database: on SQLite a connection is only a
+file open, while on PostgreSQL it is TCP + TLS + auth.
+
+Usage (from src/):
+    DATABASE_URL=postgres://... python -m benchmarks.db_connections --requests 500
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks._django import setup, test_database
+
+MODES = {
+    "per-request": {"CONN_MAX_AGE": 0},
+    "persistent": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True},
+    "pool": {"CONN_MAX_AGE": 0, "POOL": {"min_size": 2, "max_size": 4}},
+}
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+def pool_available(connection):
+    if connection.vendor != "postgresql":
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    return is_psycopg3
+
+
+def configure(connection, mode):
+    """Point the default connection at ``mode``'s settings, starting from a closed connection."""
+    connection.close()
+    if hasattr(connection, "close_pool"):
+        connection.close_pool()
+    options = connection.settings_dict.setdefault("OPTIONS", {})
+    options.pop("pool", None)
+    config = dict(MODES[mode])
+    if "POOL" in config:
+        options["pool"] = config.pop("POOL")
+    connection.settings_dict.update(config)
+
+
+def run(client, path, headers, n):
+    from django.db import close_old_connections, connection
+    from django.db.backends.signals import connection_created
+
+    opened = []
+    count = lambda **kwargs: opened.append(1)
+    connection_created.connect(count)
+    latencies, connects = [], []
+    try:
+        for _ in range(n):
+            close_old_connections()  # request_started
+            start = time.perf_counter()
+            was_connected = connection.connection is not None
+            connection.ensure_connection()
+            connected = time.perf_counter()
+            response = client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if not was_connected:
+                connects.append(connected - start)
+            assert response.status_code == 200, response.content
+            close_old_connections()  # request_finished
+    finally:
+        connection_created.disconnect(count)
+    latencies.sort()
+    return {
+        "mean_ms": round(sum(latencies) / n * 1000, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "connections_opened": len(opened),
+        "connect_ms": round(sum(connects) / len(connects) * 1000, 3) if connects else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--path", default="/api/calorie-logs/?fields=date,calories",
+                        help="A cheap endpoint, so connection setup is visible.")
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+
+    tmp = None
+    if connection.vendor == "sqlite":
+        # an in-memory test database ignores close(), which would hide reconnects
+        tmp = tempfile.mkdtemp()
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(tmp, "bench.sqlite3")
+
+    from django.test import Client
+
+    from api.models import CalorieLog, CustomUser
+    from api.serializers import ClaimsTokenObtainPairSerializer
+
+    results = {"vendor": connection.vendor}
+    try:
+        with test_database():
+            user = CustomUser.objects.create_user(username="bench", email="bench@example.com", password="x")
+            CalorieLog.objects.bulk_create(
+                CalorieLog(user=user, date=date(2025, 1, 1) + timedelta(days=i), calories=2000) for i in range(30)
+            )
+            headers = {"Authorization": f"Bearer {ClaimsTokenObtainPairSerializer.get_token(user).access_token}"}
+            client = Client()
+            original = {k: connection.settings_dict.get(k) for k in ("CONN_MAX_AGE", "CONN_HEALTH_CHECKS")}
+            try:
+                for mode in MODES:
+                    if mode == "pool" and not pool_available(connection):
+                        results[mode] = "skipped: needs PostgreSQL with psycopg 3"
+                        continue
+                    configure(connection, mode)
+                    run(client, args.path, headers, 20)  # warm up
+                    results[mode] = run(client, args.path, headers, args.requests)
+            finally:
+                configure(connection, "per-request")
+                connection.settings_dict.update(original)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    base = results["per-request"]["mean_ms"]
+    for mode in ("persistent", "pool"):
+        if isinstance(results[mode], dict):
+            results[mode]["saved_ms_per_request"] = round(base - results[mode]["mean_ms"], 3)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
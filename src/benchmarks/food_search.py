@@ -0,0 +1,111 @@
+"""Build the in-memory food index over synthetic names and measure query latency.
+
+Usage (from src/):
+    python -m benchmarks.food_search --items 1000000 --queries 2000
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+
+from . import _django
+
+WORDS = (
+    "apple banana bread butter cheese chicken chocolate coffee cream egg fish honey milk oat "
+    "orange pasta peanut pork potato rice salad salmon sauce soup steak sugar tomato tuna "
+    "wheat yogurt almond bean beef berry carrot corn grape lemon mango mushroom onion pepper "
+    "raw cooked baked fried grilled roasted dried frozen organic light smoked sweet"
+).split()
+SYLLABLES = "ba be bi bo bu ca ce co cu da de di do fa fe fi fo ga go ka ki ko la le li lo lu ma me mi mo mu " \
+            "na ne ni no pa pe pi po ra re ri ro sa se si so ta te ti to va ve vi wa ya za ze zo".split()
+
+
+def vocabulary(size, rng):
+    # Real catalogues have a long tail of product and brand words; common food
+    # words come first so a Zipf draw picks them most often.
+    words = list(WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def synthetic_rows(n, rng, vocabulary_size=50_000):
+    words = vocabulary(vocabulary_size, rng)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    brands = [w.capitalize() for w in rng.sample(words[len(WORDS):], min(5000, len(words) - len(WORDS)))]
+    for i in range(n):
+        name = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(2, 4))).capitalize()
+        yield i + 1, name, rng.choice(brands) if brands else ""
+
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    _django.setup()
+    from api.foods import FoodIndex
+
+    rng = random.Random(args.seed)
+    rows = list(synthetic_rows(args.items, rng, args.vocabulary))
+    start = time.perf_counter()
+    index = FoodIndex(rows)
+    build_s = time.perf_counter() - start
+
+    # Queries come from names in the catalogue: a typed prefix, a misspelled
+    # name, or a couple of its words.
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(rows)[1].lower()
+        words = name.split()
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(name[:rng.randint(3, 10)])
+        elif kind < 0.8:
+            queries.append(" ".join(typo(word, rng) for word in words))
+        else:
+            queries.append(" ".join(rng.sample(words, min(2, len(words)))))
+
+    latencies = {"prefix": [], "search": []}
+    for query in queries:
+        start = time.perf_counter()
+        index.prefix(query, 20)
+        latencies["prefix"].append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        index.search(query, 20)
+        latencies["search"].append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "items": len(index),
+        "vocabulary": args.vocabulary,
+        "build_s": round(build_s, 2),
+        "postings_mb": round((index.word_foods.nbytes + index.gram_words.nbytes) / 2**20, 1),
+        **{
+            f"{name}_ms": {f"p{p}": round(percentile(values, p), 3) for p in (50, 95, 99)}
+            for name, values in latencies.items()
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare the raw-upload and preprocessed payloads sent to the vision model.
+
+Usage (from src/):
+    python -m benchmarks.image_pipeline --width 4032 --height 3024 --uplink-mbps 20
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from api.images import prepare_image
+
+
+def synthetic_photo(width, height):
+    # Noise plus a gradient compresses roughly like a real phone photo.
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    image = Image.blend(noise, gradient, 0.5)
+    exif = Image.Exif()
+    exif[0x010F] = "BenchPhone"
+    exif[0x0112] = 1
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=95, exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def payload_size(image_bytes, mime_type):
+    url = f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode()}"
+    return len(json.dumps({"image_url": {"url": url}}))
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--max-dimension", type=int, default=1024)
+    parser.add_argument("--format", default="JPEG")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0,
+                        help="Bandwidth used to estimate upstream transfer time")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    original = synthetic_photo(args.width, args.height)
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
+        tmp.write(original)
+    try:
+        def raw():
+            with open(tmp.name, "rb") as f:
+                return f.read(), "image/jpeg"
+
+        def processed():
+            with open(tmp.name, "rb") as f:
+                return prepare_image(f, args.max_dimension, args.format, args.quality)
+
+        (raw_bytes, raw_mime), raw_cpu = timed(raw, args.repeat)
+        (small_bytes, small_mime), prep_cpu = timed(processed, args.repeat)
+    finally:
+        os.unlink(tmp.name)
+
+    bytes_per_s = args.uplink_mbps * 1_000_000 / 8
+    results = {}
+    for name, data, mime, cpu in (
+        ("raw", raw_bytes, raw_mime, raw_cpu),
+        ("preprocessed", small_bytes, small_mime, prep_cpu),
+    ):
+        size = payload_size(data, mime)
+        results[name] = {
+            "image_bytes": len(data),
+            "payload_bytes": size,
+            "prepare_ms": round(cpu * 1000, 2),
+            "est_upload_ms": round(size / bytes_per_s * 1000, 2),
+        }
+        results[name]["est_total_ms"] = round(results[name]["prepare_ms"] + results[name]["est_upload_ms"], 2)
+
+    results["payload_reduction"] = round(1 - results["preprocessed"]["payload_bytes"] / results["raw"]["payload_bytes"], 4)
+    results["latency_reduction"] = round(1 - results["preprocessed"]["est_total_ms"] / results["raw"]["est_total_ms"], 4)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
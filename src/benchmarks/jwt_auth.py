@@ -0,0 +1,71 @@
+"""Queries and latency per CalorieLogViewSet.list request for each JWT auth class.
+
+Usage (from src/):
+    python -m benchmarks.jwt_auth --requests 500
+"""
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+from benchmarks._django import setup, test_database
+
+
+def run(client, headers, n):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        for _ in range(n):
+            response = client.get("/api/calorie-logs/", headers=headers)
+            assert response.status_code == 200, response.content
+        elapsed = time.perf_counter() - start
+    return {
+        "queries_per_request": len(ctx.captured_queries) / n,
+        "mean_ms": round(elapsed / n * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--logs", type=int, default=30)
+    args = parser.parse_args()
+
+    setup()
+    from django.test import Client
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    from api.authentication import ClaimsJWTAuthentication
+    from api.models import CalorieLog, CustomUser
+    from api.serializers import ClaimsTokenObtainPairSerializer
+    from api.views import CalorieLogViewSet
+
+    with test_database():
+        user = CustomUser.objects.create_user(username="bench", email="bench@example.com", password="x",
+                                              current_calorie_goal=2200)
+        CalorieLog.objects.bulk_create(
+            CalorieLog(user=user, date=date(2025, 1, 1) + timedelta(days=i), calories=2000) for i in range(args.logs)
+        )
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        headers = {"Authorization": f"Bearer {token}"}
+        client = Client()
+
+        results = {}
+        original = CalorieLogViewSet.authentication_classes
+        try:
+            for auth_class in (JWTAuthentication, ClaimsJWTAuthentication):
+                CalorieLogViewSet.authentication_classes = [auth_class]
+                run(client, headers, 20)  # warm up
+                results[auth_class.__name__] = run(client, headers, args.requests)
+        finally:
+            CalorieLogViewSet.authentication_classes = original
+
+    base, fast = results["JWTAuthentication"], results["ClaimsJWTAuthentication"]
+    results["queries_saved_per_request"] = base["queries_per_request"] - fast["queries_per_request"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
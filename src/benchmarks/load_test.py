@@ -0,0 +1,348 @@
+"""Load test the API endpoints: throughput, p50/p95/p99 latency and queries per request.
+
+In-process (default): seeds a throwaway test database with
+``manage.py seed_load_data``, points the app at benchmarks.together_stub and
+drives it sequentially with Django's test client, capturing the SQL of
+every request.
+
+Against a running server (--base-url): --concurrency threads send real HTTP
+requests as the users seeded there by seed_load_data. Queries per request
+come from the server's /metrics when --metrics-token is given (set
+METRICS_DIR on the server so every worker is counted). Run the server with
+TOGETHER_API_URL pointing at benchmarks.together_stub and AI rate limits
+raised, or the ai/analyze-meal rows will mostly measure 429s.
+
+Results are printed as JSON and saved with --output. --compare flags
+endpoints whose p95, p99 or queries per request grew, or whose throughput
+fell, by more than --threshold, and exits with status 1.
+
+Usage (from src/):
+    python -m benchmarks.load_test --requests 200 --output before.json
+    python -m benchmarks.load_test --requests 200 --compare before.json
+    python manage.py seed_load_data --users 100 --premium
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000 --concurrency 16 --metrics-token $METRICS_TOKEN
+"""
+import argparse
+import io
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from PIL import Image
+
+from benchmarks._django import setup, test_database
+from benchmarks.together_stub import StubServer
+
+ENDPOINTS = ["register", "token", "profile", "calorie-logs", "ai", "chat-history", "analyze-meal"]
+
+ROUTES = {
+    "register": "api/register/",
+    "token": "api/token/obtain/",
+    "profile": "api/profile/",
+    "calorie-logs": "api/calorie-logs/",
+    "ai": "api/ai/",
+    "chat-history": "api/ai/chat-history/",
+    "analyze-meal": "api/analyze-meal/",
+}
+
+# (field, direction): +1 means larger is worse
+COMPARED = [("p95_ms", 1), ("p99_ms", 1), ("queries_per_request", 1), ("throughput_rps", -1)]
+
+
+def meal_photo(i):
+    buf = io.BytesIO()
+    Image.new("RGB", (320, 240), ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def build_request(endpoint, i, users, run_id):
+    """The i-th request for ``endpoint``: (method, path, user index or None, json body, image bytes)."""
+    user = i % len(users)
+    if endpoint == "register":
+        body = {
+            "email": f"bench-{run_id}-{i}@example.com", "username": f"bench-{run_id}-{i}",
+            "password": "Bench-pass-123", "first_name": "Bench", "last_name": "User",
+            "age": 30, "gender": "female", "height_cm": 170, "weight_kg": 65,
+            "activity_level": "moderate", "calorie_goal_type": "maintain",
+        }
+        return "POST", "/api/register/", None, body, None
+    if endpoint == "token":
+        return "POST", "/api/token/obtain/", None, {"email": users[user]["email"], "password": users[user]["password"]}, None
+    if endpoint == "profile":
+        return "GET", "/api/profile/", user, None, None
+    if endpoint == "calorie-logs":
+        return "GET", "/api/calorie-logs/", user, None, None
+    if endpoint == "ai":
+        sessions = users[user]["sessions"]
+        body = {"message": f"Load test question {run_id}-{i}: what should I eat before training?"}
+        if sessions:
+            body["session_id"] = sessions[i // len(users) % len(sessions)]
+        return "POST", "/api/ai/", user, body, None
+    if endpoint == "chat-history":
+        return "GET", "/api/ai/chat-history/", user, None, None
+    if endpoint == "analyze-meal":
+        return "POST", "/api/analyze-meal/", user, None, meal_photo(i)
+    raise ValueError(endpoint)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, elapsed, queries):
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": {str(code): n for code, n in sorted(statuses.items()) if code >= 400},
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else None,
+        "queries_per_request": round(queries, 2) if queries is not None else None,
+    }
+
+
+class InProcessTarget:
+    """Django's test client against the current (test) database, one request at a time."""
+
+    concurrency = 1
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client()
+
+    def users(self, count, prefix, password):
+        from api.models import ChatSession, CustomUser
+        from api.serializers import ClaimsTokenObtainPairSerializer
+
+        users = []
+        for user in CustomUser.objects.filter(email__startswith=f"{prefix}-").order_by("id")[:count]:
+            token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+            sessions = list(ChatSession.objects.filter(user=user).values_list("id", flat=True))
+            users.append({"email": user.email, "password": password, "token": str(token), "sessions": sessions})
+        return users
+
+    def send(self, method, path, token, body, image):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            if image is not None:
+                response = self.client.post(path, {"image": SimpleUploadedFile("meal.jpg", image, "image/jpeg")},
+                                            headers=headers)
+            elif method == "GET":
+                response = self.client.get(path, headers=headers)
+            else:
+                response = self.client.post(path, json.dumps(body), content_type="application/json", headers=headers)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(ctx.captured_queries)
+
+    def query_totals(self):
+        return None
+
+
+class HttpTarget:
+    """Real HTTP against a running server, one requests.Session per thread."""
+
+    def __init__(self, base_url, concurrency, metrics_token=None, metrics_settle=0):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.metrics_token = metrics_token
+        self.metrics_settle = metrics_settle
+        self.local = threading.local()
+
+    def session(self):
+        import requests
+
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def users(self, count, prefix, password):
+        users = []
+        for i in range(count):
+            email = f"{prefix}-{i}@example.com"
+            res = self.session().post(f"{self.base_url}/api/token/obtain/", json={"email": email, "password": password})
+            if res.status_code != 200:
+                break
+            token = res.json()["access"]
+            history = self.session().get(f"{self.base_url}/api/ai/chat-history/",
+                                         headers={"Authorization": f"Bearer {token}"}).json()
+            sessions = [s["id"] for s in history.get("results", [])]
+            users.append({"email": email, "password": password, "token": token, "sessions": sessions})
+        if not users:
+            sys.exit(f"No seeded users found; run `manage.py seed_load_data --prefix {prefix}` on the server.")
+        return users
+
+    def send(self, method, path, token, body, image):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        files = {"image": ("meal.jpg", image, "image/jpeg")} if image is not None else None
+        start = time.perf_counter()
+        res = self.session().request(method, self.base_url + path, json=body, files=files, headers=headers)
+        return res.status_code, time.perf_counter() - start, None
+
+    def query_totals(self):
+        """{route: (queries, requests)} summed from the server's http_request_db_queries histogram."""
+        if not self.metrics_token:
+            return None
+        time.sleep(self.metrics_settle)  # let workers flush their totals to METRICS_DIR
+        res = self.session().get(f"{self.base_url}/metrics", headers={"Authorization": f"Bearer {self.metrics_token}"})
+        res.raise_for_status()
+        totals = {}
+        for kind, route, value in re.findall(r'^http_request_db_queries_(sum|count)\{route="([^"]*)"\} (\S+)$',
+                                             res.text, re.M):
+            queries, requests = totals.get(route, (0.0, 0.0))
+            totals[route] = (queries + float(value), requests) if kind == "sum" else (queries, requests + float(value))
+        return totals
+
+
+def run_endpoint(target, endpoint, users, n, run_id):
+    latencies, statuses, queries = [], Counter(), []
+    specs = [build_request(endpoint, i, users, run_id) for i in range(n)]
+
+    def send(spec):
+        method, path, user, body, image = spec
+        token = users[user]["token"] if user is not None else None
+        return target.send(method, path, token, body, image)
+
+    before = target.query_totals()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=target.concurrency) as pool:
+        for code, elapsed, count in pool.map(send, specs):
+            statuses[code] += 1
+            latencies.append(elapsed)
+            if count is not None:
+                queries.append(count)
+    wall = time.perf_counter() - start
+
+    per_request = sum(queries) / len(queries) if queries else None
+    after = target.query_totals()
+    if before is not None and after is not None:
+        route = ROUTES[endpoint]
+        q0, r0 = before.get(route, (0, 0))
+        q1, r1 = after.get(route, (0, 0))
+        per_request = (q1 - q0) / (r1 - r0) if r1 > r0 else None
+    return summarize(latencies, statuses, wall, per_request)
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for endpoint, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        for field, direction in COMPARED:
+            old, new = previous.get(field), current.get(field)
+            if old is None or new is None:
+                continue
+            if direction > 0:
+                worse = new > old * (1 + threshold) and new - old > (0.5 if field == "queries_per_request" else 1)
+            else:
+                worse = new < old * (1 - threshold)
+            if worse:
+                regressions.append({"endpoint": endpoint, "metric": field, "baseline": old, "current": new})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(target, args):
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    users = target.users(args.users, args.prefix, args.password)
+    endpoints = {}
+    for endpoint in args.endpoints:
+        # a few unmeasured requests first, so lazily built state (caches, pools) is warm
+        run_endpoint(target, endpoint, users, args.warmup, f"{run_id}w")
+        endpoints[endpoint] = run_endpoint(target, endpoint, users, args.requests, run_id)
+        print(f"{endpoint:>13}: {json.dumps(endpoints[endpoint])}", file=sys.stderr)
+    return endpoints
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint.")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90, help="In-process: days of history per seeded user.")
+    parser.add_argument("--sessions", type=int, default=5, help="In-process: chat sessions per seeded user.")
+    parser.add_argument("--messages", type=int, default=20, help="In-process: messages per chat session.")
+    parser.add_argument("--prefix", default="loadtest")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="In-process: Together stub latency.")
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--base-url", help="Load a running server instead of an in-process test database.")
+    parser.add_argument("--concurrency", type=int, default=8, help="With --base-url: concurrent clients.")
+    parser.add_argument("--metrics-token", help="With --base-url: read queries per request from /metrics.")
+    parser.add_argument("--metrics-settle", type=float, default=6,
+                        help="Seconds to wait for workers to flush metrics before each /metrics read.")
+    parser.add_argument("--output", help="Save the results JSON here.")
+    parser.add_argument("--compare", help="Baseline results JSON to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "mode": "http" if args.base_url else "in-process",
+            "args": {k: v for k, v in vars(args).items() if k not in ("password", "metrics_token", "output", "compare")},
+        },
+    }
+
+    if args.base_url:
+        target = HttpTarget(args.base_url, args.concurrency, args.metrics_token, args.metrics_settle)
+        results["endpoints"] = run(target, args)
+    else:
+        setup()
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        high = {"free": 10 ** 9, "premium": 10 ** 9}
+        with test_database(), StubServer(latency=args.llm_latency_ms, jitter=args.llm_jitter_ms) as stub, \
+                override_settings(TOGETHER_API_URL=stub.url, AI_RATE_LIMITS={k: f"{v}/s" for k, v in high.items()},
+                                  AI_RATE_BURST=high, AI_DAILY_TOKEN_BUDGET=high):
+            call_command("seed_load_data", users=args.users, days=args.days, sessions=args.sessions,
+                         messages=args.messages, prefix=args.prefix, password=args.password, stdout=io.StringIO())
+            results["endpoints"] = run(InProcessTarget(), args)
+            results["meta"]["llm_stub_requests"] = stub.requests
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        results["regressions"] = compare(results, baseline, args.threshold)
+        results["meta"]["baseline"] = baseline.get("meta", {}).get("git_commit")
+        status = 1 if results["regressions"] else 0
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Per-user compute_targets loop vs the NumPy batch engine.
+
+Usage (from src/):
+    python -m benchmarks.nutrition_engine --users 1000000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from api import nutrition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n = args.users
+    age = rng.integers(18, 80, n)
+    is_male = rng.random(n) < 0.5
+    height = rng.uniform(150, 200, n)
+    weight = rng.uniform(45, 140, n)
+    levels = list(nutrition.ACTIVITY_MULTIPLIERS)
+    level = rng.integers(0, len(levels), n)
+    multiplier = np.array([nutrition.ACTIVITY_MULTIPLIERS[name] for name in levels])[level]
+
+    rows = list(zip(age.tolist(), np.where(is_male, "male", "female").tolist(), height.tolist(),
+                    weight.tolist(), [levels[i] for i in level]))
+    start = time.perf_counter()
+    scalar = [nutrition.compute_targets(*row) for row in rows]
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = nutrition.batch_targets(age, is_male, height, weight, multiplier)
+    batch_s = time.perf_counter() - start
+
+    max_diff = max(
+        float(np.max(np.abs(batch[field] - np.array([t[field] for t in scalar]))))
+        for field in nutrition.TARGET_FIELDS
+    )
+    print(json.dumps({
+        "users": n,
+        "scalar_s": round(scalar_s, 3),
+        "batch_s": round(batch_s, 3),
+        "speedup": round(scalar_s / batch_s, 1),
+        "max_abs_diff": max_diff,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
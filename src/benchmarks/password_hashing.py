@@ -0,0 +1,91 @@
+"""Login throughput per core for each password hasher setting.
+
+Each variant logs the same user in through /api/token/obtain/ and reports
+logins per CPU-second, which is what one core sustains since a single hash
+does not parallelise (p=1). process_time() covers the password-hash pool's
+threads too. Also reports a login's wall-clock latency and one rehash from
+PBKDF2, the cost a user pays once when their hash is upgraded.
+
+Usage (from src/):
+    python -m benchmarks.password_hashing --logins 50
+"""
+import argparse
+import json
+import time
+
+from benchmarks._django import setup, test_database
+
+HASHERS = {
+    "argon2": "api.hashers.Argon2PasswordHasher",
+    "scrypt": "api.hashers.ScryptPasswordHasher",
+    "pbkdf2": "api.hashers.PBKDF2PasswordHasher",
+}
+
+VARIANTS = {
+    "pbkdf2 (Django default, 1M iterations)": {"hasher": "pbkdf2"},
+    "argon2id m=19MiB t=2 p=1 (default)": {"hasher": "argon2"},
+    "argon2id m=46MiB t=1 p=1": {"hasher": "argon2", "ARGON2_MEMORY_COST": 47104, "ARGON2_TIME_COST": 1},
+    "argon2id m=64MiB t=3 p=1": {"hasher": "argon2", "ARGON2_MEMORY_COST": 65536, "ARGON2_TIME_COST": 3},
+    "scrypt N=2^14 r=8 p=1": {"hasher": "scrypt"},
+    "scrypt N=2^16 r=8 p=1": {"hasher": "scrypt", "SCRYPT_WORK_FACTOR": 2 ** 16},
+}
+
+PASSWORD = "bench-password-123"
+
+
+def overrides(variant):
+    config = dict(variant)
+    preferred = HASHERS[config.pop("hasher")]
+    return {"PASSWORD_HASHERS": [preferred, *(path for path in HASHERS.values() if path != preferred)], **config}
+
+
+def run(client, user, n):
+    wall, start_cpu = [], time.process_time()
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.post("/api/token/obtain/", {"email": user.email, "password": PASSWORD})
+        wall.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+    cpu = time.process_time() - start_cpu
+    wall.sort()
+    return {
+        "logins_per_core_second": round(n / cpu, 1),
+        "cpu_ms_per_login": round(cpu / n * 1000, 2),
+        "p50_ms": round(wall[len(wall) // 2] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.hashers import make_password
+    from django.test import Client, override_settings
+
+    from api.models import CustomUser
+
+    results = {}
+    with test_database():
+        user = CustomUser.objects.create_user(username="bench", email="bench@example.com", password=PASSWORD)
+        client = Client()
+        for name, variant in VARIANTS.items():
+            with override_settings(**overrides(variant)):
+                # start each variant from a PBKDF2 hash to time the upgrade on first login
+                user.password = make_password(PASSWORD, hasher="pbkdf2_sha256")
+                user.save(update_fields=["password"])
+                start = time.perf_counter()
+                client.post("/api/token/obtain/", {"email": user.email, "password": PASSWORD})
+                upgrade = time.perf_counter() - start
+                user.refresh_from_db()
+                results[name] = {
+                    **run(client, user, args.logins),
+                    "first_login_with_upgrade_ms": round(upgrade * 1000, 2),
+                    "rehashed_to": user.password.split("$", 1)[0],
+                }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
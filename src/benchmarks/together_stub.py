@@ -0,0 +1,111 @@
+"""Local stand-in for the Together chat completions API with configurable latency.
+
+Answers both plain and streamed (``"stream": true``) completions with a
+canned reply and a ``usage`` block, after sleeping --latency-ms plus up to
+--jitter-ms. --error-rate answers that share of requests with a 503.
+
+Usage (from src/):
+    python -m benchmarks.together_stub --port 8765 --latency-ms 400
+    TOGETHER_API_URL=http://127.0.0.1:8765/v1/chat/completions python manage.py runserver
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Aim for about 1.6 g of protein per kg of body weight, spread over three or four meals. "
+         "Calories: 520, protein: 32 g, fat: 18 g, carbs: 55 g.")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        server.count()
+        time.sleep((server.latency + random.uniform(0, server.jitter)) / 1000)
+
+        if random.random() < server.error_rate:
+            self._send(503, b'{"error": "overloaded"}', "application/json")
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        words = REPLY.split(" ")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words)}
+        if not body.get("stream"):
+            response = {
+                "model": body.get("model"),
+                "choices": [{"message": {"role": "assistant", "content": REPLY}}],
+                "usage": usage,
+            }
+            self._send(200, json.dumps(response).encode(), "application/json")
+            return
+
+        chunks = [{"choices": [{"delta": {"content": word + " "}}]} for word in words]
+        chunks.append({"choices": [], "usage": usage})
+        payload = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+        self._send(200, payload.encode(), "text/event-stream")
+
+    def _send(self, status, payload, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0, jitter=0, error_rate=0.0):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/v1/chat/completions"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubServer(args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"Together stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
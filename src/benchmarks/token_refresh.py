@@ -0,0 +1,84 @@
+"""Refresh throughput through /api/token/refresh/, with and without rotation.
+
+"rotation" chains each refresh off the previous one, as clients do, paying
+for one blacklist write per refresh plus the successor kept for retries. "replayed" keeps presenting a reused
+token from a revoked family, answered from the in-process blacklist; the
+"replayed (shared cache only)" variant clears that layer first, as a worker
+that has not yet seen the revocation would. Uses the cache CACHE_URL
+configures, so run with the production backend to include its round trips.
+
+Usage (from src/):
+    python -m benchmarks.token_refresh --refreshes 2000
+"""
+import argparse
+import json
+import time
+from unittest import mock
+
+from benchmarks._django import setup, test_database
+
+
+def run(client, n, next_token, expected_status=200):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    refresh = next_token(None)
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        for _ in range(n):
+            response = client.post("/api/token/refresh/", {"refresh": refresh})
+            assert response.status_code == expected_status, response.content
+            refresh = next_token(response.json())
+        elapsed = time.perf_counter() - start
+    return {
+        "refreshes_per_second": round(n / elapsed, 1),
+        "mean_ms": round(elapsed / n * 1000, 3),
+        "queries_per_refresh": len(ctx.captured_queries) / n,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--refreshes", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup()
+    from django.test import Client, override_settings
+    from rest_framework_simplejwt.settings import api_settings
+
+    from api import tokens
+    from api.models import CustomUser
+    from api.serializers import ClaimsTokenObtainPairSerializer
+
+    def login():
+        return tokens.issue(ClaimsTokenObtainPairSerializer.get_token(user), "web")["refresh"]
+
+    results = {}
+    with test_database():
+        user = CustomUser.objects.create_user(username="bench", email="bench@example.com", password="x")
+        client = Client()
+
+        with mock.patch.object(api_settings, "ROTATE_REFRESH_TOKENS", False):
+            token = login()
+            results["no rotation"] = run(client, args.refreshes, lambda data: token)
+
+        results["rotation"] = run(client, args.refreshes,
+                                  lambda data: data["refresh"] if data else login())
+
+        with override_settings(JWT_REFRESH_REUSE_GRACE_SECONDS=0):
+            reused = login()
+            client.post("/api/token/refresh/", {"refresh": reused})
+            client.post("/api/token/refresh/", {"refresh": reused})  # revokes the family
+        results["replayed"] = run(client, args.refreshes, lambda data: reused, expected_status=401)
+
+        def cold(data):
+            tokens.get_blacklist().clear()
+            return reused
+
+        results["replayed (shared cache only)"] = run(client, args.refreshes, cold, expected_status=401)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,27 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import logging
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+logger = logging.getLogger(__name__)
+
+
+def disable_persistent_connections(databases):
+    """Persistent connections leak under ASGI (see DB_CONN_MAX_AGE); pooled ones are fine."""
+    for alias, db in databases.items():
+        if db.get('CONN_MAX_AGE', 0) != 0:
+            logger.warning("Ignoring CONN_MAX_AGE=%s for %r under ASGI; set DB_POOL to reuse connections.",
+                           db['CONN_MAX_AGE'], alias)
+            db['CONN_MAX_AGE'] = 0
+
+
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+disable_persistent_connections(settings.DATABASES)
@@ -46,12 +46,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,8 +85,78 @@ from dotenv import load_dotenv
 import dj_database_url
 import os
 load_dotenv()
+
+# Connection reuse. DB_CONN_MAX_AGE keeps a worker thread's connection open
+# between requests, health-checked before reuse. ASGI serves each request in
+# a fresh context where such a connection is never picked up again and leaks,
+# so core/asgi.py turns it off; use DB_POOL there instead: Django's native
+# pool, which needs PostgreSQL and psycopg 3 (pip install "psycopg[binary,pool]").
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "0"))
+DB_CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower() in ("1", "true", "yes")
+DB_POOL = os.getenv("DB_POOL", "false").lower() in ("1", "true", "yes")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
 DATABASES = {
-    'default': dj_database_url.config(default=os.environ.get('DATABASE_URL'))
+    'default': dj_database_url.config(
+        default=os.environ.get('DATABASE_URL'),
+        conn_max_age=0 if DB_POOL else DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+    )
+}
+if DB_POOL:
+    if 'postgresql' not in DATABASES['default'].get('ENGINE', ''):
+        from django.core.exceptions import ImproperlyConfigured
+        raise ImproperlyConfigured("DB_POOL requires a PostgreSQL DATABASE_URL.")
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': DB_POOL_TIMEOUT,
+    }
+
+# Read replicas (api/replicas.py): comma-separated database URLs, added as
+# replica1, replica2, ... Views opting in read from one of them unless the user
+# wrote within REPLICA_PIN_SECONDS. Pins live in REPLICA_PIN_CACHE_ALIAS, which
+# must be shared between workers (see CACHES below and api/checks.py).
+DATABASE_REPLICAS = []
+for i, url in enumerate(u for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()):
+    alias = f'replica{i + 1}'
+    DATABASES[alias] = dj_database_url.parse(
+        url.strip(),
+        conn_max_age=DATABASES['default']['CONN_MAX_AGE'],
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+    )
+    if 'pool' in DATABASES['default'].get('OPTIONS', {}):
+        DATABASES[alias].setdefault('OPTIONS', {})['pool'] = dict(DATABASES['default']['OPTIONS']['pool'])
+    # tests run against the primary's test database
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "10"))
+REPLICA_PIN_CACHE_ALIAS = os.getenv("REPLICA_PIN_CACHE_ALIAS", "default")
+
+# Caches. Refresh-token revocations and other cross-request state must be seen
+# by every worker process, so the default cache lives in the database
+# (python manage.py createcachetable) unless CACHE_URL points at Redis
+# (redis://..., needs pip install redis). locmem:// is per process and only
+# fit for local development; api/checks.py rejects it outside DEBUG.
+CACHE_URL = os.getenv("CACHE_URL", "db://django_cache")
+_cache_scheme, _, _cache_location = CACHE_URL.partition("://")
+_CACHE_BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+}
+if _cache_scheme not in _CACHE_BACKENDS:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f"CACHE_URL must start with one of {', '.join(s + '://' for s in _CACHE_BACKENDS)}.")
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[_cache_scheme],
+        'LOCATION': CACHE_URL if _cache_scheme.startswith('redis') else _cache_location,
+    },
 }
 
 
@@ -109,6 +181,35 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# PASSWORD_HASHER picks the algorithm for new hashes: argon2 (default), scrypt
+# or pbkdf2. The others stay listed so existing hashes still verify; Django
+# rehashes them with the preferred algorithm and parameters on the next login.
+# Defaults follow OWASP's minimums (Argon2id m=19 MiB, t=2, p=1; scrypt
+# N=2^14, r=8, p=1); raise them if the login benchmark leaves headroom.
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "argon2")
+_PASSWORD_HASHERS = {
+    'argon2': 'api.hashers.Argon2PasswordHasher',
+    'scrypt': 'api.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+}
+if PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f"PASSWORD_HASHER must be one of {', '.join(_PASSWORD_HASHERS)}.")
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHER],
+    *(path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER),
+]
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+SCRYPT_WORK_FACTOR = int(os.getenv("SCRYPT_WORK_FACTOR", str(2 ** 14)))
+SCRYPT_BLOCK_SIZE = int(os.getenv("SCRYPT_BLOCK_SIZE", "8"))
+SCRYPT_PARALLELISM = int(os.getenv("SCRYPT_PARALLELISM", "1"))
+# Hashes run in a pool of this many threads per process, so concurrent logins
+# queue rather than oversubscribing the CPU.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
 
 
 
@@ -151,20 +252,45 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # https://django-rest-framework-simplejwt.readthedocs.io/en/latest/settings.html
 from datetime import timedelta
 
+# Access/refresh lifetimes per client type, chosen with the "client" field of
+# /api/token/obtain/. Mobile apps get longer access tokens so they refresh less
+# often. Refresh tokens rotate on use and a reused one revokes its whole
+# family (api/tokens.py); revocations are kept until the token would have
+# expired in TOKEN_BLACKLIST_CACHE_ALIAS, which must be shared between workers
+# (see CACHES). Within JWT_REFRESH_REUSE_GRACE_SECONDS of a rotation, reusing
+# the old token returns the same new pair instead (0 disables this).
+JWT_LIFETIMES = {
+    'web': (
+        timedelta(minutes=int(os.getenv("JWT_ACCESS_TOKEN_MINUTES", "5"))),
+        timedelta(days=float(os.getenv("JWT_REFRESH_TOKEN_DAYS", "1"))),
+    ),
+    'mobile': (
+        timedelta(minutes=int(os.getenv("JWT_MOBILE_ACCESS_TOKEN_MINUTES", "30"))),
+        timedelta(days=float(os.getenv("JWT_MOBILE_REFRESH_TOKEN_DAYS", "30"))),
+    ),
+}
+JWT_ROTATE_REFRESH_TOKENS = os.getenv("JWT_ROTATE_REFRESH_TOKENS", "true").lower() in ("1", "true", "yes")
+TOKEN_BLACKLIST_CACHE_ALIAS = os.getenv("TOKEN_BLACKLIST_CACHE_ALIAS", "default")
+TOKEN_BLACKLIST_LOCAL_ENTRIES = int(os.getenv("TOKEN_BLACKLIST_LOCAL_ENTRIES", "10000"))
+JWT_REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("JWT_REFRESH_REUSE_GRACE_SECONDS", "30"))
+
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'ACCESS_TOKEN_LIFETIME': JWT_LIFETIMES['web'][0],
+    'REFRESH_TOKEN_LIFETIME': JWT_LIFETIMES['web'][1],
+    'ROTATE_REFRESH_TOKENS': JWT_ROTATE_REFRESH_TOKENS,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.ClaimsTokenRefreshSerializer',
 }
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
-    'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
+    'EXCEPTION_HANDLER': 'api.exceptions.exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ),
 }
 
@@ -176,3 +302,96 @@ load_dotenv()
 
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 SPOONACULAR_API_KEY = os.getenv("SPOONACULAR_API_KEY")
+
+TOGETHER_API_URL = os.getenv("TOGETHER_API_URL", "https://api.together.xyz/v1/chat/completions")
+TOGETHER_MODEL = os.getenv("TOGETHER_MODEL", "meta-llama/Llama-Vision-Free")
+
+# Shared pooled HTTP client used for LLM calls (api/llm.py)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# Retries with jittered backoff on 429/5xx and timeouts, a per-model circuit
+# breaker, and models to fall back to, in order (api/llm.py)
+TOGETHER_FALLBACK_MODELS = [m.strip() for m in os.getenv("TOGETHER_FALLBACK_MODELS", "").split(",") if m.strip()]
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_MAX_BACKOFF = float(os.getenv("LLM_RETRY_MAX_BACKOFF", "8"))
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+# Chat context window (api/chat.py)
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+CHAT_SUMMARY_MIN_MESSAGES = int(os.getenv("CHAT_SUMMARY_MIN_MESSAGES", "10"))
+CHAT_SUMMARY_MAX_MESSAGES = int(os.getenv("CHAT_SUMMARY_MAX_MESSAGES", "40"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "256"))
+
+# Meal image analysis result cache (api/cache.py): "locmem" or "django"
+MEAL_CACHE_BACKEND = os.getenv("MEAL_CACHE_BACKEND", "locmem")
+MEAL_CACHE_ALIAS = os.getenv("MEAL_CACHE_ALIAS", "default")
+MEAL_CACHE_TTL = int(os.getenv("MEAL_CACHE_TTL", str(60 * 60 * 24)))
+MEAL_CACHE_MAX_ENTRIES = int(os.getenv("MEAL_CACHE_MAX_ENTRIES", "1024"))
+
+# Meal photos are downscaled and re-encoded before upload (api/images.py)
+MEAL_IMAGE_MAX_DIMENSION = int(os.getenv("MEAL_IMAGE_MAX_DIMENSION", "1024"))
+MEAL_IMAGE_FORMAT = os.getenv("MEAL_IMAGE_FORMAT", "JPEG")
+MEAL_IMAGE_QUALITY = int(os.getenv("MEAL_IMAGE_QUALITY", "80"))
+
+# A logged day counts as "on goal" within this fraction of the calorie goal (api/rollups.py)
+ROLLUP_GOAL_TOLERANCE = float(os.getenv("ROLLUP_GOAL_TOLERANCE", "0.1"))
+
+CALORIE_LOG_BULK_MAX_ROWS = int(os.getenv("CALORIE_LOG_BULK_MAX_ROWS", "5000"))
+
+# Per-user cache for the profile/calorie-goal read endpoints (api/cache.py).
+# Invalidation must reach every worker, so the alias must be shared (see CACHES).
+# A database cache would cost more queries than it saves, so on one the
+# responses are not stored and only get body-hash ETags.
+PROFILE_CACHE_ALIAS = os.getenv("PROFILE_CACHE_ALIAS", "default")
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+# DB-backed AI job queue (api/jobs.py, manage.py run_ai_worker)
+AI_WORKER_CONCURRENCY = int(os.getenv("AI_WORKER_CONCURRENCY", "4"))
+AI_WORKER_POLL_INTERVAL = float(os.getenv("AI_WORKER_POLL_INTERVAL", "1"))
+AI_JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+AI_JOB_BACKOFF_SECONDS = float(os.getenv("AI_JOB_BACKOFF_SECONDS", "2"))
+AI_JOB_STALE_SECONDS = int(os.getenv("AI_JOB_STALE_SECONDS", "300"))
+# finished jobs (and their results) are deleted after this long
+AI_JOB_RETENTION_SECONDS = int(os.getenv("AI_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Single-flight for identical AI requests (api/singleflight.py)
+# WINDOW: how long a finished reply is replayed to retries carrying the same Idempotency-Key
+AI_SINGLE_FLIGHT_WINDOW = int(os.getenv("AI_SINGLE_FLIGHT_WINDOW", "30"))
+AI_SINGLE_FLIGHT_TIMEOUT = int(os.getenv("AI_SINGLE_FLIGHT_TIMEOUT", "120"))
+AI_SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("AI_SINGLE_FLIGHT_POLL_INTERVAL", "0.2"))
+
+# Food catalogue search (api/foods.py): "memory" keeps a trigram index per
+# process, rebuilt in the background when the catalogue version row changes;
+# "postgres" queries pg_trgm.
+FOOD_SEARCH_BACKEND = os.getenv("FOOD_SEARCH_BACKEND", "memory")
+FOOD_SEARCH_LIMIT = int(os.getenv("FOOD_SEARCH_LIMIT", "20"))
+FOOD_SEARCH_MIN_SIMILARITY = float(os.getenv("FOOD_SEARCH_MIN_SIMILARITY", "0.3"))
+
+# Per-user AI rate limits and daily token budgets by tier (api/throttling.py, api/usage.py).
+# Rates refill a token bucket of AI_RATE_BURST requests, kept in the database so
+# every worker shares it; meal photos cost AI_IMAGE_REQUEST_COST.
+AI_RATE_LIMITS = {
+    'free': os.getenv("AI_RATE_LIMIT_FREE", "30/hour"),
+    'premium': os.getenv("AI_RATE_LIMIT_PREMIUM", "300/hour"),
+}
+AI_RATE_BURST = {
+    'free': int(os.getenv("AI_RATE_BURST_FREE", "5")),
+    'premium': int(os.getenv("AI_RATE_BURST_PREMIUM", "20")),
+}
+AI_DAILY_TOKEN_BUDGET = {
+    'free': int(os.getenv("AI_DAILY_TOKEN_BUDGET_FREE", "50000")),
+    'premium': int(os.getenv("AI_DAILY_TOKEN_BUDGET_PREMIUM", "1000000")),
+}
+AI_IMAGE_REQUEST_COST = int(os.getenv("AI_IMAGE_REQUEST_COST", "2"))
+
+# Request and upstream metrics served at /metrics (api/metrics.py). Workers
+# share totals through per-process files in METRICS_DIR (e.g. a tmpfs path,
+# emptied on deploy); /metrics is disabled until METRICS_TOKEN is set.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")